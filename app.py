@@ -7,13 +7,28 @@
 # Questo script inizializza l'applicazione, indicando il titolo da visualizzare nel tab del browser, il tema grafico e 
 # il set di icone da utilizzare. Registra tutte le callback che gestiranno eventi ed interazioni tra utente e widget e,
 # nel caso, avvia il server di sviluppo in modalità debug per controllo a runtime di eventuali errori
+# Con la variabile d'ambiente SIMULAGRO_FAST_START=1 l'app si avvia senza calcolare i dati iniziali: tabelle e grafici
+# vengono popolati dalle callback al primo caricamento della pagina. In produzione il server WSGI (app.server) viene
+# avviato con gunicorn (vedi gunicorn.conf.py), che prepara l'app nel processo principale con warm_up prima di creare
+# i worker, in modo che questi la ereditino già pronta
 
 # Importazione delle librerie necessarie
-import os # modulo per interagire col sistema operativo
+import time # per misurare i tempi di avvio
+startup_start = time.perf_counter()
+import os, sys # moduli per interagire col sistema operativo
 from dash import Dash # framework Dash per creare app interattive
 import dash_bootstrap_components as dbc # modulo per impostare tema grafico e icone
 from interface.layout import create_layout # modulo che definisce layout della dashboard
 from interface import callbacks # modulo delle callbacks
+from interface import routes # modulo degli endpoint HTTP (esportazioni in streaming)
+from data_tools import metrics # per registrare i tempi di avvio
+from data_tools.snapshot import initial_snapshot # istantanea dei dati iniziali condivisa tra i worker
+from data_tools.surface import get_surface # superficie di risposta degli slider ambientali
+
+# Avvio rapido (dati iniziali calcolati al primo caricamento della pagina)
+fast_start = os.environ.get('SIMULAGRO_FAST_START') == '1'
+startup_imported = time.perf_counter()
+metrics.record_time('startup.imports', startup_imported - startup_start)
 
 # Creazione dell'applicazione Dash
 # Viene specificato un titolo che verrà visualizzato nella scheda del browser
@@ -23,11 +38,36 @@ app = Dash(__name__,
            external_stylesheets=[dbc.themes.SANDSTONE, dbc.icons.FONT_AWESOME],
            external_scripts=[os.path.join(os.getcwd(), "assets", "plotly-locale-it.js")])
 
+# Server WSGI dell'app (per gunicorn: gunicorn app:server)
+server = app.server
+
 # Imposta il layout dell'app richiamando la funzione specifica dal modulo "layouts.layout"
-app.layout = create_layout(app)
+with metrics.timer('startup.layout'):
+    app.layout = create_layout(app, fast_start)
 
 # Registra le callback che gestiscono l'interazione tra i componenti dell'interfaccia e dati
-callbacks.register_callbacks(app)
+with metrics.timer('startup.callbacks'):
+    callbacks.register_callbacks(app, fast_start)
+
+# Registra gli endpoint HTTP del server (esportazioni dei dati in streaming)
+routes.register_routes(app)
+metrics.record_time('startup.total', time.perf_counter() - startup_start)
+print(f"Simul-Agro pronta in {time.perf_counter() - startup_start:.2f} s (importazioni "
+      f"{startup_imported - startup_start:.2f} s{', avvio rapido' if fast_start else ''})", file=sys.stderr)
+
+# Funzione che prepara l'app prima di servire le richieste: pubblica l'istantanea dei dati iniziali (a cui i worker si
+# collegano senza ricalcolarla), costruisce la superficie di risposta degli slider ambientali, calcola i dati iniziali
+# del layout e importa i moduli caricati al primo utilizzo (esportazioni, plotly.express). E' richiamata da gunicorn
+# nel processo principale, prima della creazione dei worker (vedi gunicorn.conf.py). Non avvia pool di processi o
+# thread, che non sopravvivono alla fork dei worker
+def warm_up():
+    with metrics.timer('startup.warm_up'):
+        initial_snapshot()
+        get_surface()
+        from data_tools.data import load_initial_data
+        from interface.charts import create_fig_prod
+        import data_tools.data_export
+        create_fig_prod(load_initial_data()[1])
 
 # Avvio del server di sviluppo
 # Se lo script viene eseguito direttamente (e non importato come modulo), il server viene avviato in modalità debug
@@ -0,0 +1 @@
+# File che serve ad indicare che la directory in cui è contenuto è un package
\ No newline at end of file
@@ -0,0 +1,56 @@
+# bench_forecast.py
+
+# Benchmark che confronta l'addestramento dei modelli previsionali con i sette stimatori LinearRegression di
+# scikit-learn (implementazione originale) e con la risoluzione ai minimi quadrati in forma chiusa del modulo
+# data_tools.forecast, sia per una singola azienda che per un batch di aziende impilate.
+# Verifica inoltre che le previsioni coincidano con quelle di scikit-learn.
+# Avvio (dalla cartella principale del progetto): python -m benchmarks.bench_forecast
+
+# Importazione delle librerie necessarie
+import timeit # per misurare i tempi di esecuzione
+import numpy as np # per le operazioni sugli array
+from sklearn.linear_model import LinearRegression # implementazione di riferimento
+from data_tools.data import load_initial_data, fit_future_models, fit_future_arrays, future_env_trend, future_env_cols, future_prod_cols
+
+# Numero di ripetizioni delle misure e dimensione del batch di aziende
+repeats = 200
+batch_farms = 1000
+
+# Addestramento con sette stimatori separati, come nella versione originale di calc_future_production
+def fit_sklearn(df_env, df_prod):
+    X = df_env[['Year']].values
+    env_models = [LinearRegression().fit(X, df_env[col].values) for col in future_env_cols]
+    X_prod = df_env[future_env_cols].values
+    prod_models = [LinearRegression().fit(X_prod, df_prod[col].values) for col in future_prod_cols]
+    return env_models, prod_models
+
+def main():
+    df_env, df_prod, _, _, _ = load_initial_data()
+
+    # Verifica di equivalenza delle previsioni
+    env_models, prod_models = fit_sklearn(df_env, df_prod)
+    models = fit_future_models(df_env, df_prod)
+    future_years = models['future_years']
+    env_sk = np.column_stack([m.predict(future_years.reshape(-1, 1)) for m in env_models])
+    env_cf = future_env_trend(models)
+    prod_sk = np.column_stack([m.predict(env_sk) for m in prod_models])
+    prod_cf = env_cf @ models['prod_coef'] + models['prod_intercept']
+    print(f"Differenza massima previsioni ambientali: {np.abs(env_sk - env_cf).max():.3e}")
+    print(f"Differenza massima previsioni di produzione: {np.abs(prod_sk - prod_cf).max():.3e}")
+
+    # Singola azienda
+    t_sk = timeit.timeit(lambda: fit_sklearn(df_env, df_prod), number=repeats) / repeats
+    t_cf = timeit.timeit(lambda: fit_future_models(df_env, df_prod), number=repeats) / repeats
+    print(f"Singola azienda - scikit-learn: {t_sk * 1e3:.3f} ms, forma chiusa: {t_cf * 1e3:.3f} ms ({t_sk / t_cf:.1f}x)")
+
+    # Batch di aziende: dati storici perturbati impilati lungo la prima dimensione
+    rng = np.random.default_rng(0)
+    years = np.broadcast_to(df_env['Year'].values, (batch_farms, len(df_env)))
+    env = df_env[future_env_cols].values * rng.uniform(0.9, 1.1, (batch_farms, *df_env[future_env_cols].shape))
+    prod = df_prod[future_prod_cols].values * rng.uniform(0.9, 1.1, (batch_farms, *df_prod[future_prod_cols].shape))
+    t_batch = timeit.timeit(lambda: fit_future_arrays(years, env, prod), number=5) / 5
+    print(f"Batch di {batch_farms} aziende - forma chiusa: {t_batch * 1e3:.3f} ms "
+          f"(stima scikit-learn: {t_sk * batch_farms * 1e3:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# bench_suite.py
+
+# Suite di benchmark dei percorsi critici della dashboard: simulatore (generate_random_data, calc_production,
+# calc_performance), previsioni (calc_future_production, generate_custom_data), grafici (funzioni create_fig_* di
+# interface.charts) ed esportazioni (save_to_excel, create_pdf_report).
+# Ogni caso viene misurato su dimensioni crescenti dei dati, dalle 5 righe della dashboard fino a milioni di righe
+# azienda-anno (ogni caso ha una dimensione massima oltre la quale non è significativo, ad esempio il report PDF).
+# I risultati vengono scritti in JSON e confrontati con un baseline salvato in precedenza: un caso più lento del
+# baseline oltre la tolleranza è una regressione e il comando termina con codice di uscita 1 (utilizzabile in CI).
+# Il baseline dipende dalla macchina su cui è stato misurato, per cui va creato sulla stessa macchina del confronto.
+# Avvio (dalla cartella principale del progetto):
+#   python -m benchmarks.bench_suite --save-baseline              (misura e salva il baseline)
+#   python -m benchmarks.bench_suite --output risultati.json      (misura e confronta con il baseline)
+#   python -m benchmarks.bench_suite --max-rows 1000 --cases fig  (solo i grafici, fino a 1000 righe)
+# Contiene le funzioni:
+# - bench_data: genera (con cache) i dati simulati di una dimensione
+# - bench_cases: restituisce i casi di benchmark (nome, dimensioni, funzione da misurare)
+# - time_case: misura i tempi di esecuzione di una funzione
+# - run_suite: esegue i casi e restituisce i risultati
+# - compare_baseline: confronta i risultati con il baseline
+# - main: interfaccia a riga di comando
+
+# Importazione delle librerie necessarie
+import os, sys, json, time, platform, argparse, functools, statistics # per misure, file JSON e riga di comando
+from datetime import datetime # per la data delle misure
+import numpy as np # per la generazione dei dati
+import pandas as pd # per la gestione dei DataFrame
+from data_tools.data_simulator import (generate_random_data, calc_production, calc_performance, default_farms,
+                                       simulate_farms, env_cols, prod_cols, perf_cols)
+from data_tools.data import calc_future_production, calc_future_ensemble, generate_custom_data
+from data_tools.data_export import save_to_excel, create_pdf_report, format_table_data
+from data_tools.sweep import run_sweep
+from data_tools.frame import ColumnFrame
+from interface.charts import create_fig_env, create_fig_prod, create_fig_perf, create_fig_future, create_fig_nextyear, create_fig_sweep
+
+# Dimensioni dei dati (righe azienda-anno) misurate
+bench_sizes = [5, 1000, 100000, 1000000]
+# Tempo minimo di misura per caso e dimensione (secondi) e numero massimo di ripetizioni
+bench_min_time = 0.5
+bench_max_repeats = 50
+# Tolleranza del confronto con il baseline (0.25: regressione se più lento del 25%)
+bench_tolerance = 0.25
+# Baseline predefinito
+bench_baseline = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Funzione che genera i dati simulati (ambientali, di produzione e di performance) di rows righe azienda-anno
+# Le aziende di riferimento vengono simulate con il motore multi-azienda; gli anni sono poi rinumerati in modo da essere
+# tutti distinti, come se fosse lo storico di una sola azienda (le previsioni e l'unione per anno lo richiedono)
+@functools.lru_cache(maxsize=None)
+def bench_data(rows):
+    n_farms = max(1, rows // 5)
+    df = simulate_farms(default_farms(n_farms), seed=0).iloc[:rows].reset_index(drop=True)
+    df['Year'] = np.arange(2025 - len(df), 2025)
+    df_env = df[['Year'] + env_cols]
+    df_prod = df[['Year'] + prod_cols].round(3)
+    df_perf = df[['Year'] + perf_cols].round(3)
+    return df_env.round(3), df_prod, df_perf
+
+# Funzione che converte un DataFrame dei dati di benchmark in tabella colonnare, con gli anni riportati a quattro cifre
+def bench_frame(df):
+    return ColumnFrame.from_frame(df.assign(Year=df['Year'] % 10000))
+
+# Funzione che prepara gli argomenti di grafici, tabelle e report con i dati di rows righe (come la dashboard)
+@functools.lru_cache(maxsize=None)
+def bench_report_inputs(rows):
+    df_env, df_prod, df_perf = bench_data(rows)
+    df_future = calc_future_production(df_env, df_prod, rng=0)
+    df_bands = calc_future_ensemble(df_env, df_prod, n_members=1000, seed=0)
+    df_baseline = df_future[df_future['Year'] == df_future['Year'].min()].round(3)
+    baseline = df_baseline.iloc[0]
+    fig_nextyear, _ = create_fig_nextyear(df_baseline, baseline['Temperature'], baseline['Humidity'], baseline['Precipitation'])
+    graphs = [create_fig_env(df_env), create_fig_prod(df_prod), *create_fig_perf(df_perf),
+              create_fig_future(df_future, df_bands), fig_nextyear]
+    tables = [format_table_data(df_env), format_table_data(df_prod), format_table_data(df_perf),
+              format_table_data(df_future.round(3)), format_table_data(df_baseline)]
+    return df_future, df_bands, graphs, tables
+
+# Funzione che restituisce i casi di benchmark: (nome, dimensioni, preparazione, funzione da misurare)
+# La preparazione riceve il numero di righe e restituisce gli argomenti della funzione da misurare (non fa parte della
+# misura). I calcoli casuali ricevono un Generator, che non viene memorizzato in cache: si misura il calcolo e non la cache
+def bench_cases():
+    rng = lambda: np.random.default_rng(0)
+    env_cm = lambda rows: bench_data(rows)[0].assign(Precipitation=lambda df: df['Precipitation'] / 10)
+    sweep = functools.lru_cache(maxsize=None)(lambda: run_sweep(n_seeds=2, max_workers=1))
+    return [
+        ('generate_random_data', [5], lambda rows: (), lambda: generate_random_data(seed=rng())),
+        ('calc_production', bench_sizes, lambda rows: bench_data(rows)[:1], lambda df_env: calc_production(df_env, rng())),
+        ('calc_performance', bench_sizes, lambda rows: bench_data(rows)[:2],
+         lambda df_env, df_prod: calc_performance(df_prod, df_env, rng())),
+        ('calc_future_production', bench_sizes, lambda rows: bench_data(rows)[:2],
+         lambda df_env, df_prod: calc_future_production(df_env, df_prod, rng=rng())),
+        # generate_custom_data modifica il DataFrame ricevuto: ogni ripetizione ne usa una copia
+        ('generate_custom_data', bench_sizes, lambda rows: (env_cm(rows),), lambda df_env: generate_custom_data(df_env.copy(), rng())),
+        ('create_fig_env', bench_sizes[:3], lambda rows: bench_data(rows)[:1], create_fig_env),
+        ('create_fig_prod', bench_sizes[:3], lambda rows: bench_data(rows)[1:2], create_fig_prod),
+        ('create_fig_perf', bench_sizes[:3], lambda rows: bench_data(rows)[2:], create_fig_perf),
+        ('create_fig_future', bench_sizes[:3], lambda rows: bench_report_inputs(rows)[:2], create_fig_future),
+        ('create_fig_nextyear', bench_sizes[:3], lambda rows: bench_report_inputs(rows)[:1],
+         lambda df_future: create_fig_nextyear(df_future, 20, 60, 50)),
+        ('create_fig_sweep', [5], lambda rows: (sweep(),), lambda result: create_fig_sweep(result, 'Yield', 500)),
+        # save_to_excel riceve le tabelle colonnari della dashboard (gli anni rinumerati dei dati di benchmark superano
+        # l'intervallo della colonna Year, per cui vengono riportati a quattro cifre)
+        ('save_to_excel', bench_sizes[:3], lambda rows: tuple(bench_frame(df) for df in bench_data(rows)), save_to_excel),
+        # Trasporto delle tabelle: serializzazione colonnare (dcc.Store) ed elenco di record (DataTable)
+        ('column_frame_encode', bench_sizes, lambda rows: (bench_frame(bench_data(rows)[2]),), lambda frame: frame.encode()),
+        ('column_frame_decode', bench_sizes, lambda rows: (bench_frame(bench_data(rows)[2]).encode(),), ColumnFrame.decode),
+        ('column_frame_records', bench_sizes[:3], lambda rows: (bench_frame(bench_data(rows)[2]),), lambda frame: frame.to_records()),
+        ('create_pdf_report', [5], lambda rows: bench_report_inputs(rows)[2:], create_pdf_report),
+    ]
+
+# Funzione che misura una funzione: una chiamata di riscaldamento (importazioni, processi di rendering, etc.) e poi
+# ripetizioni fino ad almeno min_time secondi complessivi (al massimo max_repeats).
+# Restituisce i tempi delle singole ripetizioni in secondi
+def time_case(fn, min_time=bench_min_time, max_repeats=bench_max_repeats):
+    fn()
+    times = []
+    while len(times) < max_repeats and sum(times) < min_time:
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+# Funzione che esegue i casi di benchmark (filtrati per nome e dimensione massima) e restituisce i risultati:
+# un dizionario per caso e dimensione con le statistiche dei tempi e le righe elaborate al secondo
+def run_suite(names=None, max_rows=max(bench_sizes), min_time=bench_min_time, on_result=None):
+    results = []
+    for name, sizes, setup, fn in bench_cases():
+        if names and not any(part in name for part in names):
+            continue
+        for rows in sizes:
+            if rows > max_rows:
+                continue
+            args = setup(rows)
+            times = time_case(lambda: fn(*args), min_time)
+            median = statistics.median(times)
+            result = {'case': name, 'rows': rows, 'repeats': len(times), 'min_s': min(times), 'median_s': median,
+                      'mean_s': statistics.fmean(times), 'rows_per_s': rows / median}
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+# Funzione che confronta i risultati con quelli del baseline (stesso caso e stessa dimensione), sulla mediana dei tempi
+# Restituisce un elenco di confronti con il rapporto corrente / baseline e l'esito: 'regressione' (più lento oltre la
+# tolleranza), 'miglioramento' (più veloce oltre la tolleranza), 'ok' oppure 'nuovo' (assente nel baseline)
+def compare_baseline(results, baseline, tolerance=bench_tolerance):
+    reference = {(r['case'], r['rows']): r for r in baseline['results']}
+    comparison = []
+    for result in results:
+        base = reference.get((result['case'], result['rows']))
+        if base is None:
+            comparison.append({'case': result['case'], 'rows': result['rows'], 'status': 'nuovo'})
+            continue
+        ratio = result['median_s'] / base['median_s']
+        status = 'regressione' if ratio > 1 + tolerance else 'miglioramento' if ratio < 1 / (1 + tolerance) else 'ok'
+        comparison.append({'case': result['case'], 'rows': result['rows'], 'baseline_s': base['median_s'],
+                           'median_s': result['median_s'], 'ratio': ratio, 'status': status})
+    return comparison
+
+# Interfaccia a riga di comando
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark dei percorsi critici della dashboard")
+    parser.add_argument('--cases', help="casi da eseguire (parti del nome separate da virgole, default tutti)")
+    parser.add_argument('--max-rows', type=int, default=max(bench_sizes), help="dimensione massima dei dati")
+    parser.add_argument('--min-time', type=float, default=bench_min_time, help="secondi minimi di misura per caso")
+    parser.add_argument('--output', help="file JSON dei risultati")
+    parser.add_argument('--baseline', default=bench_baseline, help="file JSON del baseline")
+    parser.add_argument('--save-baseline', action='store_true', help="salva i risultati come nuovo baseline")
+    parser.add_argument('--tolerance', type=float, default=bench_tolerance, help="tolleranza delle regressioni")
+    args = parser.parse_args(argv)
+
+    def on_result(result):
+        print(f"{result['case']:<24} {result['rows']:>9} righe  {result['median_s'] * 1e3:>10.3f} ms "
+              f"({result['repeats']} ripetizioni)", file=sys.stderr, flush=True)
+
+    results = run_suite(args.cases.split(',') if args.cases else None, args.max_rows, args.min_time, on_result)
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+                    'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': results,
+    }
+
+    regressions = []
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            report['comparison'] = compare_baseline(results, json.load(f), args.tolerance)
+        for item in report['comparison']:
+            if 'ratio' in item:
+                print(f"{item['case']:<24} {item['rows']:>9} righe  {item['ratio']:>6.2f}x  {item['status']}")
+        regressions = [item for item in report['comparison'] if item['status'] == 'regressione']
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline salvato in {args.baseline}", file=sys.stderr)
+    if regressions:
+        print(f"{len(regressions)} regressioni rispetto al baseline", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# backtest.py
+
+# Backtesting dei modelli previsionali (rolling origin): lo storico viene ripercorso anno per anno e ad ogni "origine"
+# i modelli vengono riaddestrati sui soli anni precedenti e confrontati con i valori effettivi degli anni successivi.
+# Le previsioni sono quelle di calc_future_production senza rumore: dati ambientali proiettati dal modello e dati di
+# produzione ricavati da quelli ambientali previsti. Per ogni modello (backend di data_tools.models) vengono misurati
+# l'errore per variabile (MAE, RMSE, MAPE) e il costo: tempo di addestramento e previsione per fold e picco di memoria.
+# I fold (modello x origine, ciascuno su tutte le aziende impilate) sono distribuiti su un pool di processi.
+# Avvio (dalla cartella principale del progetto):
+#   python -m data_tools.backtest                                   (dati iniziali della dashboard)
+#   python -m data_tools.backtest --farms 200 --years 15 --models linear,poly,arima --output backtest.csv
+# Contiene le funzioni:
+# - history_arrays: converte lo storico (una riga per azienda e anno) negli array impilati per azienda
+# - fold_origins: restituisce le origini dei fold
+# - run_fold: addestra un modello su un fold e ne restituisce errori, tempo e memoria. E' eseguita nei processi del pool
+# - run_backtest: esegue tutti i fold e restituisce le tabelle degli errori e dei costi per modello
+# - main: interfaccia a riga di comando
+
+# Importazione delle librerie necessarie
+import os, sys, time, argparse, tracemalloc # per la riga di comando e le misure di tempo e memoria
+from concurrent.futures import ProcessPoolExecutor, as_completed # per distribuire i fold sui processi
+import numpy as np # per le operazioni sugli array
+import pandas as pd # per le tabelle dei risultati
+from data_tools import models # registro dei modelli previsionali
+from data_tools.data import load_initial_data, fit_future_arrays, future_env_trend, future_env_cols, future_prod_cols, future_horizon
+from data_tools.data_simulator import default_farms, simulate_farms
+
+# Parametri predefiniti del backtest
+backtest_min_train = 3 # Numero minimo di anni di addestramento (prima origine)
+backtest_horizon = 2 # Numero di anni previsti e valutati ad ogni origine (al massimo future_horizon, gli anni previsti dai modelli)
+backtest_workers = os.cpu_count() or 1 # Numero di processi
+backtest_cols = future_env_cols + future_prod_cols # Variabili valutate
+
+# Funzione che converte lo storico in array impilati per azienda: anni (aziende, anni), dati ambientali
+# (aziende, anni, 3) e di produzione (aziende, anni, 4). Tutte le aziende devono avere gli stessi anni
+def history_arrays(df_env, df_prod):
+    if 'farm_id' not in df_env.columns:
+        df_env, df_prod = df_env.assign(farm_id=0), df_prod.assign(farm_id=0)
+    df = pd.merge(df_env, df_prod, on=['farm_id', 'Year']).sort_values(['farm_id', 'Year'], kind='stable')
+    n_farms = df['farm_id'].nunique()
+    years = df['Year'].to_numpy(dtype=float).reshape(n_farms, -1)
+    env = df[future_env_cols].to_numpy(dtype=float).reshape(n_farms, years.shape[1], -1)
+    prod = df[future_prod_cols].to_numpy(dtype=float).reshape(n_farms, years.shape[1], -1)
+    return years, env, prod
+
+# Funzione che restituisce le origini dei fold: indice del primo anno non usato per l'addestramento
+def fold_origins(n_years, min_train=backtest_min_train):
+    return list(range(min_train, n_years))
+
+# Funzione eseguita all'avvio di ogni processo del pool: il parallelismo è tra i fold, per cui i modelli per serie
+# vengono addestrati nel processo stesso invece che in un pool annidato (statsmodels viene importato subito, in modo
+# che il tempo di importazione non venga attribuito al primo fold)
+def init_worker():
+    models.model_workers = 0
+    models.warm_model_worker()
+
+# Funzione che addestra e valuta un modello su un fold (origine), per tutte le aziende insieme
+# Restituisce il modello, l'origine, gli errori e i valori effettivi (aziende, anni valutati, variabili), i secondi di
+# addestramento e previsione e il picco di memoria in byte (misurato in un secondo passaggio, perché tracemalloc
+# rallenta le allocazioni e falserebbe i tempi; None se track_memory è False)
+def run_fold(model, years, env, prod, origin, horizon=backtest_horizon, track_memory=True):
+    horizon = min(horizon, years.shape[1] - origin)
+
+    def forecast():
+        fitted = fit_future_arrays(years[:, :origin], env[:, :origin], prod[:, :origin], model)
+        pred_env = future_env_trend(fitted)[:, :horizon]
+        pred_prod = pred_env @ fitted['prod_coef'] + fitted['prod_intercept'][:, None, :]
+        return np.concatenate([pred_env, pred_prod], axis=-1)
+
+    start = time.perf_counter()
+    predictions = forecast()
+    elapsed = time.perf_counter() - start
+    peak = None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            forecast()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    actual = np.concatenate([env[:, origin:origin + horizon], prod[:, origin:origin + horizon]], axis=-1)
+    return model, origin, predictions - actual, actual, elapsed, peak
+
+# Funzione che esegue il backtest di più modelli sullo stesso storico
+# L'orizzonte deve essere compreso tra 1 e future_horizon (altrimenti viene sollevato ValueError)
+# Restituisce due DataFrame:
+# - errori: una riga per modello e variabile con MAE, RMSE e MAPE (%) su tutti i fold, le aziende e gli anni valutati
+# - costi: una riga per modello con numero di fold, secondi complessivi e medi per fold e picco di memoria
+def run_backtest(df_env, df_prod, model_names=None, min_train=backtest_min_train, horizon=backtest_horizon,
+                 workers=backtest_workers, track_memory=True):
+    if not 1 <= horizon <= future_horizon:
+        raise ValueError(f"L'orizzonte deve essere compreso tra 1 e {future_horizon} anni (richiesti {horizon})")
+    model_names = list(model_names or models.forecast_models)
+    for name in model_names:
+        models.get_backend(name)
+    years, env, prod = history_arrays(df_env, df_prod)
+    origins = fold_origins(years.shape[1], min_train)
+    if not origins:
+        raise ValueError(f"Servono almeno {min_train + 1} anni di storico")
+    tasks = [(name, years, env, prod, origin, horizon, track_memory) for name in model_names for origin in origins]
+
+    if workers <= 1:
+        previous, models.model_workers = models.model_workers, 0
+        try:
+            results = [run_fold(*task) for task in tasks]
+        finally:
+            models.model_workers = previous
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            results = [future.result() for future in as_completed([executor.submit(run_fold, *task) for task in tasks])]
+
+    # Raccolta degli errori e dei costi per modello
+    score_rows, cost_rows = [], []
+    for name in model_names:
+        folds = [result for result in results if result[0] == name]
+        errors = np.concatenate([fold[2].reshape(-1, len(backtest_cols)) for fold in folds])
+        actual = np.concatenate([fold[3].reshape(-1, len(backtest_cols)) for fold in folds])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ape = np.where(actual != 0, np.abs(errors / actual), np.nan)
+        for j, col in enumerate(backtest_cols):
+            score_rows.append({'model': name, 'target': col, 'mae': np.abs(errors[:, j]).mean(),
+                               'rmse': np.sqrt((errors[:, j] ** 2).mean()), 'mape': 100 * np.nanmean(ape[:, j])})
+        seconds = sum(fold[4] for fold in folds)
+        peaks = [fold[5] for fold in folds if fold[5] is not None]
+        cost_rows.append({'model': name, 'folds': len(folds), 'seconds': seconds, 'ms_per_fold': 1000 * seconds / len(folds),
+                          'peak_bytes': max(peaks) if peaks else None})
+    return pd.DataFrame(score_rows), pd.DataFrame(cost_rows)
+
+# Interfaccia a riga di comando
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest (rolling origin) dei modelli previsionali")
+    parser.add_argument('--models', default=','.join(models.forecast_models), help="modelli da confrontare, separati da virgole")
+    parser.add_argument('--farms', type=int, default=0, help="numero di aziende di riferimento da simulare (default: dati iniziali)")
+    parser.add_argument('--years', type=int, default=10, help="anni di storico delle aziende simulate")
+    parser.add_argument('--seed', type=int, default=None, help="seme della simulazione")
+    parser.add_argument('--min-train', type=int, default=backtest_min_train, help="anni minimi di addestramento")
+    parser.add_argument('--horizon', type=int, default=backtest_horizon, help=f"anni previsti ad ogni origine (1-{future_horizon})")
+    parser.add_argument('--workers', type=int, default=backtest_workers, help="numero di processi")
+    parser.add_argument('--no-memory', action='store_true', help="non misurare il picco di memoria")
+    parser.add_argument('--output', help="file CSV in cui salvare gli errori (i costi in <nome>_costs.csv)")
+    args = parser.parse_args(argv)
+    if not 1 <= args.horizon <= future_horizon:
+        parser.error(f"--horizon deve essere compreso tra 1 e {future_horizon}")
+
+    if args.farms:
+        sim_years = np.arange(2025 - args.years, 2025)
+        df = simulate_farms(default_farms(args.farms), sim_years=sim_years, seed=args.seed)
+        df_env, df_prod = df[['farm_id', 'Year'] + future_env_cols], df[['farm_id', 'Year'] + future_prod_cols]
+    else:
+        df_env, df_prod = load_initial_data()[:2]
+
+    start = time.perf_counter()
+    df_scores, df_costs = run_backtest(df_env, df_prod, args.models.split(','), args.min_train, args.horizon,
+                                       args.workers, not args.no_memory)
+    print("MAPE (%) per variabile e modello:")
+    print(df_scores.pivot(index='target', columns='model', values='mape').round(2).to_string(), end='\n\n')
+    print(df_costs.round(3).to_string(index=False))
+    print(f"\nBacktest completato in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    if args.output:
+        df_scores.to_csv(args.output, index=False)
+        df_costs.to_csv(f'{os.path.splitext(args.output)[0]}_costs.csv', index=False)
+
+if __name__ == "__main__":
+    main()
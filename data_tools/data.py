@@ -3,40 +3,65 @@
 # Modulo che gestisce il caricamento e la generazione di dati per la dashboard.
 # Contiene le funzioni
 # - load_initial_data: richiamata dalle callback e dal modulo layouts.layout.py, legge i dati ambientali e produttivi iniziali 
-#   dai file .csv di backend e invoca la genearzione dei dati futuri per popolare la dashboard all'apertura o all'aggiornamento
+#   dall'archivio colonnare di backend (dataset Parquet o, in mancanza, file .csv) e invoca la genearzione dei dati futuri per popolare la dashboard all'apertura o all'aggiornamento
 #   della pagina
 # - generate_custom_data(params): richiamata dalla callback che gestisce gli slider ambientali, calcola i dati futuri in funzione 
 #   del valore di questi ultimi
+# - read_initial_data: legge i dati iniziali e ne calcola i derivati (con cache invalidata dalla modifica dei file)
+# - calc_initial_derived: calcola (con cache) indicatori di performance e previsioni dei dati iniziali
+# - fit_future_models: addestra i modelli usati dalle previsioni e ne restituisce previsioni ambientali e coefficienti
+# - fit_future_arrays: come fit_future_models ma a partire da array, anche per molte aziende o scenari impilati
 # - calc_future_production(params): genera i dati previsionali ambientali e di produzione. E' richiamata dalle callback del pulsante
 #   btn-random e del caricamento della pagina
+# - forecast_from_models: genera i dati previsionali a partire dai coefficienti dei modelli
+# - future_env_trend: restituisce le previsioni ambientali deterministiche dei modelli
+# - OnlineForecast: modelli previsionali di molte aziende aggiornati in modo incrementale all'arrivo di nuovi dati
+# - calc_future_ensemble: genera in un'unica elaborazione vettoriale molte realizzazioni delle previsioni e ne restituisce le
+#   bande di confidenza (percentili). E' richiamata dalle callback per disegnare le bande nel grafico previsionale
 
 # Importazione delle librerie necessarie
-import os # per la gestione dei file
 import pandas as pd # per la gestione e la manipolazione dei dati in formato tabellare (strutture dati)
 import numpy as np # per la generazione di numeri casuali e le operazioni sugli array
 from interface import labels # per importare le etichette di intestazione tabelle
-from sklearn.linear_model import LinearRegression  # per creare modelli di regressione lineare
+from data_tools.forecast import OnlineLinear # per aggiornare in modo incrementale i modelli di regressione lineare
 from data_tools.data_simulator import calc_production, calc_performance # per calcolare i dati di produzione e performance
+from data_tools.rng import make_rng, spawn_rngs # per i generatori di numeri casuali espliciti
+from data_tools.memo import memoize # per memorizzare i risultati a parità di seme e di dati
+from data_tools.metrics import timed # per misurare i tempi delle funzioni richiamate dalle callback
+from data_tools.storage import read_table, source_signature # per leggere i dati storici dall'archivio colonnare
+from data_tools.models import forecast_series, model_regression # per i modelli previsionali (registro dei backend)
 
-# Funzione che carica i dati iniziali (ambientali e di produzione) da due file .csv
-def load_initial_data():
-    # Impostazione path dei file
-    env_file = os.path.join(os.getcwd(), "data_src", "data_env.csv")
-    prod_file = os.path.join(os.getcwd(), "data_src", "data_prod.csv")
-    # Lettura dei dati
-    data_env = pd.read_csv(env_file)
+# Seme predefinito dei calcoli casuali della dashboard: ricaricare la pagina restituisce gli stessi risultati,
+# che possono quindi essere riutilizzati dalla cache invece di essere ricalcolati
+default_seed = 0
+
+# Funzione che carica i dati iniziali (ambientali e di produzione) dall'archivio colonnare (data_tools.storage)
+# seed: seme dei calcoli casuali (indicatori di performance e previsioni), a parità di seme i risultati sono identici
+# farm_id, years: azienda e intervallo di anni (primo, ultimo) da caricare; di default l'azienda di riferimento e tutti gli anni
+# I dati letti e quelli derivati restano in cache per tutto il processo: un caricamento della pagina costa una ricerca
+# nella cache invece di letture da disco e addestramento dei modelli. La chiave comprende la firma dei file di origine
+# (data di modifica e dimensione), per cui la modifica dei dati li fa rileggere automaticamente
+@timed()
+def load_initial_data(seed=default_seed, farm_id=0, years=None):
+    return read_initial_data(seed, farm_id, years, source_signature(['env', 'prod']))
+
+# Funzione che legge i dati iniziali e calcola quelli derivati. E' richiamata da load_initial_data
+# signature non viene usata nel calcolo ma fa parte della chiave della cache
+@memoize(seed_arg='seed', maxsize=16)
+def read_initial_data(seed, farm_id, years, signature):
+    # Lettura dei soli dati dell'azienda e degli anni richiesti
+    data_env = read_table('env', farms=[farm_id], years=years).drop(columns='farm_id')
 
     # Converti la colonna 'Precipitation' in centimetri
     # Il DataFrame sarà quello visualizzato sotto al grafico dei dati ambientali
     data_env['Precipitation'] = data_env['Precipitation'] / 10 
 
-    data_prod = pd.read_csv(prod_file)
+    data_prod = read_table('prod', farms=[farm_id], years=years).drop(columns='farm_id')
     
     # Popolamento dei DataFrame (vengono generati anche i dati "futuri")
     df_env = pd.DataFrame(data_env)
     df_prod = pd.DataFrame(data_prod)	
-    df_perf = calc_performance(df_prod, df_env)
-    df_future = calc_future_production(df_env, df_prod)
+    df_perf, df_future = calc_initial_derived(df_env, df_prod, seed)
 	
 	# Importazione del dizionario per la traduzione delle intestazioni di colonna delle 
     # tabelle visualizzate sotto i grafici
@@ -45,14 +70,24 @@ def load_initial_data():
     # intestazioni di colonna
     return df_env, df_prod, df_perf, df_future, col_mapping
 
+# Funzione che calcola gli indicatori di performance e le previsioni dei dati iniziali
+# E' memorizzata in cache: a parità di dati letti e di seme i modelli non vengono addestrati di nuovo
+@memoize(seed_arg='seed')
+def calc_initial_derived(df_env, df_prod, seed):
+    rng_perf, rng_future = spawn_rngs(seed, 2) # flussi indipendenti per performance e previsioni
+    df_perf = calc_performance(df_prod, df_env, rng_perf)
+    df_future = calc_future_production(df_env, df_prod, rng=rng_future)
+    return df_perf, df_future
+
 # Funzione che calcola i dati futuri in funzione dei valori impostati sugli slider di Temperatura, Umidità e Precipitazioni
-def generate_custom_data(mynew_env):
+@timed()
+def generate_custom_data(mynew_env, rng=None):
     # DataFrame che raccoglie la temperatura, l'umidità e le precipitazioni
     df_env = mynew_env
     # Precipitazioni da cm a mm per i calcoli
     df_env['Precipitation'] = df_env['Precipitation'] * 10
     # Calcolo dei dati di produzione basati sui dati ambientali
-    growth_days, total_yield, water_consumption, fertilizer_consumption = calc_production(df_env)
+    growth_days, total_yield, water_consumption, fertilizer_consumption = calc_production(df_env, rng)
 	
     # Raccolta dei dati di produzione in un DataFrame
     df_prod = pd.DataFrame({
@@ -70,90 +105,180 @@ def generate_custom_data(mynew_env):
     # I DataFrame vengono restituiti
     return df_future.round(3)
 
+# Colonne dei dati previsionali ambientali e di produzione
+future_env_cols = ['Temperature', 'Humidity', 'Precipitation']
+future_prod_cols = ['Growth_Days', 'Yield', 'Water_Consumption', 'Fertilizer_Consumption']
+# Numero di anni previsti (i successivi all'ultimo anno dello storico)
+future_horizon = 5
+# Numero predefinito di realizzazioni della modalità ensemble e percentili delle bande di confidenza
+ensemble_members = 10000
+ensemble_percentiles = (5, 50, 95)
+
+# Funzione che addestra i modelli usati dalle previsioni e restituisce, insieme agli anni futuri, le previsioni
+# ambientali e i coefficienti dei modelli di produzione in forma di array (in modo da poterli applicare a molte
+# realizzazioni in un colpo solo)
+# model: nome del modello previsionale (backend del registro data_tools.models), default la retta originale
+def fit_future_models(df_env, df_prod, model='linear'):
+    return fit_future_arrays(df_env['Year'].values, df_env[future_env_cols].values, df_prod[future_prod_cols].values,
+                             model)
+
+# Funzione che addestra i modelli previsionali a partire da array, anche per molte aziende o scenari impilati
+# years: (..., anni); env: (..., anni, 3 variabili ambientali); prod: (..., anni, 4 variabili di produzione)
+# Tutti i modelli, compresa la retta predefinita, passano dal registro data_tools.models (che ne misura i tempi): le
+# serie ambientali vengono proiettate con il backend indicato (la retta con un'unica risoluzione ai minimi quadrati
+# per tutte le variabili e tutte le aziende) e i modelli di produzione (in funzione dei dati ambientali) vengono
+# addestrati con la regressione del backend. Il risultato contiene le previsioni ambientali (future_env) e i
+# coefficienti dei modelli di produzione
+def fit_future_arrays(years, env, prod, model='linear'):
+    years = np.asarray(years)
+    # Anni da prevedere (i future_horizon successivi all'ultimo anno disponibile)
+    future_years = years.max(axis=-1, keepdims=True) + np.arange(1, future_horizon + 1)
+    prod_coef, prod_intercept = model_regression(model)(env, prod)
+    return {
+        'future_years': future_years,                                       # (..., 5)
+        'future_env': forecast_series(model, years, env, future_years),     # (..., 5, 3)
+        'prod_coef': prod_coef,                         # (..., 3 variabili ambientali, 4 variabili di produzione)
+        'prod_intercept': prod_intercept,               # (..., 4)
+    }
+
 # Funzione che genera i dati previsionali ambientali e di produzione
 # instability_factor (float): controlla l'intensità del "rumore" (default 0.1, corrisponde al 10% di deviazione rispetto al valore previsto)
-def calc_future_production(df_env, df_prod, instability_factor=0.1):
-    ### Preprocessing dei dati
-    # Selezione dei dati ambientali come variabili indipendenti
-    X = df_env[['Year']].values
-    y_temp = df_env['Temperature'].values
-    y_humidity = df_env['Humidity'].values
-    y_precip = df_env['Precipitation'].values
-    
-    # Creazione dei modelli di regressione lineare per stimare temperatura, umidità e precipitazioni future
-    model_temp = LinearRegression()
-    model_humidity = LinearRegression()
-    model_precip = LinearRegression()
-
-    # Addestramento dei modelli sui dati selezionati
-    model_temp.fit(X, y_temp)
-    model_humidity.fit(X, y_humidity)
-    model_precip.fit(X, y_precip)
-
-    ### Previsione dei dati ambientali per i prossimi 5 anni
-    future_years = np.arange(df_env['Year'].max() + 1, df_env['Year'].max() + 6)
-    df_future_env = pd.DataFrame({'Year': future_years}) # Dataframe che raccoglierà i dati ambientali previsti
-
-    # Calcolo dei valori futuri di Temperature, Humidity, Precipitation
-    future_temp = model_temp.predict(future_years.reshape(-1, 1))
-    future_humidity = model_humidity.predict(future_years.reshape(-1, 1))
-    future_precip = model_precip.predict(future_years.reshape(-1, 1))
-    
+# rng: seme o generatore di numeri casuali usato per il rumore (con un seme intero il risultato è memorizzato in cache)
+# model: modello previsionale (vedi data_tools.models), default la retta in funzione dell'anno
+@timed()
+@memoize(seed_arg='rng')
+def calc_future_production(df_env, df_prod, instability_factor=0.1, rng=None, model='linear'):
+    # Addestramento dei modelli sui dati storici
+    models = fit_future_models(df_env, df_prod, model)
+    return forecast_from_models(models, instability_factor, rng)
+
+# Funzione che genera i dati previsionali ambientali e di produzione a partire dai coefficienti dei modelli di una
+# azienda (dizionario restituito da fit_future_models o da OnlineForecast.models)
+def forecast_from_models(models, instability_factor=0.1, rng=None):
+    rng = make_rng(rng)
+    future_years = models['future_years']
+
+    ### Previsione dei dati ambientali per i prossimi 5 anni (una colonna per variabile)
+    future_env = future_env_trend(models)
     # Aggiunta di un "rumore" casuale alle previsioni (simuliamo instabilità meteorologica)
-    future_temp += np.random.normal(0, instability_factor * np.std(future_temp), len(future_temp))
-    future_humidity += np.random.normal(0, instability_factor * np.std(future_humidity), len(future_humidity))
-    future_precip += np.random.normal(0, instability_factor * np.std(future_precip), len(future_precip))
-    
-    # Aggiunta delle previsioni al dataframe dei dati futuri
-    df_future_env['Temperature'] = future_temp
-    df_future_env['Humidity'] = future_humidity
-    df_future_env['Precipitation'] = future_precip
-
-    ### Previsione della produzione e dei consumi
-    # Selezione dei dati storici
-    X_prod = df_env[['Temperature', 'Humidity', 'Precipitation']].values  # Dati ambientali storici
-    y_growth_days = df_prod['Growth_Days'].values
-    y_yield = df_prod['Yield'].values
-    y_water_consumption = df_prod['Water_Consumption'].values
-    y_fertilizer_consumption = df_prod['Fertilizer_Consumption'].values
-
-    # Creazione di modelli di regressione lineare per stimare i parametri della produzione futura
-    model_growth_days = LinearRegression()
-    model_yield = LinearRegression()
-    model_water_consumption = LinearRegression()
-    model_fertilizer_consumption = LinearRegression()
+    future_env += rng.normal(0, instability_factor * np.std(future_env, axis=0), future_env.shape)
 
-    # Addestramento dei modelli sui dati storici
-    model_growth_days.fit(X_prod, y_growth_days)
-    model_yield.fit(X_prod, y_yield)
-    model_water_consumption.fit(X_prod, y_water_consumption)
-    model_fertilizer_consumption.fit(X_prod, y_fertilizer_consumption)
-
-    # Calcolo della previsione dei dati di produzione e dei consumi
-    future_env_values = df_future_env[['Temperature', 'Humidity', 'Precipitation']].values
-    future_growth_days = model_growth_days.predict(future_env_values)
-    future_yield = model_yield.predict(future_env_values)
-    future_water_consumption = model_water_consumption.predict(future_env_values)
-    future_fertilizer_consumption = model_fertilizer_consumption.predict(future_env_values)
-    
+    ### Previsione della produzione e dei consumi in funzione dei dati ambientali previsti
+    future_prod = future_env @ models['prod_coef'] + models['prod_intercept']
     # Aggiunta di un "rumore" casuale alle previsioni di produzione e consumo
-    future_growth_days += np.random.normal(0, instability_factor * np.std(future_growth_days), len(future_growth_days))
-    future_yield += np.random.normal(0, instability_factor * np.std(future_yield), len(future_yield))
-    future_water_consumption += np.random.normal(0, instability_factor * np.std(future_water_consumption), len(future_water_consumption))
-    future_fertilizer_consumption += np.random.normal(0, instability_factor * np.std(future_fertilizer_consumption), len(future_fertilizer_consumption))
-
-    ### Creazione del dataframe per la produzione futura
-    df_future_prod = pd.DataFrame({
-        'Year': future_years,
-        'Growth_Days': future_growth_days,
-        'Yield': future_yield,
-        'Water_Consumption': future_water_consumption,
-        'Fertilizer_Consumption': future_fertilizer_consumption
-    })
-    
+    future_prod += rng.normal(0, instability_factor * np.std(future_prod, axis=0), future_prod.shape)
+
+    ### Creazione dei dataframe dei dati ambientali e di produzione futuri
+    df_future_env = pd.DataFrame(future_env, columns=future_env_cols)
+    df_future_env.insert(0, 'Year', future_years)
+    df_future_prod = pd.DataFrame(future_prod, columns=future_prod_cols)
+    df_future_prod.insert(0, 'Year', future_years)
+
     # Conversione dei valori delle precipitazioni da mm a cm
     df_future_env['Precipitation'] = df_future_env['Precipitation'] / 10
 
     # Merge dei due dataframe e restituzione
     future_data = pd.merge(df_future_env, df_future_prod, on="Year")
-    return future_data
\ No newline at end of file
+    return future_data
+
+# Funzione che restituisce le previsioni ambientali deterministiche (..., anni futuri, variabili) dei modelli: quelle
+# calcolate dal backend oppure, per le rette, quelle ricavate dai coefficienti
+def future_env_trend(models):
+    if 'future_env' in models:
+        return np.array(models['future_env'])
+    return models['future_years'][..., None] * models['env_coef'][..., None, :] + models['env_intercept'][..., None, :]
+
+# Classe che mantiene aggiornati in modo incrementale i modelli previsionali di molte aziende (data_tools.forecast.OnlineLinear)
+# Quando arriva il dato di un nuovo anno (o l'aggiornamento di quello in corso, ad esempio ogni mese) vengono aggiornate
+# solo le statistiche sufficienti delle aziende interessate: i modelli si risolvono in tempo costante, senza
+# riaddestrarli sull'intero storico, e coincidono con quelli di fit_future_models sugli stessi dati.
+# I dati ambientali e di produzione devono essere nelle stesse unità usate con calc_future_production
+class OnlineForecast:
+    def __init__(self, n_farms=1):
+        self.env_model = OnlineLinear(1, len(future_env_cols), (n_farms,))
+        self.prod_model = OnlineLinear(len(future_env_cols), len(future_prod_cols), (n_farms,))
+        # Ultimo anno acquisito per azienda e relativi dati (per poterli sostituire se l'anno viene aggiornato)
+        self.last_year = np.full(n_farms, np.iinfo(np.int64).min)
+        self.last_env = np.zeros((n_farms, len(future_env_cols)))
+        self.last_prod = np.zeros((n_farms, len(future_prod_cols)))
+
+    # Acquisisce lo storico di un'azienda (DataFrame ambientale e di produzione con gli stessi anni)
+    def add_history(self, df_env, df_prod, farm=0):
+        for year, env, prod in zip(df_env['Year'].to_numpy(), df_env[future_env_cols].to_numpy(),
+                                   df_prod[future_prod_cols].to_numpy()):
+            self.update_year([farm], year, env[None], prod[None])
+
+    # Acquisisce i dati di un anno per le aziende indicate (elenco di indici): env (aziende, 3), prod (aziende, 4)
+    # Se l'anno è già l'ultimo acquisito per un'azienda, i suoi dati precedenti (ad esempio parziali) vengono sostituiti
+    def update_year(self, farms, year, env, prod):
+        farms = np.asarray(farms)
+        env = np.asarray(env, dtype=float)
+        prod = np.asarray(prod, dtype=float)
+        years = np.full((len(farms), 1, 1), float(year))
+        replace = self.last_year[farms] == year
+        if replace.any():
+            old_env = self.last_env[farms[replace]][:, None]
+            self.env_model.remove(years[replace], old_env, farms[replace])
+            self.prod_model.remove(old_env, self.last_prod[farms[replace]][:, None], farms[replace])
+        self.env_model.update(years, env[:, None], farms)
+        self.prod_model.update(env[:, None], prod[:, None], farms)
+        self.last_year[farms] = np.maximum(self.last_year[farms], year)
+        self.last_env[farms] = env
+        self.last_prod[farms] = prod
+
+    # Restituisce i coefficienti dei modelli di un'azienda, nello stesso formato di fit_future_models
+    # Vengono risolti solo i modelli dell'azienda richiesta, per cui il costo non dipende dal numero di aziende
+    def models(self, farm=0):
+        env_coef, env_intercept = self.env_model.solve(farm)
+        prod_coef, prod_intercept = self.prod_model.solve(farm)
+        return {
+            'future_years': self.last_year[farm] + np.arange(1, future_horizon + 1),
+            'env_coef': env_coef[0],
+            'env_intercept': env_intercept,
+            'prod_coef': prod_coef,
+            'prod_intercept': prod_intercept,
+        }
+
+    # Genera i dati previsionali di un'azienda (stesso risultato di calc_future_production sugli stessi dati)
+    def forecast(self, farm=0, instability_factor=0.1, rng=None):
+        return forecast_from_models(self.models(farm), instability_factor, rng)
+
+# Funzione che genera i dati previsionali in modalità ensemble (Monte Carlo)
+# Invece di una sola traiettoria rumorosa vengono simulate n_members realizzazioni in un'unica elaborazione vettoriale
+# (array di forma realizzazioni x anni x variabili) e vengono restituiti, per ogni anno e per ogni colonna previsionale,
+# i percentili richiesti (default P5/P50/P95) nelle colonne '<Colonna>_P<percentile>'
+# seed: seme dell'ensemble. Le realizzazioni sono estratte in blocchi consecutivi da un unico flusso derivato dal seme
+# (un flusso separato per ciascuna delle 10k realizzazioni costerebbe più dell'intero calcolo): a parità di seme e di
+# n_members ogni realizzazione è quindi riproducibile (e il risultato è memorizzato in cache)
+@timed()
+@memoize(seed_arg='seed')
+def calc_future_ensemble(df_env, df_prod, n_members=ensemble_members, instability_factor=0.1, percentiles=ensemble_percentiles, seed=None, model='linear'):
+    rng = make_rng(seed)
+    # I modelli vengono addestrati una sola volta: il rumore è l'unica parte che varia tra le realizzazioni
+    models = fit_future_models(df_env, df_prod, model)
+    future_years = models['future_years']
+
+    # Previsione ambientale deterministica (anni x variabili) e rumore indipendente per ogni realizzazione
+    future_env = future_env_trend(models)
+    env_sigma = instability_factor * np.std(future_env, axis=0)
+    members_env = future_env + rng.standard_normal((n_members, *future_env.shape)) * env_sigma
+
+    # Previsione di produzione per tutte le realizzazioni con un solo prodotto matriciale
+    members_prod = members_env @ models['prod_coef'] + models['prod_intercept']
+    # Come in calc_future_production, il rumore di produzione è proporzionale alla variabilità della singola traiettoria
+    prod_sigma = instability_factor * np.std(members_prod, axis=1, keepdims=True)
+    members_prod += rng.standard_normal(members_prod.shape) * prod_sigma
+
+    # Conversione delle precipitazioni da mm a cm
+    members_env[..., future_env_cols.index('Precipitation')] /= 10
+
+    # Calcolo dei percentili lungo l'asse delle realizzazioni
+    members = np.concatenate([members_env, members_prod], axis=2)
+    bands = np.percentile(members, percentiles, axis=0)  # (percentili, anni, variabili)
+
+    # Raccolta delle bande in un DataFrame con una riga per anno
+    df_bands = pd.DataFrame({'Year': future_years})
+    for j, col in enumerate(future_env_cols + future_prod_cols):
+        for i, perc in enumerate(percentiles):
+            df_bands[f'{col}_P{perc}'] = bands[i, :, j]
+    return df_bands
@@ -4,28 +4,47 @@
 # Contiene le funzioni:
 # - save_to_excel: salva i dati visualizzati sulla dashboard in un file Excel che invia all'utente. E' richiamata dalla
 #   callback che gestisce il pulsante btn-download
+# - write_excel: scrive una cartella Excel in modalità write-only, a blocchi di righe
+# - iter_farm_chunks, split_farm_sheets: producono a blocchi i dati di più aziende e li suddividono tra i fogli Excel
+# - iter_csv, iter_parquet: esportano i blocchi in streaming in formato CSV o Parquet (con pyarrow, opzionale).
+#   Sono richiamate, insieme a write_excel, dagli endpoint di esportazione del modulo interface.routes
+# - StreamSink: file in scrittura che accumula i byte scritti fino al loro prelievo (per lo streaming del Parquet)
+# - table_rows: restituisce le righe di una tabella del report (tabella colonnare o DataFrame già formattato)
 # - format_data_table: formatta per la visualizzazione su PDF i dati della tabella che gli viene passata come parametro.
 #   E' richiamata dalla funzione create_pdf_report 
+# - image_reader: restituisce l'immagine di un grafico (già convertito in PNG o da convertire) pronta per il PDF
 # - add_section: inserisce una sezione nel report PDF
 #   E' richiamata dalla funzione create_pdf_report
+# - cover_assets, draw_cover_page: caricano una sola volta gli elementi fissi della copertina (logo e titoli) e
+#   disegnano la copertina del report. Sono richiamate dalla funzione create_pdf_report
 # - create_pdf_report: crea un report PDF contenente i dati visualizzati nella dashboard. E' richiamata dalla callback
 #   che gestisce il pulsante btn--generate-report
 
 # Importazione delle librerie necessarie
-import os, io # per la gestione dei flussi di I/O (ad esempio gestione dei file in memoria)
+import os, io, functools # per la gestione dei flussi di I/O (ad esempio gestione dei file in memoria) e della cache
 import plotly.io as pio # per la gestione di I/O grafici (ad esempio salvare i grafici come immagini)
-import pandas as pd # per la gestione dei DataFrame
 from datetime import datetime # per gestire date ed orari
-from dash import dcc # per generare file Excel
+from dash import dcc # per inviare i file all'utente
+from openpyxl import Workbook # per generare file Excel in modalità write-only
 # Importazione degli strumenti di ReportLab per la generazione dei file PDF
 from reportlab.lib.pagesizes import A4 # specifica le dimensioni standard del foglio A4 (per generare report PDF)
 from reportlab.pdfgen import canvas # per gestire gli oggetti canvas utili nella generazione dei PDF
 from reportlab.lib import colors # per gestire i colori nei PDF
 from reportlab.platypus import Table, TableStyle # per creare e stilizzare le tabelle nei PDF
 from reportlab.lib.utils import ImageReader # per gestire le immagini nei PDF
+from reportlab.pdfbase import pdfmetrics # per calcolare la larghezza dei testi
+from data_tools.rasterize import render_figures # per convertire in parallelo i grafici in immagini
+from data_tools.metrics import timed # per misurare i tempi delle funzioni richiamate dalle callback
+from data_tools.rng import spawn_seeds # per i flussi casuali dei blocchi di aziende esportati
+from data_tools.frame import ColumnFrame # tabelle colonnari dei dati visualizzati
+from data_tools.data_simulator import simulate_farms, env_cols, prod_cols, perf_cols # per i dati multi-azienda da esportare
 from interface.labels import col_mapping_pdf # per tradurre in italiano le etichette di colonna da visualizzare nei repor
 
-# Stile delle tabelle del report PDF
+# Titoli della copertina del report PDF
+cover_title = "Tenuta Agricola NomeAzienda"
+cover_subtitle = "Monitoraggio delle Prestazioni Aziendali"
+
+# Stile delle tabelle del report PDF (condiviso da tutte le tabelle di tutti i report)
 table_style = TableStyle([ 
     ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#325d88')),
     ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
@@ -37,15 +56,135 @@ table_style = TableStyle([
     ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),  # Centra verticalmente
 ])
 
+# Numero di righe per blocco nelle esportazioni in streaming e numero massimo di righe di un foglio Excel
+export_chunk_rows = 10000
+excel_max_rows = 1048576
+
+# Fogli delle esportazioni: nome del foglio e colonne (oltre a Year) del DataFrame di ciascun tipo di dato
+export_sheets = {
+    'Dati Ambientali': env_cols,
+    'Dati di Produzione': prod_cols,
+    'Dati di Performance': perf_cols,
+}
+
+# Funzione che scrive una cartella Excel a partire da una sequenza di blocchi (nome del foglio, DataFrame), anche di
+# fogli diversi alternati tra loro (ad esempio i dati di più aziende prodotti a blocchi). Usa la modalità write-only di
+# openpyxl: le righe vengono scritte a blocchi in file temporanei dei fogli e non restano in memoria come oggetti
+# Python. La cartella (un archivio zip) viene però composta solo al termine, in target: il file non può essere inviato
+# prima di essere completo. I fogli che superano il limite di righe di Excel proseguono in fogli numerati
+# ("Dati Ambientali (2)", ...). I blocchi sono DataFrame o tabelle colonnari (ColumnFrame).
+# target è un percorso o un file aperto in scrittura binaria
+def write_excel(blocks, target):
+    workbook = Workbook(write_only=True)
+    sheets = {} # nome -> [foglio corrente, righe scritte, parte]
+    for name, chunk in blocks:
+        start = 0
+        while True:
+            state = sheets.get(name)
+            # Nuovo foglio (con intestazione) al primo blocco o al raggiungimento del limite di righe
+            if state is None or (state[1] >= excel_max_rows and start < len(chunk)):
+                part = 1 if state is None else state[2] + 1
+                sheet = workbook.create_sheet(name if part == 1 else f'{name} ({part})')
+                sheet.append([str(col) for col in chunk.columns])
+                state = sheets[name] = [sheet, 1, part]
+            if start >= len(chunk):
+                break
+            stop = min(len(chunk), start + min(export_chunk_rows, excel_max_rows - state[1]))
+            if isinstance(chunk, ColumnFrame):
+                rows = chunk.rows(start, stop)
+            else:
+                rows = chunk.iloc[start:stop].itertuples(index=False, name=None)
+            for row in rows:
+                state[0].append(row)
+            state[1] += stop - start
+            start = stop
+    workbook.save(target)
+
 # Funzione che salva i dati visualizzati sulla dashboard in un file Excel
+# I dati sono tabelle colonnari (ColumnFrame), DataFrame o elenchi di record
+# Il file viene scritto nel buffer in memoria di dcc.send_bytes, che lo codifica in base64 nella risposta della
+# callback: l'occupazione di memoria cresce con la dimensione del file. Va bene per i dati di una sola azienda; per
+# i dati di molte aziende si usano gli endpoint di esportazione (interface.routes)
+@timed()
 def save_to_excel(env_data, prod_data, perf_data):
-    output = io.BytesIO() # Crea un buffer in memoria senza la necessità di creare file temporanei
-    with pd.ExcelWriter(output, engine='openpyxl') as writer: # Crea un oggetto Pandas utilizzando il buffer
-        pd.DataFrame(env_data).to_excel(writer, sheet_name='Dati Ambientali', index=False) 
-        pd.DataFrame(prod_data).to_excel(writer, sheet_name='Dati di Produzione', index=False)
-        pd.DataFrame(perf_data).to_excel(writer, sheet_name='Dati di Performance', index=False)
-    output.seek(0) # Riporta il puntatore all'inizio del buffer
-    return dcc.send_bytes(output.getvalue(), "dati_completi.xlsx") # Restituisce il buffer come file Excel
+    blocks = list(zip(export_sheets, [ColumnFrame.coerce(data) for data in (env_data, prod_data, perf_data)]))
+    return dcc.send_bytes(lambda buffer: write_excel(blocks, buffer), "dati_completi.xlsx") # Restituisce il file Excel
+
+# Funzione che simula un insieme di aziende a blocchi di chunk_farms aziende e restituisce i DataFrame in formato lungo
+# (farm_id, Year e tutte le colonne) un blocco alla volta: i dati di centinaia di migliaia di righe vengono prodotti
+# ed esportati senza mai essere tutti in memoria. Ogni blocco riceve un flusso casuale indipendente derivato da seed
+def iter_farm_chunks(df_farms, seed=None, chunk_farms=1000):
+    n_chunks = max(1, -(-len(df_farms) // chunk_farms))
+    for i, chunk_seed in enumerate(spawn_seeds(seed, n_chunks)):
+        yield simulate_farms(df_farms.iloc[i * chunk_farms:(i + 1) * chunk_farms], seed=chunk_seed)
+
+# Funzione che suddivide ogni blocco in formato lungo nei fogli dell'esportazione Excel (ambientali, produzione,
+# performance), mantenendo farm_id e Year in ciascun foglio. Restituisce i blocchi (nome del foglio, DataFrame) da
+# passare a write_excel
+def split_farm_sheets(chunks):
+    for chunk in chunks:
+        for name, cols in export_sheets.items():
+            yield name, chunk[['farm_id', 'Year'] + cols]
+
+# Funzione che restituisce i blocchi di DataFrame in formato CSV, un pezzo di testo alla volta (intestazione inclusa nel
+# primo pezzo). Può essere inviata direttamente come risposta in streaming
+def iter_csv(chunks):
+    header = True
+    for chunk in chunks:
+        for start in range(0, len(chunk), export_chunk_rows):
+            yield chunk.iloc[start:start + export_chunk_rows].to_csv(index=False, header=header)
+            header = False
+
+# Classe che rappresenta un file in scrittura che accumula i byte scritti fino al loro prelievo (drain), tenendo il
+# conto della posizione complessiva (usata dallo scrittore Parquet per gli offset del footer)
+class StreamSink:
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    # Restituisce i byte scritti dall'ultimo prelievo
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+# Funzione che restituisce i blocchi di DataFrame in formato Parquet (un row group per blocco, con pyarrow), un pezzo
+# di file alla volta: ogni row group viene inviato appena scritto e il footer alla fine. In memoria resta solo il
+# blocco corrente. Può essere inviata direttamente come risposta in streaming
+# pyarrow è una dipendenza opzionale: chi la richiama ne verifica prima la disponibilità
+def iter_parquet(chunks):
+    import pyarrow as pa, pyarrow.parquet as pq # dipendenza opzionale, importata solo quando serve
+    sink = StreamSink()
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema, compression='zstd')
+            writer.write_table(table)
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
 
 # Funzione che formatta i dati di una tabella:
 # - La colonna 'Year' senza decimali
@@ -59,7 +198,24 @@ def format_table_data(df):
             formatted_df[col] = formatted_df[col].apply(lambda x: f"{x:.3f}" if isinstance(x, (int, float)) else x)
     return formatted_df
 
+# Funzione che restituisce le righe di una tabella del report (intestazione e valori): le tabelle colonnari vengono
+# formattate come format_table_data, i DataFrame sono già formattati
+def table_rows(table):
+    if isinstance(table, ColumnFrame):
+        return table.to_text_rows()
+    return [list(table.columns)] + table.values.tolist()
+
+# Funzione che restituisce l'immagine di un grafico pronta per essere inserita nel PDF
+# Il grafico può essere già convertito in PNG (byte restituiti da render_figures) oppure una figura da convertire
+def image_reader(graph):
+    if not isinstance(graph, (bytes, bytearray)):
+        img_buffer = io.BytesIO() # Crea un buffer per immagazzinare l'immagine del grafico
+        pio.write_image(graph, img_buffer, format="png") # Scrive l'immagine nel buffer
+        graph = img_buffer.getvalue()
+    return ImageReader(io.BytesIO(graph))
+
 # Funzione che inserisce una sezione nel report PDF
+# graph può essere l'immagine PNG del grafico (in byte) oppure la figura da convertire
 def add_section(pdf, width, height, y_position, title, graph, table_data, last_section=False):
     # Aggiungi il titolo della sezione
     pdf.setFont("Helvetica-Bold", 12)
@@ -68,11 +224,7 @@ def add_section(pdf, width, height, y_position, title, graph, table_data, last_s
 
     # Aggiungi il grafico
     if graph is not None:
-        img_buffer = io.BytesIO() # Crea un buffer per immagazzinare l'immagine del grafico
-        pio.write_image(graph, img_buffer, format="png") # Scrive l'immagine nel buffer
-        img_buffer.seek(0) # Riporta il puntatore del buffer all'inizio
-
-        img_reader = ImageReader(img_buffer) # Crea un oggetto per leggere i dati del buffer
+        img_reader = image_reader(graph) # Crea un oggetto per leggere l'immagine del grafico
         img_width, img_height = img_reader.getSize() # Recupera i valori delle dimensioni dell'immagine
 
         # Calcola le proporzioni
@@ -114,45 +266,39 @@ def add_section(pdf, width, height, y_position, title, graph, table_data, last_s
 
     return y_position
 
-# Funzione per creare un report PDF con i grafici e le tabelle visualizzate al momento
-def create_pdf_report(graphs, tables):
-    buffer = io.BytesIO() # Crea un buffer per immagazzinare il PDF
-    pdf = canvas.Canvas(buffer, pagesize=A4) # Crea un oggetto Canvas per generare il PDF
-    width, height = A4 # Imposta le dimensioni della pagina
+# Funzione che carica (una sola volta per processo) gli elementi fissi della copertina del report: il logo già
+# decodificato e le larghezze dei titoli. I report successivi, anche generati in batch, li riutilizzano
+@functools.lru_cache(maxsize=1)
+def cover_assets():
+    logo_path = os.path.join(os.getcwd(), "assets", "logo300x300.jpg")
+    logo_reader = ImageReader(logo_path)
+    logo_width, logo_height = logo_reader.getSize()
+    return {
+        'logo': logo_reader,
+        'logo_aspect_ratio': logo_height / logo_width,
+        'title_width': pdfmetrics.stringWidth(cover_title, "Helvetica-Bold", 18),
+        'subtitle_width': pdfmetrics.stringWidth(cover_subtitle, "Helvetica-Bold", 14),
+    }
+
+# Funzione che disegna la copertina del report (logo, titoli e data di creazione) e passa alla pagina successiva
+def draw_cover_page(pdf, width, height, generated_at):
+    assets = cover_assets()
 
     # Data e ora di creazione del report
-    current_datetime = datetime.now()
-    date_str = current_datetime.strftime("%d/%m/%Y")  # Data nel formato gg/mm/aaaa
-    time_str = current_datetime.strftime("%H:%M")  # Ora nel formato hh:mm
-
-    # Prima pagina con testo centrato verticalmente
-    pdf.setFont("Helvetica-Bold", 18)
-    title = "Tenuta Agricola NomeAzienda"
-    title_width = pdf.stringWidth(title, "Helvetica-Bold", 18)
-
-    pdf.setFont("Helvetica-Bold", 14)
-    subtitle = "Monitoraggio delle Prestazioni Aziendali"
-    subtitle_width = pdf.stringWidth(subtitle, "Helvetica-Bold", 14)
-
-    pdf.setFont("Helvetica", 10)
+    date_str = generated_at.strftime("%d/%m/%Y")  # Data nel formato gg/mm/aaaa
+    time_str = generated_at.strftime("%H:%M")  # Ora nel formato hh:mm
     datetime_text = f"Report Generato il {date_str} alle ore {time_str}"
     datetime_width = pdf.stringWidth(datetime_text, "Helvetica", 10)
 
-    # Carica il logo
-    logo_path = os.path.join(os.getcwd(), "assets", "logo300x300.jpg")
-    img_reader = ImageReader(logo_path)
-    img_width, img_height = img_reader.getSize()
-
     # Dimensioni e posizione del logo
     custom_width = 160
-    aspect_ratio = img_height / img_width
-    custom_height = custom_width * aspect_ratio
+    custom_height = custom_width * assets['logo_aspect_ratio']
 
     logo_x = (width - custom_width) / 2
     logo_y = height / 2 + 80  # Posiziona sopra il titolo
 
     # Disegna il logo
-    pdf.drawImage(img_reader, logo_x, logo_y, custom_width, custom_height)
+    pdf.drawImage(assets['logo'], logo_x, logo_y, custom_width, custom_height)
 
     # Calcola la posizione verticale centrata
     total_text_height = 18 + 14 + 10 + 20  # Altezza cumulativa dei testi con spaziatura
@@ -160,10 +306,10 @@ def create_pdf_report(graphs, tables):
 
     # Scrivi il testo
     pdf.setFont("Helvetica-Bold", 18)
-    pdf.drawString((width - title_width) / 2, vertical_center, title)
+    pdf.drawString((width - assets['title_width']) / 2, vertical_center, cover_title)
 
     pdf.setFont("Helvetica-Bold", 14)
-    pdf.drawString((width - subtitle_width) / 2, vertical_center - 30, subtitle)
+    pdf.drawString((width - assets['subtitle_width']) / 2, vertical_center - 30, cover_subtitle)
 
     pdf.setFont("Helvetica", 10)
     pdf.drawString((width - datetime_width) / 2, vertical_center - 60, datetime_text)
@@ -171,17 +317,43 @@ def create_pdf_report(graphs, tables):
     # Disegna una linea sotto il testo
     pdf.line(50, vertical_center - 80, width - 50, vertical_center - 80)
 
+# Numero di passi di avanzamento della generazione del report (conversione dei grafici, cinque sezioni e salvataggio)
+report_steps = 7
+
+# Funzione per creare un report PDF con i grafici e le tabelle visualizzate al momento
+# on_progress (opzionale) viene richiamata al termine di ogni passo con il numero di passi completati e quello totale
+# generated_at (opzionale) è la data di creazione riportata in copertina (di default l'istante corrente)
+@timed()
+def create_pdf_report(graphs, tables, on_progress=None, generated_at=None):
+    # Funzione interna che notifica l'avanzamento
+    def progress(step):
+        if on_progress is not None:
+            on_progress(step, report_steps)
+
+    # Converte in parallelo tutti i grafici in immagini PNG: il tempo di questa fase è quello del grafico più lento
+    graphs = render_figures(graphs)
+    progress(1)
+
+    buffer = io.BytesIO() # Crea un buffer per immagazzinare il PDF
+    pdf = canvas.Canvas(buffer, pagesize=A4) # Crea un oggetto Canvas per generare il PDF
+    width, height = A4 # Imposta le dimensioni della pagina
+
+    # Prima pagina (copertina) con logo, titoli e data e ora di creazione del report
+    draw_cover_page(pdf, width, height, generated_at or datetime.now())
+
     # Passa alla pagina successiva
     pdf.showPage()
     y_position = height - 100  # Posizione iniziale del contenuto
 
     # **Sezione 1: Dati Ambientali**
     y_position = add_section(pdf, width, height, y_position, "Dati Ambientali", \
-                             graphs[0], [list(tables[0].columns)] + tables[0].values.tolist())
+                             graphs[0], table_rows(tables[0]))
+    progress(2)
 
     # **Sezione 2: Dati di Produzione**
     y_position = add_section(pdf, width, height, y_position, "Dati di Produzione", \
-                             graphs[1], [list(tables[1].columns)] + tables[1].values.tolist())
+                             graphs[1], table_rows(tables[1]))
+    progress(3)
 
     # **Sezione 3: Dati di Performance (con due grafici affiancati)**
     y_position = height - 100  # Imposta y_position per la nuova pagina
@@ -192,16 +364,8 @@ def create_pdf_report(graphs, tables):
     y_position -= 10  # Distanza extra tra il titolo e i grafici
 
     if graphs[2] and graphs[3]: # Se i grafici sono quelli di performance
-        img_buffer1 = io.BytesIO()
-        pio.write_image(graphs[2], img_buffer1, format="png")
-        img_buffer1.seek(0)
-
-        img_buffer2 = io.BytesIO()
-        pio.write_image(graphs[3], img_buffer2, format="png")
-        img_buffer2.seek(0)
-
-        img_reader1 = ImageReader(img_buffer1)
-        img_reader2 = ImageReader(img_buffer2)
+        img_reader1 = image_reader(graphs[2])
+        img_reader2 = image_reader(graphs[3])
 
         img_width1, img_height1 = img_reader1.getSize()
         img_width2, img_height2 = img_reader2.getSize()
@@ -232,25 +396,28 @@ def create_pdf_report(graphs, tables):
 
     # Aggiungi la tabella dei dati di performance
     if tables[2] is not None:
-        table_data = [list(tables[2].columns)] + tables[2].values.tolist()
+        table_data = table_rows(tables[2])
         table_data_with_labels = [[col_mapping_pdf.get(col, col) for col in row] for row in table_data]  # Mappa le colonne
         table = Table(table_data_with_labels, colWidths=[(width - 100) / len(table_data[0])] * len(table_data[0]))
         table.setStyle(table_style)  # Usa la variabile table_style definita all'inizio del modulo
         table.wrapOn(pdf, width - 100, y_position)
         table.drawOn(pdf, 50, y_position - 150)
         y_position -= 200
+    progress(4)
 
     # **Sezione 4: Dati Previsionali quinquennio (su nuova pagina)**
     pdf.showPage()  # Crea nuova pagina
     y_position = height - 100  # Imposta y_position per la nuova pagina
-    y_position = add_section(pdf, width, height, y_position, "Dati Previsionali", graphs[4], [list(tables[3].columns)] \
-                             + tables[3].values.tolist())
+    y_position = add_section(pdf, width, height, y_position, "Dati Previsionali", graphs[4], table_rows(tables[3]))
+    progress(5)
 
     # **Sezione 5: Dati di previsione in  funzione dei dati ambientali**
-    y_position = add_section(pdf, width, height, y_position, "Dati di Previsione in funzione delle condizioni ambientali", graphs[5], [list(tables[4].columns)] \
-                             + tables[4].values.tolist(), last_section=True)
+    y_position = add_section(pdf, width, height, y_position, "Dati di Previsione in funzione delle condizioni ambientali", graphs[5], table_rows(tables[4]), \
+                             last_section=True)
+    progress(6)
 
     # Salva il PDF
     pdf.save()
     buffer.seek(0)
+    progress(7)
     return buffer
\ No newline at end of file
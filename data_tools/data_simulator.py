@@ -1,19 +1,31 @@
 # data_simulator.py
 
 # E' il motore di simulazione della dashboard
+# Tutte le funzioni accettano un generatore di numeri casuali esplicito (parametro rng o seed, vedi data_tools.rng);
+# se non viene indicato se ne crea uno nuovo, inizializzato con l'entropia del sistema.
 # Contiene le funzioni:
+# - simulate_farms: motore di simulazione multi-azienda. Riceve una tabella di parametri delle aziende (superficie, limiti
+#   climatici, intervalli di crescita e di scarto) e simula dati ambientali, di produzione e di performance di tutte le
+#   aziende in un'unica elaborazione vettoriale, restituendo un DataFrame in formato lungo per (farm_id, Year)
+# - default_farms: crea la tabella dei parametri dell'azienda di riferimento (25 ettari in provincia di Catania)
+# - simulate_env_arrays, calc_production_arrays, calc_performance_arrays: nuclei vettoriali del motore
 # - generate_random_data: genera dati casuali ambientali, di produzione e di performance. E' richiamata dalle callbacks
 #   al caricamento dell'app e all'azione sul pulsante btn-random
 # - calc_production: calcola gli indicatori di produzione basandosi sui dati ambientali. E' richiamata dalla
 #   funzione generate_custom_data(params) del modulo data_tools.data.py
 # - calc_performance: calcola gli indicatori di performance economica basandosi sui dati di produzione ed ambientali.
 #   E' richiamata dalla funzione load_initial_data() del modulo data_tools.data.py
-# - yield_simulate: simula la resa della coltivazione in funzione dei parametri ambientali. E' una funzione interna
-#   di questo modulo ed è richiamata dalla funzione generate_random_data
+# - yield_simulate: simula la resa della coltivazione in funzione dei parametri ambientali per un singolo anno.
+#   E' mantenuta per compatibilità e per il calcolo puntuale
+# - yield_simulate_batch: versione vettoriale di yield_simulate, calcola in un solo passaggio la resa per interi
+#   array di temperatura, umidità e precipitazioni. E' richiamata dalla funzione calc_production
 
 # Importazione delle librerie necessarie
 import numpy as np  # per operazioni numeriche e generazione di valori casuali
 import pandas as pd  # per la gestione dei DataFrame
+from data_tools.rng import make_rng, spawn_rngs, StackedStreams # per i generatori di numeri casuali espliciti
+from data_tools.memo import memoize # per memorizzare i risultati a parità di seme
+from data_tools.metrics import timed # per misurare i tempi delle funzioni richiamate dalle callback
 
 # Impostazione parametri di riferimento
 years = np.arange(2020, 2025) # Intervallo di tempo considerato
@@ -25,108 +37,185 @@ growth_limits = [180, 210] # Intervallo medio di giorni di crescita del prodotto
 growth_average = sum(growth_limits)/len(growth_limits) # Giorni medi di crescita
 waste_limits = [2, 10] # Percentuale di scarto nella raccolta (tra il 2% e il 10%)
 waste_average = sum(waste_limits)/len(waste_limits) # Percentuale di scarto media
+# Parametri (media, deviazione standard) della resa per ettaro nei tre regimi di temperatura usati da yield_simulate:
+# freddo (< 10°C), ottimale (10-30°C) e caldo (> 30°C)
+yield_regimes = {'cold': (0.8, 0.2), 'optimal': (3.0, 0.4), 'hot': (1.5, 0.3)}
 
-# Funzione che genera dati casuali ambientali, di produzione e di performance
-def generate_random_data():
+# Colonne della tabella dei parametri delle aziende (una riga per azienda) usata dal motore multi-azienda
+farm_param_cols = ['area_hectares', 'temp_min', 'temp_max', 'humid_min', 'humid_max', 'precip_min', 'precip_max',
+                   'growth_min', 'growth_max', 'waste_min', 'waste_max']
+# Colonne dei dati ambientali, di produzione e di performance prodotti dal motore
+env_cols = ['Temperature', 'Humidity', 'Precipitation']
+prod_cols = ['Growth_Days', 'Yield', 'Water_Consumption', 'Fertilizer_Consumption']
+perf_cols = ['Total_Cost', 'Total_Price', 'Gain', 'Profit_Margin', 'Efficiency', 'Env_Sustain']
+
+# Funzione che crea la tabella dei parametri per n_farms aziende uguali a quella di riferimento definita nel modulo
+def default_farms(n_farms=1):
+    return pd.DataFrame({
+        'farm_id': np.arange(n_farms),
+        'area_hectares': area_hectares,
+        'temp_min': temp_limits[0], 'temp_max': temp_limits[1],
+        'humid_min': humid_limits[0], 'humid_max': humid_limits[1],
+        'precip_min': precip_limits[0], 'precip_max': precip_limits[1],
+        'growth_min': growth_limits[0], 'growth_max': growth_limits[1],
+        'waste_min': waste_limits[0], 'waste_max': waste_limits[1],
+    })
+
+# Motore di simulazione multi-azienda
+# Riceve la tabella dei parametri delle aziende (colonne farm_id e farm_param_cols, vedi default_farms) e simula in
+# un'unica elaborazione vettoriale dati ambientali, di produzione e di performance di tutte le aziende per tutti gli anni.
+# Se viene passato df_env (formato lungo con colonne farm_id, Year, Temperature, Humidity, Precipitation) i dati
+# ambientali non vengono generati ma letti da lì.
+# Ogni azienda riceve un flusso casuale indipendente derivato da seed: a parità di seme i risultati di un'azienda
+# non dipendono da quante altre aziende vengono simulate insieme.
+# Restituisce un DataFrame in formato lungo con una riga per coppia (farm_id, Year)
+def simulate_farms(df_farms, sim_years=years, df_env=None, seed=None):
+    df_farms = df_farms.reset_index(drop=True)
+    farm_rngs = spawn_rngs(seed, len(df_farms))
+    if df_env is None:
+        # Una riga per ogni coppia (azienda, anno)
+        farm_idx = np.repeat(np.arange(len(df_farms)), len(sim_years))
+        df = pd.DataFrame({'farm_id': df_farms['farm_id'].to_numpy()[farm_idx], 'Year': np.tile(sim_years, len(df_farms))})
+        params = df_farms.iloc[farm_idx]
+        rng = StackedStreams(farm_rngs, len(sim_years))
+        temperatures, humidities, precipitations = simulate_env_arrays(params, len(df_farms), len(sim_years), rng)
+        df['Temperature'], df['Humidity'], df['Precipitation'] = temperatures, humidities, precipitations
+    else:
+        # Dati ambientali forniti: si associano ad ogni riga i parametri della relativa azienda
+        df = df_env[['farm_id', 'Year'] + env_cols]
+        # Le righe vengono ordinate come le aziende di df_farms (e per anno): ogni flusso casuale è usato per un
+        # blocco di righe consecutive, per cui servono aziende con lo stesso numero di anni
+        farm_pos = pd.Series(np.arange(len(df_farms)), index=df_farms['farm_id'])
+        order = np.lexsort((df['Year'].to_numpy(), farm_pos.loc[df['farm_id']].to_numpy()))
+        df = df.iloc[order].reset_index(drop=True)
+        params = df_farms.set_index('farm_id').loc[df['farm_id']].reset_index()
+        block_sizes = df.groupby('farm_id', sort=False).size().reindex(df_farms['farm_id'], fill_value=0).to_numpy()
+        if (block_sizes != block_sizes[0]).any():
+            raise ValueError("df_env deve contenere lo stesso numero di anni per ogni azienda di df_farms")
+        rng = StackedStreams(farm_rngs, int(block_sizes[0]))
+
+    # Produzione e performance calcolate riga per riga con operazioni sugli array
+    prod = calc_production_arrays(df['Temperature'].to_numpy(), df['Humidity'].to_numpy(), df['Precipitation'].to_numpy(),
+                                  params['area_hectares'].to_numpy(),
+                                  (params['growth_min'].to_numpy() + params['growth_max'].to_numpy()) / 2,
+                                  (params['waste_min'].to_numpy() + params['waste_max'].to_numpy()) / 2, rng)
+    for col, values in zip(prod_cols, prod):
+        df[col] = values
+    perf = calc_performance_arrays(df['Yield'].to_numpy(), df['Water_Consumption'].to_numpy(),
+                                   df['Fertilizer_Consumption'].to_numpy(), params['area_hectares'].to_numpy(), rng)
+    for col, values in zip(perf_cols, perf):
+        df[col] = values
+    return df
+
+# Funzione che genera i dati ambientali per tutte le righe (azienda, anno) del motore multi-azienda
+# params contiene i parametri dell'azienda ripetuti per ogni anno (n_farms blocchi consecutivi di n_years righe)
+def simulate_env_arrays(params, n_farms, n_years, rng=None):
+    rng = make_rng(rng)
+    n_rows = n_farms * n_years
     # temperatura - viene previsto un aumento graduale a causa del progressivo surriscaldamento globale
-    temperatures = np.random.uniform(temp_limits[0], temp_limits[1], size=len(years)) + np.linspace(0, 3, len(years))
+    temperatures = rng.uniform(params['temp_min'].to_numpy(), params['temp_max'].to_numpy(), size=n_rows) \
+        + np.tile(np.linspace(0, 3, n_years), n_farms)
     # umidità
-    humidities = np.random.uniform(humid_limits[0], humid_limits[1], size=len(years))
+    humidities = rng.uniform(params['humid_min'].to_numpy(), params['humid_max'].to_numpy(), size=n_rows)
     # precipitazioni - viene previsto un decremento graduale a causa del progressivo fenomeno di desertificazione
-    precipitations = np.random.uniform(precip_limits[0], precip_limits[1], size=len(years)) - np.linspace(0, 100, len(years))
-
-    # Creazione del DataFrame che raccoglie la temperatura, l'umidità e le precipitazioni per ogni anno
-    df_env = pd.DataFrame({
-        'Year': years,
-        'Temperature': np.clip(temperatures, 5, 40),  # Temperatura limitata tra 5°C e 40°C
-        'Humidity': humidities,
-        'Precipitation': precipitations
-    })
-	
-    # Calcolo dei dati di produzione basati sui dati ambientali generati randomicamente
-    growth_days, total_yield, water_consumption, fertilizer_consumption = calc_production(df_env)
-
-    # Raccolta dei dati di produzione in un DataFrame
-    df_prod = pd.DataFrame({
-        'Year': df_env['Year'],
-        'Growth_Days': growth_days,
-        'Yield': total_yield,
-        'Water_Consumption': water_consumption,
-        'Fertilizer_Consumption': fertilizer_consumption
-    })    
-
-    # Calcolo dei dati di performance basati sui dati ambientali e di produzione generati randomicamente
-    df_perf = calc_performance(df_prod, df_env)
+    precipitations = rng.uniform(params['precip_min'].to_numpy(), params['precip_max'].to_numpy(), size=n_rows) \
+        - np.tile(np.linspace(0, 100, n_years), n_farms)
+    # Temperatura limitata tra 5°C e 40°C
+    return np.clip(temperatures, 5, 40), humidities, precipitations
 
-    # I DataFrame vengono restituiti
-    return df_env, df_prod, df_perf.round(3)
-
-# Funzione che calcola gli indicatori di produzione in funzione dei dati ambientali
-def calc_production(df_env):
+# Funzione che calcola gli indicatori di produzione per array di dati ambientali
+# area, growth_avg e waste_avg possono essere scalari (una sola azienda) o array con un valore per riga
+def calc_production_arrays(temps, humidities, precips, area, growth_avg, waste_avg, rng=None):
+    rng = make_rng(rng)
+    n_rows = len(temps)
     # Giorni di crescita (tipicamente tra 180 e 210 giorni per le olive)
-    growth_days = np.random.normal(growth_average, 10, len(df_env))
+    growth_days = rng.normal(growth_avg, 10, n_rows)
     # Percentuale di scarto nella raccolta, che può essere tra il 2% e il 10%
-    waste_percentage = np.random.normal(waste_average, 1, size=len(df_env))
-    # Calcolo della resa per ettaro in base alla temperatura
-    yield_values = np.array([yield_simulate(temp, humidity, precip) for temp, humidity, precip in zip(df_env['Temperature'], df_env['Humidity'], df_env['Precipitation'])])
+    waste_percentage = rng.normal(waste_avg, 1, size=n_rows)
+    # Calcolo della resa per ettaro in base alla temperatura (un'unica chiamata vettoriale per tutte le righe)
+    yield_values = yield_simulate_batch(temps, humidities, precips, rng)
     # Resa totale considerando l'area e lo scarto
-    total_yield = yield_values * area_hectares * (100 - waste_percentage) / 100
+    total_yield = yield_values * area * (100 - waste_percentage) / 100
     # Stima del fabbisogno idrico in funzione delle variabili ambientali
     # Viene applicato un modello lineare e alcuni vincoli di modo che il consumo d'acqua (per l'irrigazione) venga calcolato 
     # con un incremento se le temperature sono più alte, con un decremento se aumentano le precipitazioni
-    water_consumption = np.clip(100 + 0.3 * df_env['Temperature'] - 0.2 * df_env['Precipitation'], 30, 250) * area_hectares / 10
+    water_consumption = np.clip(100 + 0.3 * np.asarray(temps) - 0.2 * np.asarray(precips), 30, 250) * area / 10
     # Consumo di fertilizzante, valore medio per ettaro tra 60 e 100 kg
-    fertilizer_consumption = np.random.normal(80, 15, len(df_env))
+    fertilizer_consumption = rng.normal(80, 15, n_rows)
 
     return growth_days, total_yield, water_consumption, fertilizer_consumption
 
-# Funzione che calcola gli indicatori di performance economica basandosi sui dati di produzione ed ambientali
-def calc_performance(df_prod, df_env):
-    # Creazione di un DataFrame per gli indicatori
-    df_perf = pd.DataFrame(index=df_env.index)
-    
+# Funzione che calcola gli indicatori di performance economica per array di dati di produzione
+# area può essere uno scalare (una sola azienda) o un array con un valore per riga
+def calc_performance_arrays(yields, water, fertilizer, area, rng=None):
+    rng = make_rng(rng)
+    n_rows = len(yields)
     # Prezzo per kg di prodotto (olive)
-    prices_per_unit = np.random.uniform(1, 3, size=5)
+    prices_per_unit = rng.uniform(1, 3, size=n_rows)
     # Costi per unità di acqua e fertilizzante
-    cost_per_water_unit = np.random.normal(loc=8, scale=2, size=5)  # Costo per m3 di acqua
-    cost_per_fertilizer_unit = np.random.normal(loc=12, scale=3, size=5)  # Costo per kg di fertilizzante
-    
-    # Calcolo dei ricavi dalla vendita delle olive per un terreno coltivato di superficie data (area_hectares)
+    cost_per_water_unit = rng.normal(loc=8, scale=2, size=n_rows)  # Costo per m3 di acqua
+    cost_per_fertilizer_unit = rng.normal(loc=12, scale=3, size=n_rows)  # Costo per kg di fertilizzante
+
+    # Calcolo dei ricavi dalla vendita delle olive per un terreno coltivato di superficie data (area)
     # I ricavi sono basati sulla resa e sul prezzo casuale per kg di prodotto
-    revenue = df_prod['Yield'] * prices_per_unit * area_hectares
+    revenue = yields * prices_per_unit * area
     # Calcolo dei costi totali per acqua e fertilizzante
-    costs = (df_prod['Water_Consumption'] * cost_per_water_unit) + (df_prod['Fertilizer_Consumption'] * cost_per_fertilizer_unit)
+    costs = (water * cost_per_water_unit) + (fertilizer * cost_per_fertilizer_unit)
     # Calcolo del profitto
     profit = revenue - costs
     # Margine di profitto
     profit_margin = (profit / revenue) * 100
     # Efficienza produttiva (resa per unità di acqua consumate)
-    efficiency = df_prod['Yield'] / df_prod['Water_Consumption']
+    efficiency = yields / water
     # Sostenibilità ambientale (rapporto tra resa e consumo di risorse)
-    env_sustain = (df_prod['Yield'] * 100 / area_hectares) / (df_prod['Water_Consumption'] + df_prod['Fertilizer_Consumption'])
+    env_sustain = (yields * 100 / area) / (water + fertilizer)
+
+    return costs, revenue, profit, profit_margin, efficiency, env_sustain
+
+# Funzione che genera dati casuali ambientali, di produzione e di performance
+# E' una vista sul motore multi-azienda, applicato alla sola azienda di riferimento
+# seed (intero, SeedSequence o Generator): a parità di seme vengono restituiti DataFrame identici (memorizzati in cache)
+@timed()
+@memoize(seed_arg='seed')
+def generate_random_data(seed=None):
+    df = simulate_farms(default_farms(), seed=seed)
+
+    # Suddivisione del risultato nei DataFrame ambientale, di produzione e di performance
+    df_env = df[['Year'] + env_cols]
+    df_prod = df[['Year'] + prod_cols]
+    df_perf = df[['Year'] + perf_cols]
+
+    # I DataFrame vengono restituiti
+    return df_env, df_prod, df_perf.round(3)
+
+# Funzione che calcola gli indicatori di produzione in funzione dei dati ambientali
+# E' una vista sul motore multi-azienda, con i parametri dell'azienda di riferimento
+def calc_production(df_env, rng=None):
+    return calc_production_arrays(df_env['Temperature'].to_numpy(), df_env['Humidity'].to_numpy(),
+                                  df_env['Precipitation'].to_numpy(), area_hectares, growth_average, waste_average, rng)
+
+# Funzione che calcola gli indicatori di performance economica basandosi sui dati di produzione ed ambientali
+# E' una vista sul motore multi-azienda, con i parametri dell'azienda di riferimento
+def calc_performance(df_prod, df_env, rng=None):
+    perf = calc_performance_arrays(df_prod['Yield'].to_numpy(), df_prod['Water_Consumption'].to_numpy(),
+                                   df_prod['Fertilizer_Consumption'].to_numpy(), area_hectares, rng)
 
     # Popolamento del DataFrame con gli indicatori
-    df_perf = pd.DataFrame({
-        'Year': df_prod['Year'],
-        'Total_Cost': costs,
-        'Total_Price': revenue,
-        'Gain': profit,
-        'Profit_Margin': profit_margin,
-        'Efficiency': efficiency,
-        'Env_Sustain': env_sustain,
-    })
+    df_perf = pd.DataFrame(dict(zip(perf_cols, perf)), index=df_prod.index)
+    df_perf.insert(0, 'Year', df_prod['Year'])
     # Il DataFrame viene restituito
     return df_perf.round(3)
 
 # Funzione che simula la resa della coltivazione in funzione dei parametri ambientali
-def yield_simulate(temp, humidity, precip):
+def yield_simulate(temp, humidity, precip, rng=None):
+    rng = make_rng(rng)
     # Gli uilivi producono meno in climi molto freddi o molto caldi
     if temp < 10:
-        yield_temp = np.random.normal(0.8, 0.2)  # resa bassa in condizioni fredde
+        yield_temp = rng.normal(*yield_regimes['cold'])  # resa bassa in condizioni fredde
     elif 10 <= temp <= 30:
-        yield_temp = np.random.normal(3.0, 0.4)  # resa ottimale per la coltivazione
+        yield_temp = rng.normal(*yield_regimes['optimal'])  # resa ottimale per la coltivazione
     else:
-        yield_temp = np.random.normal(1.5, 0.3)  # resa più bassa in condizioni molto calde
+        yield_temp = rng.normal(*yield_regimes['hot'])  # resa più bassa in condizioni molto calde
     
     humidity_factor = 1 + 0.02 * (humidity - 60)  # L'effetto dell'umidità sulla resa
     precip_factor = 1 - 0.001 * (precip - 500)  # L'effetto delle precipitazioni sulla resa
@@ -134,4 +223,24 @@ def yield_simulate(temp, humidity, precip):
     # Calcolo della resa in funzione di temperatura, umidità e precipitazioni
     yield_temp = yield_temp * humidity_factor * precip_factor
     
-    return yield_temp
\ No newline at end of file
+    return yield_temp
+
+# Funzione che simula la resa della coltivazione per interi array di dati ambientali
+# Il regime di temperatura viene scelto tramite maschere sugli array invece che con un if per ogni riga; la resa
+# segue la stessa distribuzione di yield_simulate ma viene estratta con un'unica chiamata a rng.normal
+def yield_simulate_batch(temps, humidities, precips, rng=None):
+    rng = make_rng(rng)
+    temps = np.asarray(temps, dtype=float)
+    # Maschere dei regimi di temperatura (stessi confini di yield_simulate)
+    cold = temps < 10
+    hot = ~cold & ~(temps <= 30)  # come il ramo else di yield_simulate (include eventuali valori mancanti)
+    # Media e deviazione standard della resa scelte riga per riga in base al regime
+    loc = np.where(cold, yield_regimes['cold'][0], np.where(hot, yield_regimes['hot'][0], yield_regimes['optimal'][0]))
+    scale = np.where(cold, yield_regimes['cold'][1], np.where(hot, yield_regimes['hot'][1], yield_regimes['optimal'][1]))
+    yield_temp = rng.normal(loc, scale, size=len(temps))
+
+    humidity_factor = 1 + 0.02 * (np.asarray(humidities, dtype=float) - 60)  # L'effetto dell'umidità sulla resa
+    precip_factor = 1 - 0.001 * (np.asarray(precips, dtype=float) - 500)  # L'effetto delle precipitazioni sulla resa
+
+    # Calcolo della resa in funzione di temperatura, umidità e precipitazioni
+    return yield_temp * humidity_factor * precip_factor
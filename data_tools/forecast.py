@@ -0,0 +1,140 @@
+# forecast.py
+
+# Motore di calcolo dei modelli previsionali lineari.
+# Sostituisce i singoli stimatori LinearRegression di scikit-learn con una soluzione in forma chiusa ai minimi quadrati:
+# tutte le variabili obiettivo che condividono la stessa matrice di progetto vengono risolte con un'unica operazione,
+# e più aziende o scenari possono essere addestrati insieme impilandoli lungo le dimensioni iniziali degli array.
+# Contiene le funzioni:
+# - fit_linear: addestra un modello lineare (con intercetta) multi-output, anche su batch di problemi impilati.
+#   E' richiamata dalla funzione fit_future_arrays del modulo data_tools.data.py
+# - fit_ridge: come fit_linear, con regolarizzazione L2 (ridge)
+# - predict_linear: applica coefficienti e intercette stimati da fit_linear a nuovi dati
+# - OnlineLinear: versione incrementale di fit_linear, che aggiorna le statistiche sufficienti (XᵀX, XᵀY) man mano
+#   che arrivano nuovi dati e risolve il modello in tempo costante
+
+# Importazione delle librerie necessarie
+import numpy as np # per le operazioni di algebra lineare sugli array
+
+# Funzione che addestra un modello lineare con intercetta ai minimi quadrati
+# X: matrice di progetto di forma (..., campioni, variabili); Y: obiettivi di forma (..., campioni, obiettivi) oppure
+# (..., campioni) per un solo obiettivo. Le dimensioni iniziali (...) rappresentano il batch (aziende, scenari, etc.).
+# Come LinearRegression, i dati vengono centrati e viene calcolata la soluzione di norma minima tramite pseudo-inversa
+# (SVD), per cui anche i problemi con matrice non a rango pieno danno lo stesso risultato di scikit-learn.
+# Restituisce i coefficienti (..., variabili, obiettivi) e le intercette (..., obiettivi)
+def fit_linear(X, Y):
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    single_target = Y.ndim == X.ndim - 1
+    if single_target:
+        Y = Y[..., None]
+
+    # Centratura dei dati (l'intercetta si ricava dalle medie)
+    x_mean = X.mean(axis=-2, keepdims=True)
+    y_mean = Y.mean(axis=-2, keepdims=True)
+    # Un'unica pseudo-inversa per tutti gli obiettivi (e per tutti i problemi del batch)
+    coef = np.linalg.pinv(X - x_mean) @ (Y - y_mean)
+    intercept = (y_mean - x_mean @ coef)[..., 0, :]
+
+    if single_target:
+        return coef[..., 0], intercept[..., 0]
+    return coef, intercept
+
+# Funzione che addestra un modello lineare con intercetta e regolarizzazione L2 (ridge), con la stessa interfaccia di
+# fit_linear. Come Ridge di scikit-learn l'intercetta non viene penalizzata; alpha è il peso della penalità
+def fit_ridge(X, Y, alpha=1.0):
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    single_target = Y.ndim == X.ndim - 1
+    if single_target:
+        Y = Y[..., None]
+
+    x_mean = X.mean(axis=-2, keepdims=True)
+    y_mean = Y.mean(axis=-2, keepdims=True)
+    Xc = X - x_mean
+    Xt = np.swapaxes(Xc, -1, -2)
+    # Equazioni normali regolarizzate, risolte per tutti gli obiettivi e tutti i problemi del batch
+    coef = np.linalg.solve(Xt @ Xc + alpha * np.eye(X.shape[-1]), Xt @ (Y - y_mean))
+    intercept = (y_mean - x_mean @ coef)[..., 0, :]
+
+    if single_target:
+        return coef[..., 0], intercept[..., 0]
+    return coef, intercept
+
+# Funzione che calcola le previsioni di un modello lineare stimato con fit_linear
+def predict_linear(coef, intercept, X):
+    X = np.asarray(X, dtype=float)
+    if coef.ndim == X.ndim - 1:
+        return (X @ coef[..., None])[..., 0] + intercept[..., None]
+    return X @ coef + intercept[..., None, :]
+
+# Classe che addestra in modo incrementale (online) un modello lineare con intercetta, anche per un batch di problemi
+# (ad esempio uno per azienda). Invece dei dati conserva le statistiche sufficienti: numero di campioni, medie e
+# prodotti incrociati centrati (XᵀX e XᵀY), che vengono aggiornati con la formula di unione di Chan et al. (stabile
+# anche con valori grandi come gli anni). Ogni aggiornamento e ogni risoluzione costano un tempo costante, che non
+# dipende dalla lunghezza dello storico, e il risultato coincide con fit_linear sugli stessi dati.
+# batch_shape: forma del batch di problemi (default un solo problema)
+class OnlineLinear:
+    def __init__(self, n_features, n_targets, batch_shape=()):
+        self.n = np.zeros(batch_shape)
+        self.x_mean = np.zeros((*batch_shape, n_features))
+        self.y_mean = np.zeros((*batch_shape, n_targets))
+        self.xx = np.zeros((*batch_shape, n_features, n_features))
+        self.xy = np.zeros((*batch_shape, n_features, n_targets))
+
+    # Unisce (sign=1) o rimuove (sign=-1) le statistiche di un blocco di campioni X (..., campioni, variabili),
+    # Y (..., campioni, obiettivi) per i problemi del batch selezionati da index (default tutti)
+    def _merge(self, X, Y, index, sign):
+        index = slice(None) if index is None else index
+        X = np.asarray(X, dtype=float)
+        Y = np.asarray(Y, dtype=float)
+        n_b = X.shape[-2]
+        xb_mean = X.mean(axis=-2)
+        yb_mean = Y.mean(axis=-2)
+        xb = X - xb_mean[..., None, :]
+        yb = Y - yb_mean[..., None, :]
+        xx_b = np.swapaxes(xb, -1, -2) @ xb
+        xy_b = np.swapaxes(xb, -1, -2) @ yb
+
+        n_a = self.n[index]
+        n = n_a + sign * n_b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if sign > 0:
+                # Unione: nuove medie e correzione dei prodotti incrociati per la differenza tra le medie
+                weight = np.where(n > 0, n_b / n, 0.0)
+                dx = xb_mean - self.x_mean[index]
+                dy = yb_mean - self.y_mean[index]
+                x_mean = self.x_mean[index] + dx * weight[..., None]
+                y_mean = self.y_mean[index] + dy * weight[..., None]
+                factor = (n_a * weight)[..., None, None]
+                self.xx[index] += xx_b + factor * dx[..., :, None] * dx[..., None, :]
+                self.xy[index] += xy_b + factor * dx[..., :, None] * dy[..., None, :]
+            else:
+                # Rimozione: medie del resto dei campioni e formula di unione invertita
+                x_mean = np.where(n[..., None] > 0, (n_a[..., None] * self.x_mean[index] - n_b * xb_mean) / n[..., None], 0.0)
+                y_mean = np.where(n[..., None] > 0, (n_a[..., None] * self.y_mean[index] - n_b * yb_mean) / n[..., None], 0.0)
+                dx = xb_mean - x_mean
+                dy = yb_mean - y_mean
+                factor = np.where(n_a > 0, n * n_b / n_a, 0.0)[..., None, None]
+                self.xx[index] -= xx_b + factor * dx[..., :, None] * dx[..., None, :]
+                self.xy[index] -= xy_b + factor * dx[..., :, None] * dy[..., None, :]
+        self.n[index] = n
+        self.x_mean[index] = x_mean
+        self.y_mean[index] = y_mean
+
+    # Aggiunge un blocco di campioni (ad esempio un nuovo anno) ai problemi selezionati da index
+    def update(self, X, Y, index=None):
+        self._merge(X, Y, index, 1)
+
+    # Rimuove un blocco di campioni già aggiunto (ad esempio il dato parziale di un anno da sostituire)
+    def remove(self, X, Y, index=None):
+        self._merge(X, Y, index, -1)
+
+    # Risolve i modelli con le statistiche correnti: stessa soluzione di norma minima di fit_linear, calcolata dalle
+    # matrici (variabili x variabili) invece che dai dati. index seleziona i problemi del batch da risolvere (default
+    # tutti): con un solo indice il costo non dipende dal numero di problemi del batch.
+    # Restituisce coefficienti (..., variabili, obiettivi) e intercette (..., obiettivi)
+    def solve(self, index=None):
+        index = slice(None) if index is None else index
+        coef = np.linalg.pinv(self.xx[index], hermitian=True) @ self.xy[index]
+        intercept = self.y_mean[index] - (self.x_mean[index][..., None, :] @ coef)[..., 0, :]
+        return coef, intercept
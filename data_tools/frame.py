@@ -0,0 +1,159 @@
+# frame.py
+
+# Modulo che definisce ColumnFrame, la tabella colonnare compatta con cui i dati ambientali, di produzione, di
+# performance e previsionali passano tra il simulatore, le callback, i grafici e le esportazioni.
+# Ogni colonna è un array NumPy con un tipo fisso, stabilito dallo schema (frame_dtypes) ricavato dalle colonne di
+# interface.labels.col_mapping: anni interi a 16 bit e valori float a 32 bit, tranne gli importi in euro (decine di
+# migliaia, oltre la precisione al millesimo di un float a 32 bit) che restano a 64 bit. Rispetto agli elenchi di
+# record (un dizionario Python per riga) la tabella occupa da 4 a 8 byte per valore e si converte in DataFrame senza
+# copie. Per il trasporto (ad esempio in un dcc.Store) la tabella si serializza in un formato binario: intestazione
+# JSON con righe, nomi e tipi delle colonne seguita dai dati delle colonne, letti senza copie con np.frombuffer.
+# Gli elenchi di record restano solo dove sono indispensabili (dati delle DataTable inviati al browser), arrotondati
+# alla precisione dei dati della dashboard (frame_decimals).
+# Contiene:
+# - ColumnFrame: tabella colonnare a schema fisso
+# - as_frame: restituisce un DataFrame a partire da una ColumnFrame (o da un DataFrame)
+
+# Importazione delle librerie necessarie
+import json, base64, struct # per la serializzazione binaria
+import numpy as np # per gli array colonnari
+import pandas as pd # per la conversione in DataFrame
+from interface.labels import col_mapping # colonne dei dati della dashboard
+
+# Schema delle colonne: anni interi, importi in euro a 64 bit, tutte le altre colonne float a 32 bit
+frame_money_cols = ['Total_Cost', 'Total_Price', 'Gain']
+frame_dtypes = {col: np.dtype('int16') if col == 'Year' else np.dtype('float64') if col in frame_money_cols
+                else np.dtype('float32') for col in col_mapping}
+# Numero di decimali dei valori convertiti in Python (record delle DataTable, righe delle esportazioni)
+frame_decimals = 3
+# Identificativo e versione del formato binario
+frame_magic = b'SAF1'
+
+# Classe che rappresenta una tabella colonnare a schema fisso
+# Le colonne sono in sola lettura: le operazioni che modificano i dati (ad esempio i filtri) restituiscono una nuova tabella
+class ColumnFrame:
+    def __init__(self, columns):
+        self.data = {}
+        n_rows = None
+        for col, values in columns.items():
+            if col not in frame_dtypes:
+                raise ValueError(f"Colonna non prevista dallo schema: {col}")
+            values = np.asarray(values)
+            dtype = frame_dtypes[col]
+            if values.dtype != dtype:
+                # Gli interi fuori dall'intervallo del tipo dello schema non vengono troncati silenziosamente
+                if dtype.kind == 'i' and len(values) and (np.nanmin(values) < np.iinfo(dtype).min or np.nanmax(values) > np.iinfo(dtype).max):
+                    raise ValueError(f"Valori della colonna {col} fuori dall'intervallo di {dtype}")
+                values = values.astype(dtype)
+            if values.ndim != 1 or (n_rows is not None and len(values) != n_rows):
+                raise ValueError(f"La colonna {col} non ha la stessa lunghezza delle precedenti")
+            n_rows = len(values)
+            values = values.view()
+            values.flags.writeable = False
+            self.data[col] = values
+        self.n_rows = n_rows or 0
+
+    # Tabella a partire da un DataFrame (le colonne con il tipo dello schema non vengono copiate)
+    @classmethod
+    def from_frame(cls, df):
+        return cls({col: df[col].to_numpy() for col in df.columns})
+
+    # Tabella a partire da un elenco di record (ad esempio i dati di una DataTable); i valori mancanti diventano NaN
+    @classmethod
+    def from_records(cls, records):
+        if not records:
+            return cls({})
+        return cls({col: np.array([np.nan if row.get(col) is None else row[col] for row in records], dtype=float)
+                    for col in records[0]})
+
+    # Tabella a partire da una ColumnFrame, un DataFrame o un elenco di record
+    @classmethod
+    def coerce(cls, data):
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, pd.DataFrame):
+            return cls.from_frame(data)
+        return cls.from_records(list(data or []))
+
+    @property
+    def columns(self):
+        return list(self.data)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __getitem__(self, col):
+        return self.data[col]
+
+    # Occupazione in byte dei dati
+    @property
+    def nbytes(self):
+        return sum(values.nbytes for values in self.data.values())
+
+    # Restituisce una nuova tabella con le sole righe indicate (maschera booleana, indici o slice)
+    def take(self, rows):
+        return ColumnFrame({col: values[rows] for col, values in self.data.items()})
+
+    # Conversione in DataFrame, senza copiare i dati
+    def to_frame(self):
+        return pd.DataFrame(self.data, copy=False)
+
+    # Colonne convertite in liste di valori Python, con gli anni interi e gli altri valori arrotondati
+    def python_columns(self, start=0, stop=None):
+        columns = {}
+        for col, values in self.data.items():
+            values = values[start:stop]
+            if values.dtype.kind in 'iu':
+                columns[col] = values.tolist()
+            else:
+                columns[col] = np.round(values.astype(np.float64), frame_decimals).tolist()
+        return columns
+
+    # Elenco di record (un dizionario per riga), per i dati delle DataTable
+    def to_records(self):
+        columns = self.python_columns()
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    # Righe (tuple di valori Python) comprese tra start e stop, per le esportazioni
+    def rows(self, start=0, stop=None):
+        return list(zip(*self.python_columns(start, stop).values()))
+
+    # Righe di testo per le tabelle del report PDF: intestazione e valori con gli anni interi e gli altri valori a
+    # frame_decimals decimali (come format_table_data del modulo data_export)
+    def to_text_rows(self):
+        columns = {col: [str(v) if self.data[col].dtype.kind in 'iu' else f'{v:.{frame_decimals}f}' for v in values]
+                   for col, values in self.python_columns().items()}
+        return [self.columns] + [list(row) for row in zip(*columns.values())]
+
+    # Serializzazione binaria: identificativo, lunghezza dell'intestazione JSON, intestazione e dati delle colonne
+    def to_bytes(self):
+        header = json.dumps({'rows': self.n_rows, 'columns': [[col, values.dtype.str] for col, values in self.data.items()]}).encode()
+        return b''.join([frame_magic, struct.pack('<I', len(header)), header,
+                         *(np.ascontiguousarray(values).tobytes() for values in self.data.values())])
+
+    # Tabella a partire dalla serializzazione binaria: le colonne sono lette dal buffer senza copiarlo
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != frame_magic:
+            raise ValueError("Formato della tabella non riconosciuto")
+        header_len = struct.unpack_from('<I', data, 4)[0]
+        header = json.loads(bytes(data[8:8 + header_len]))
+        offset = 8 + header_len
+        columns = {}
+        for col, dtype in header['columns']:
+            dtype = np.dtype(dtype)
+            columns[col] = np.frombuffer(data, dtype=dtype, count=header['rows'], offset=offset)
+            offset += dtype.itemsize * header['rows']
+        return cls(columns)
+
+    # Serializzazione come testo (base64 del formato binario), per i componenti dcc.Store
+    def encode(self):
+        return base64.b64encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def decode(cls, text):
+        return cls.from_bytes(base64.b64decode(text))
+
+# Funzione che restituisce un DataFrame a partire da una ColumnFrame (senza copiare i dati) o da un DataFrame
+def as_frame(data):
+    return data.to_frame() if isinstance(data, ColumnFrame) else data
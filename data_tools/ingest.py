@@ -0,0 +1,264 @@
+# ingest.py
+
+# Modulo che acquisisce i dati ad alta frequenza delle stazioni meteo di campo (una lettura ogni 10 minuti di
+# temperatura, umidità e pioggia per appezzamento) e ne mantiene gli aggregati giornalieri, mensili ed annuali
+# (media, somma, minimo e massimo) in modo incrementale: ogni nuovo blocco di letture aggiorna solo i giorni, i mesi e
+# gli anni che contiene, senza rileggere lo storico.
+# Gli aggregati annuali alimentano i dati ambientali del modello (una riga per anno con Temperature, Humidity e
+# Precipitation) usati da calc_production, simulate_farms e calc_future_production.
+# Formato delle letture (CSV con intestazione o NDJSON, una lettura per riga):
+#   farm_id, timestamp (ISO 8601), temperature (°C), humidity (%), rainfall (mm caduti nell'intervallo)
+# Sorgenti:
+# - DirectorySource: file .csv, .ndjson o .jsonl di una cartella locale; ad ogni lettura vengono acquisiti solo i
+#   file nuovi e le righe aggiunte in coda a quelli già letti (le posizioni lette sono salvate nello stesso file
+#   dello stato, per cui aggregati e posizioni restano sempre coerenti)
+# - serve_socket: server TCP che riceve letture NDJSON (una per riga) e le acquisisce a blocchi
+# Avvio (dalla cartella principale del progetto):
+#   python -m data_tools.ingest --dir letture/ --state aggregati.csv [--follow 60]
+#   python -m data_tools.ingest --listen 0.0.0.0:9000 --state aggregati.csv
+# Contiene:
+# - SensorAggregates: aggregati incrementali per appezzamento, con salvataggio e ripristino da file
+# - DirectorySource: sorgente incrementale da cartella
+# - serve_socket: sorgente da socket TCP
+# - main: interfaccia a riga di comando
+
+# Importazione delle librerie necessarie
+import os, io, sys, time, json, argparse, threading, socketserver # per file, socket, riga di comando e accesso concorrente
+import numpy as np # per gli aggregati
+import pandas as pd # per la gestione dei blocchi di letture
+
+# Grandezze misurate dalle stazioni e livelli di aggregazione
+sensor_measures = ['temperature', 'humidity', 'rainfall']
+aggregate_levels = ['day', 'month', 'year']
+# Statistiche conservate per ogni grandezza (la media è somma / conteggio)
+aggregate_stats = ['count', 'sum', 'min', 'max']
+# Numero di letture ricevute dal socket dopo il quale il blocco viene acquisito
+socket_batch_lines = 1000
+
+# Classe che mantiene gli aggregati incrementali delle letture per appezzamento
+# Per ogni livello (day, month, year) e per ogni coppia (farm_id, periodo) conserva un array 4 x 3 con conteggio,
+# somma, minimo e massimo delle tre grandezze. I periodi sono stringhe 'AAAA-MM-GG', 'AAAA-MM' e 'AAAA'
+# offsets contiene le posizioni dei file sorgente già acquisite negli aggregati (file -> byte letti), salvate e
+# ripristinate insieme agli aggregati
+class SensorAggregates:
+    def __init__(self):
+        self.state = {level: {} for level in aggregate_levels}
+        self.lock = threading.Lock()
+        self.readings = 0
+        self.offsets = {}
+
+    # Acquisisce un blocco di letture (DataFrame con le colonne farm_id, timestamp e le grandezze misurate)
+    # Le letture vengono raggruppate per giorno con un'unica operazione vettoriale; gli aggregati mensili ed annuali
+    # si ottengono da quelli giornalieri del blocco. Restituisce il numero di letture acquisite
+    def add_batch(self, df):
+        if df is None or len(df) == 0:
+            return 0
+        timestamps = pd.to_datetime(df['timestamp'])
+        values = df.reindex(columns=sensor_measures).astype(float)
+        keys = [df['farm_id'].astype(int).rename('farm_id'), timestamps.dt.year.rename('y'),
+                timestamps.dt.month.rename('m'), timestamps.dt.day.rename('d')]
+        daily = values.groupby(keys).agg(['count', 'sum', 'min', 'max'])
+        # Array (giorni x statistiche x grandezze) nell'ordine di aggregate_stats e sensor_measures
+        daily_stats = np.stack([daily.xs(stat, axis=1, level=1)[sensor_measures].to_numpy() for stat in aggregate_stats], axis=1)
+
+        with self.lock:
+            for (farm_id, y, m, d), stats in zip(daily.index, daily_stats):
+                for level, period in zip(aggregate_levels, (f'{y:04d}-{m:02d}-{d:02d}', f'{y:04d}-{m:02d}', f'{y:04d}')):
+                    self.merge(level, (int(farm_id), period), stats)
+            self.readings += len(df)
+        return len(df)
+
+    # Unisce le statistiche di un periodo a quelle già presenti (senza lock: è richiamata da add_batch e load)
+    def merge(self, level, key, stats):
+        current = self.state[level].get(key)
+        if current is None:
+            self.state[level][key] = stats.copy()
+            return
+        current[0] += stats[0]
+        current[1] += np.nan_to_num(stats[1])
+        current[2] = np.fmin(current[2], stats[2])
+        current[3] = np.fmax(current[3], stats[3])
+
+    # Restituisce gli aggregati di un livello (ed eventualmente di un solo appezzamento) come DataFrame con le colonne
+    # farm_id, period e, per ogni grandezza, <grandezza>_count, _sum, _min, _max e _mean
+    def aggregates(self, level='year', farm_id=None):
+        with self.lock:
+            items = sorted((key, stats.copy()) for key, stats in self.state[level].items()
+                           if farm_id is None or key[0] == farm_id)
+        columns = {'farm_id': [key[0] for key, _ in items], 'period': [key[1] for key, _ in items]}
+        stats = np.array([s for _, s in items]).reshape(len(items), len(aggregate_stats), len(sensor_measures))
+        for j, measure in enumerate(sensor_measures):
+            for i, stat in enumerate(aggregate_stats):
+                columns[f'{measure}_{stat}'] = stats[:, i, j]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                columns[f'{measure}_mean'] = stats[:, 1, j] / stats[:, 0, j]
+        return pd.DataFrame(columns)
+
+    # Restituisce i dati ambientali annuali nel formato del modello: farm_id, Year, Temperature (media, °C),
+    # Humidity (media, %) e Precipitation (pioggia totale dell'anno, mm), come il parametro df_env di simulate_farms
+    # Per l'anno in corso i valori si riferiscono alle sole letture acquisite fino a quel momento
+    def annual_env(self, farm_id=None):
+        df = self.aggregates('year', farm_id)
+        return pd.DataFrame({
+            'farm_id': df['farm_id'],
+            'Year': df['period'].astype(int),
+            'Temperature': df['temperature_mean'],
+            'Humidity': df['humidity_mean'],
+            'Precipitation': df['rainfall_sum'],
+        })
+
+    # Restituisce df_env (dati ambientali della dashboard, una riga per anno e precipitazioni in cm) in cui i valori degli
+    # anni presenti negli aggregati dell'appezzamento farm_id sostituiscono quelli originali. Le righe restano le stesse,
+    # per cui il risultato può essere passato a calc_future_production insieme ai dati di produzione degli stessi anni
+    def update_env(self, df_env, farm_id=0):
+        annual = self.annual_env(farm_id).set_index('Year')
+        annual['Precipitation'] = annual['Precipitation'] / 10 # da mm a cm, come in load_initial_data
+        df_env = df_env.copy()
+        rows = df_env['Year'].isin(annual.index)
+        for col in ['Temperature', 'Humidity', 'Precipitation']:
+            df_env.loc[rows, col] = annual.loc[df_env.loc[rows, 'Year'], col].to_numpy()
+        return df_env
+
+    # Salva gli aggregati in un file CSV (una riga per livello, appezzamento e periodo), scritto su file temporaneo e
+    # poi rinominato. La prima riga del file è un commento con le posizioni dei file sorgente (JSON): aggregati e
+    # posizioni vengono sostituiti insieme, per cui un'interruzione non può far acquisire due volte le stesse letture
+    def save(self, path):
+        frames = [self.aggregates(level).assign(level=level) for level in aggregate_levels]
+        df = pd.concat(frames, ignore_index=True)
+        df = df[['level', 'farm_id', 'period'] + [f'{m}_{s}' for m in sensor_measures for s in aggregate_stats]]
+        with self.lock:
+            meta = json.dumps({'offsets': self.offsets})
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', newline='') as f:
+            f.write(f'#{meta}\n')
+            df.to_csv(f, index=False)
+        os.replace(tmp_path, path)
+
+    # Ripristina gli aggregati e le posizioni dei file sorgente salvati con save (unendoli a quelli presenti)
+    def load(self, path):
+        with open(path, newline='') as f:
+            first = f.readline()
+            meta = json.loads(first[1:]) if first.startswith('#') else {}
+            if not first.startswith('#'):
+                f.seek(0) # file salvato senza posizioni
+            df = pd.read_csv(f, dtype={'period': str})
+        stats = np.stack([df[[f'{m}_{s}' for m in sensor_measures]].to_numpy(dtype=float) for s in aggregate_stats], axis=1)
+        with self.lock:
+            for level, farm_id, period, values in zip(df['level'], df['farm_id'], df['period'], stats):
+                self.merge(level, (int(farm_id), period), values)
+            self.offsets.update(meta.get('offsets', {}))
+        return self
+
+# Funzione che legge un blocco di letture in formato CSV (con l'intestazione indicata) o NDJSON
+def parse_readings(text, ndjson, header=None):
+    if not text.strip():
+        return None
+    if ndjson:
+        return pd.DataFrame([json.loads(line) for line in text.splitlines() if line.strip()])
+    return pd.read_csv(io.StringIO(header + text if header else text))
+
+# Classe che acquisisce in modo incrementale i file di letture di una cartella
+# Per ogni file ricorda la posizione fino a cui è stato letto: ad ogni chiamata di poll vengono lette solo le righe
+# complete aggiunte da allora (e i file nuovi)
+class DirectorySource:
+    def __init__(self, path, offsets=None):
+        self.path = path
+        self.offsets = dict(offsets or {}) # file -> posizione già letta
+        self.headers = {} # file CSV -> riga di intestazione
+
+    # Restituisce l'elenco dei blocchi (DataFrame) letti dall'ultima chiamata
+    def poll(self):
+        batches = []
+        for name in sorted(os.listdir(self.path)):
+            ndjson = name.endswith(('.ndjson', '.jsonl'))
+            if not (ndjson or name.endswith('.csv')):
+                continue
+            file_path = os.path.join(self.path, name)
+            offset = self.offsets.get(file_path, 0)
+            if os.path.getsize(file_path) <= offset:
+                continue
+            with open(file_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # Si acquisiscono solo le righe complete: un'eventuale riga in scrittura verrà letta alla prossima chiamata
+            end = data.rfind(b'\n') + 1
+            if end == 0:
+                continue
+            text = data[:end].decode('utf-8')
+            if not ndjson and file_path not in self.headers:
+                # Intestazione del file CSV (riletta dall'inizio del file se la lettura riprende da una posizione salvata)
+                if offset == 0:
+                    header, _, text = text.partition('\n')
+                else:
+                    with open(file_path, 'rb') as f:
+                        header = f.readline().decode('utf-8').rstrip('\n')
+                self.headers[file_path] = header + '\n'
+            self.offsets[file_path] = offset + end
+            batch = parse_readings(text, ndjson, self.headers.get(file_path))
+            if batch is not None:
+                batches.append(batch)
+        return batches
+
+# Funzione che avvia un server TCP che riceve letture NDJSON e le acquisisce negli aggregati a blocchi di
+# socket_batch_lines righe (e alla chiusura di ogni connessione). Restituisce il server, avviato in un thread separato
+def serve_socket(aggregates, host='0.0.0.0', port=9000):
+    class ReadingsHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = []
+            for line in self.rfile:
+                lines.append(line.decode('utf-8'))
+                if len(lines) >= socket_batch_lines:
+                    aggregates.add_batch(parse_readings(''.join(lines), ndjson=True))
+                    lines = []
+            aggregates.add_batch(parse_readings(''.join(lines), ndjson=True))
+
+    server = socketserver.ThreadingTCPServer((host, port), ReadingsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Interfaccia a riga di comando
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Acquisisce le letture delle stazioni e ne aggiorna gli aggregati")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="cartella con i file di letture (.csv, .ndjson, .jsonl)")
+    source.add_argument('--listen', help="indirizzo host:porta su cui ricevere letture NDJSON")
+    parser.add_argument('--state', help="file CSV degli aggregati (ripristinato all'avvio e aggiornato)")
+    parser.add_argument('--follow', type=float, default=None, help="intervallo (s) di controllo dei nuovi dati")
+    args = parser.parse_args(argv)
+
+    aggregates = SensorAggregates()
+    if args.state and os.path.exists(args.state):
+        aggregates.load(args.state)
+
+    # Stampa degli aggregati annuali e salvataggio dello stato
+    def report():
+        print(aggregates.annual_env().round(3).to_string(index=False), file=sys.stderr)
+        if args.state:
+            aggregates.save(args.state)
+
+    if args.dir:
+        # Le posizioni già lette dei file vengono salvate con gli aggregati, per non acquisire due volte le stesse righe
+        directory = DirectorySource(args.dir, aggregates.offsets)
+        while True:
+            acquired = sum(aggregates.add_batch(batch) for batch in directory.poll())
+            if acquired:
+                print(f"{acquired} letture acquisite", file=sys.stderr)
+                with aggregates.lock:
+                    aggregates.offsets = dict(directory.offsets)
+                report()
+            if args.follow is None:
+                break
+            time.sleep(args.follow)
+    else:
+        host, port = args.listen.rsplit(':', 1)
+        serve_socket(aggregates, host, int(port))
+        try:
+            while True:
+                time.sleep(args.follow or 60)
+                report()
+        except KeyboardInterrupt:
+            report()
+
+if __name__ == "__main__":
+    main()
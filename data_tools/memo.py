@@ -0,0 +1,240 @@
+# memo.py
+
+# Modulo che memorizza (memoization) i risultati delle simulazioni e delle previsioni.
+# Grazie ai generatori espliciti (vedi data_tools.rng) una funzione chiamata con lo stesso seme e gli stessi dati
+# restituisce sempre lo stesso risultato: la chiave della cache è quindi il seme più un hash degli argomenti.
+# La cache ha due livelli:
+# - in memoria: una LRU con un numero massimo di elementi, oltre il quale vengono eliminati i meno usati di recente
+# - su disco (opzionale): un file .npz compresso per risultato nella cartella indicata dalla variabile d'ambiente
+#   SIMULAGRO_CACHE_DIR (o dal parametro disk_dir), condivisibile tra processi e riavvii. Anche questo livello è
+#   limitato: la cartella viene ripulita periodicamente dei risultati non usati da più di SIMULAGRO_CACHE_MAX_AGE
+#   secondi (default 7 giorni) e, oltre SIMULAGRO_CACHE_MAX_MB megabyte (default 512), dei meno recenti
+#   (vedi clean_result_dir in data_tools.result_store)
+# Le chiamate senza seme (o con un Generator, il cui stato cambia ad ogni uso) non sono riproducibili e quindi non
+# vengono memorizzate. Per ogni funzione sono disponibili i contatori di hit, miss ed evictions.
+# Contiene:
+# - memoize: decoratore che aggiunge la cache ad una funzione
+# - hash_value: calcola l'hash di argomenti composti da DataFrame, array, scalari, liste e dizionari
+# - cache_stats: restituisce i contatori di tutte le funzioni memorizzate
+# - clear_caches: svuota le cache in memoria
+
+# Importazione delle librerie necessarie
+import os, io, json, time, hashlib, inspect, threading, functools # per chiavi, file, firma delle funzioni e accesso concorrente
+from collections import OrderedDict # per la LRU in memoria
+import numpy as np # per gli array
+import pandas as pd # per i DataFrame
+from data_tools.result_store import clean_result_dir, touch_result # per la pulizia della cache su disco
+
+# Dimensione predefinita della LRU in memoria (numero di risultati per funzione)
+memo_maxsize = 128
+# Limiti della cache su disco: età massima (secondi dall'ultimo utilizzo) e dimensione massima (MB)
+memo_disk_max_age = float(os.environ.get('SIMULAGRO_CACHE_MAX_AGE', 7 * 24 * 3600))
+memo_disk_max_mb = float(os.environ.get('SIMULAGRO_CACHE_MAX_MB', 512))
+# Intervallo minimo (in secondi) tra due pulizie della cache su disco da parte dello stesso processo
+memo_clean_interval = 60
+# Registro delle cache create con il decoratore (nome della funzione -> cache)
+memo_registry = {}
+
+# Funzione che calcola l'hash di un valore (DataFrame, Series, array, scalari e loro combinazioni)
+def hash_value(value, digest=None):
+    digest = digest or hashlib.sha1()
+    if isinstance(value, pd.DataFrame):
+        digest.update(b'frame')
+        digest.update(json.dumps([str(c) for c in value.columns] + [str(t) for t in value.dtypes]).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        digest.update(b'series' + str(value.name).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f'array{value.dtype}{value.shape}'.encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, np.random.SeedSequence):
+        digest.update(f'seedseq{value.entropy}{value.spawn_key}'.encode())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            hash_value(item, digest)
+    elif isinstance(value, dict):
+        digest.update(f'dict{len(value)}'.encode())
+        for k in sorted(value, key=str):
+            hash_value(k, digest)
+            hash_value(value[k], digest)
+    else:
+        digest.update(repr(value).encode())
+    return digest
+
+# Funzione che crea una copia del risultato, in modo che chi lo riceve possa modificarlo senza alterare la cache
+def copy_result(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(copy_result(item) for item in value)
+    if isinstance(value, list):
+        return [copy_result(item) for item in value]
+    if isinstance(value, dict):
+        return {k: copy_result(v) for k, v in value.items()}
+    return value
+
+# Funzione che scompone un risultato in una descrizione JSON e in un elenco di array (per il salvataggio su disco)
+# Sono supportati DataFrame, tuple/liste di risultati e valori JSON (ad esempio il dizionario delle etichette)
+# Gli indici RangeIndex dei DataFrame sono salvati come inizio, fine e passo, in modo che il DataFrame letto dal disco
+# sia identico a quello conservato in memoria
+def pack_result(value, arrays):
+    if isinstance(value, pd.DataFrame):
+        names = []
+        for col in value.columns:
+            names.append(f'a{len(arrays)}')
+            arrays.append(value[col].to_numpy())
+        if isinstance(value.index, pd.RangeIndex):
+            index = {'type': 'range', 'start': value.index.start, 'stop': value.index.stop, 'step': value.index.step,
+                     'name': value.index.name}
+            json.dumps(index) # solleva TypeError se il nome dell'indice non è serializzabile
+        else:
+            index = pack_result(value.index.to_numpy(), arrays)
+        return {'type': 'frame', 'columns': [str(c) for c in value.columns], 'arrays': names, 'index': index}
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            raise TypeError("gli array di oggetti non possono essere salvati senza pickle")
+        arrays.append(value)
+        return {'type': 'array', 'name': f'a{len(arrays) - 1}'}
+    if isinstance(value, (tuple, list)):
+        return {'type': type(value).__name__, 'items': [pack_result(item, arrays) for item in value]}
+    json.dumps(value) # solleva TypeError se il valore non è serializzabile
+    return {'type': 'json', 'value': value}
+
+# Funzione che ricostruisce un risultato a partire dalla descrizione e dagli array salvati
+def unpack_result(meta, arrays):
+    if meta['type'] == 'frame':
+        return pd.DataFrame({col: arrays[name] for col, name in zip(meta['columns'], meta['arrays'])},
+                            index=unpack_result(meta['index'], arrays))
+    if meta['type'] == 'range':
+        return pd.RangeIndex(meta['start'], meta['stop'], meta['step'], name=meta['name'])
+    if meta['type'] == 'array':
+        return arrays[meta['name']]
+    if meta['type'] in ('tuple', 'list'):
+        items = [unpack_result(item, arrays) for item in meta['items']]
+        return tuple(items) if meta['type'] == 'tuple' else items
+    return meta['value']
+
+# Classe che implementa la cache (LRU in memoria + livello su disco opzionale) di una funzione
+class MemoCache:
+    def __init__(self, name, maxsize=memo_maxsize, disk_dir=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.cleaned = 0.0 # istante dell'ultima pulizia della cartella su disco
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'disk_hits': 0, 'disk_writes': 0, 'bypassed': 0}
+
+    # Cartella del livello su disco (parametro del decoratore o variabile d'ambiente), None se disattivato
+    def disk_path(self, key):
+        disk_dir = self.disk_dir or os.environ.get('SIMULAGRO_CACHE_DIR')
+        if not disk_dir:
+            return None
+        return os.path.join(disk_dir, f'{self.name}-{key}.npz')
+
+    # Restituisce (True, risultato) se la chiave è in cache, (False, None) altrimenti
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return True, copy_result(self.entries[key])
+        path = self.disk_path(key)
+        if path and os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    arrays = {name: data[name] for name in data.files}
+                result = unpack_result(json.loads(str(arrays.pop('__meta__'))), arrays)
+            except (OSError, ValueError, KeyError):
+                result = None # file danneggiato o incompleto: si ricalcola
+            if result is not None:
+                touch_result(path) # ne viene rinnovata la scadenza
+                self.put(key, result, write_disk=False)
+                with self.lock:
+                    self.stats['disk_hits'] += 1
+                return True, copy_result(result)
+        with self.lock:
+            self.stats['misses'] += 1
+        return False, None
+
+    # Inserisce un risultato in cache (ed eventualmente su disco), eliminando i meno recenti oltre il limite
+    def put(self, key, result, write_disk=True):
+        with self.lock:
+            self.entries[key] = copy_result(result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        path = self.disk_path(key) if write_disk else None
+        if path:
+            try:
+                arrays = []
+                meta = pack_result(result, arrays)
+            except TypeError:
+                return # risultato non salvabile su disco: resta solo in memoria
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            buffer = io.BytesIO()
+            np.savez_compressed(buffer, __meta__=np.array(json.dumps(meta)), **{f'a{i}': a for i, a in enumerate(arrays)})
+            # Scrittura su file temporaneo e rinomina: gli altri processi non leggono mai un file incompleto
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.stats['disk_writes'] += 1
+            self.maybe_clean(os.path.dirname(path))
+
+    # Ripulisce la cartella su disco (file .npz delle cache) se dall'ultima pulizia è trascorso l'intervallo previsto
+    def maybe_clean(self, folder):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.cleaned < memo_clean_interval:
+                return
+            self.cleaned = now
+        clean_result_dir(folder, memo_disk_max_age, memo_disk_max_mb, pattern='.npz')
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Decoratore che aggiunge la cache ad una funzione
+# seed_arg: nome del parametro che contiene il seme (o il generatore); se vale None o è un Generator la chiamata
+# non viene memorizzata. La chiave è l'hash del seme e di tutti gli altri argomenti (con i valori predefiniti)
+def memoize(seed_arg='seed', maxsize=memo_maxsize, disk_dir=None):
+    def decorator(func):
+        signature = inspect.signature(func)
+        cache = MemoCache(func.__qualname__, maxsize, disk_dir)
+        memo_registry[func.__qualname__] = cache
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            seed = bound.arguments.get(seed_arg)
+            if seed is None or isinstance(seed, np.random.Generator):
+                with cache.lock:
+                    cache.stats['bypassed'] += 1
+                return func(*args, **kwargs)
+
+            key = hash_value(sorted(bound.arguments.items())).hexdigest()
+            found, result = cache.get(key)
+            if found:
+                return result
+            result = func(*args, **kwargs)
+            cache.put(key, result)
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+# Funzione che restituisce i contatori (hit, miss, evictions, etc.) e la dimensione di tutte le cache
+def cache_stats():
+    return {name: dict(cache.stats, size=len(cache.entries), maxsize=cache.maxsize) for name, cache in memo_registry.items()}
+
+# Funzione che svuota tutte le cache in memoria (i file su disco non vengono toccati)
+def clear_caches():
+    for cache in memo_registry.values():
+        cache.clear()
@@ -0,0 +1,229 @@
+# metrics.py
+
+# Strumentazione dei percorsi critici della dashboard: tempi per fase, dimensione dei dati scambiati con il browser e
+# numero di chiamate delle callback e delle funzioni di data_tools che queste richiamano.
+# Ogni misura alimenta un istogramma "mobile" in memoria (le ultime metrics_window osservazioni, da cui si ricavano
+# percentili e conteggi per fascia) oltre ai contatori complessivi. Le misure sono raccolte con:
+# - timer: context manager che misura una fase di una funzione (ad esempio 'update_dashboard.figures')
+# - timed: decoratore che misura ogni chiamata di una funzione
+# - record_payload: registra la dimensione in byte di un dato (richieste e risposte delle callback, vedi interface.routes)
+# E' inoltre disponibile una cattura del profilo di esecuzione, da attivare e disattivare a runtime:
+# - 'cprofile': le callback vengono eseguite sotto cProfile (profilo deterministico di tutte le funzioni chiamate)
+# - 'sampling': un thread campiona periodicamente lo stack di tutti i thread (costo trascurabile per le callback)
+# La strumentazione è attiva di default (costa un paio di microsecondi per misura) e si disattiva con la variabile
+# d'ambiente SIMULAGRO_METRICS=0. Le misure sono esposte dall'endpoint /metrics (interface.routes) e, con
+# SIMULAGRO_DEBUG_PANEL=1, nel pannello di diagnostica della dashboard.
+# Contiene:
+# - RollingHistogram: istogramma mobile delle ultime osservazioni di una misura
+# - record_time, record_payload: registrano una durata o una dimensione
+# - timer, timed: misurano una fase o una funzione
+# - start_profile, stop_profile: avviano e concludono la cattura del profilo (restituendo il report testuale)
+# - profile_call: esegue una funzione sotto il profilo attivo. E' richiamata da timed per le callback
+# - metrics_snapshot, reset_metrics: restituiscono o azzerano le misure raccolte
+
+# Importazione delle librerie necessarie
+import os, io, sys, time, threading, functools, contextlib # per misure, thread di campionamento e decoratori
+import cProfile, pstats # per il profilo deterministico
+from collections import deque, Counter # per gli istogrammi mobili e i conteggi del campionamento
+import numpy as np # per i percentili
+
+# Attivazione della strumentazione e del pannello di diagnostica
+metrics_enabled = os.environ.get('SIMULAGRO_METRICS', '1') != '0'
+debug_panel = os.environ.get('SIMULAGRO_DEBUG_PANEL') == '1'
+# Numero di osservazioni conservate per ogni misura e fasce degli istogrammi (durate in ms, dimensioni in byte)
+metrics_window = 1024
+time_buckets_ms = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+size_buckets_bytes = (1e3, 1e4, 1e5, 1e6, 1e7)
+# Intervallo di campionamento del profilo 'sampling' (secondi) e numero di funzioni riportate nel report del profilo
+sample_interval = 0.005
+profile_top = 40
+
+# Misure raccolte (nome -> istogramma) e relativo lock
+timings = {}
+payloads = {}
+metrics_lock = threading.Lock()
+
+# Stato della cattura del profilo: modalità attiva, statistiche di cProfile, conteggi e thread del campionamento
+profile_mode = None
+profile_stats = None
+profile_started = None
+sample_self = Counter()
+sample_total = Counter()
+sample_count = 0
+sample_thread = None
+profile_lock = threading.Lock()
+
+# Classe che conserva le ultime osservazioni di una misura e i contatori complessivi
+class RollingHistogram:
+    def __init__(self, window=metrics_window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    # Restituisce il riepilogo della misura: contatori complessivi, media, percentili e massimo delle ultime
+    # osservazioni e conteggi per fascia (valori moltiplicati per scale, ad esempio 1000 per avere millisecondi)
+    def summary(self, buckets, scale=1.0):
+        values = np.fromiter(self.samples, dtype=float, count=len(self.samples)) * scale
+        if not len(values):
+            return {'count': self.count, 'total': self.total * scale}
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        counts = np.histogram(values, bins=[0, *buckets, np.inf])[0]
+        labels = [f'<={b:g}' for b in buckets] + [f'>{buckets[-1]:g}']
+        return {'count': self.count, 'total': self.total * scale, 'mean': self.total * scale / self.count,
+                'p50': p50, 'p90': p90, 'p99': p99, 'max': values.max(), 'last': values[-1],
+                'histogram': dict(zip(labels, counts.tolist()))}
+
+# Funzione che aggiunge un'osservazione alla misura indicata
+def add_sample(store, name, value):
+    with metrics_lock:
+        histogram = store.get(name)
+        if histogram is None:
+            histogram = store[name] = RollingHistogram()
+        histogram.add(value)
+
+# Funzione che registra la durata (in secondi) di una fase o di una funzione
+def record_time(name, seconds):
+    if metrics_enabled:
+        add_sample(timings, name, seconds)
+
+# Funzione che registra la dimensione (in byte) di un dato scambiato
+def record_payload(name, n_bytes):
+    if metrics_enabled and n_bytes is not None:
+        add_sample(payloads, name, n_bytes)
+
+# Context manager che misura la durata di una fase
+@contextlib.contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(name, time.perf_counter() - start)
+
+# Decoratore che misura ogni chiamata di una funzione (nome predefinito: modulo.funzione)
+# Con profile=True (callback) la funzione viene eseguita sotto il profilo cProfile, se attivo
+def timed(name=None, profile=False):
+    def decorator(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics_enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                if profile and profile_mode == 'cprofile':
+                    return profile_call(func, *args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                record_time(label, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# Funzione che esegue una funzione sotto cProfile e ne aggiunge il profilo a quello della cattura in corso
+# (cProfile misura solo il thread in cui è attivo: ogni callback, eseguita nel thread della richiesta, ha il suo)
+def profile_call(func, *args, **kwargs):
+    global profile_stats
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        with profile_lock:
+            if profile_mode == 'cprofile':
+                if profile_stats is None:
+                    profile_stats = pstats.Stats(profiler)
+                else:
+                    profile_stats.add(profiler)
+
+# Funzione eseguita dal thread di campionamento: ad ogni intervallo registra la funzione in esecuzione in ciascun thread
+# (conteggio "self") e tutte le funzioni presenti nel suo stack (conteggio "totale")
+def sample_stacks(stop_event):
+    global sample_count
+    own = threading.get_ident()
+    while not stop_event.wait(sample_interval):
+        frames = sys._current_frames()
+        with profile_lock:
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                leaf = True
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    key = f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+                    if leaf:
+                        sample_self[key] += 1
+                        leaf = False
+                    if key not in seen:
+                        sample_total[key] += 1
+                        seen.add(key)
+                    frame = frame.f_back
+            sample_count += 1
+
+# Funzione che avvia la cattura del profilo nella modalità indicata ('cprofile' o 'sampling')
+# Una cattura già in corso viene conclusa e scartata
+def start_profile(mode='cprofile'):
+    global profile_mode, profile_stats, profile_started, sample_count, sample_thread
+    if mode not in ('cprofile', 'sampling'):
+        raise ValueError(f"Modalità di profilo non valida: {mode}")
+    stop_profile()
+    with profile_lock:
+        profile_stats = None
+        sample_self.clear()
+        sample_total.clear()
+        sample_count = 0
+        profile_started = time.perf_counter()
+        profile_mode = mode
+    if mode == 'sampling':
+        stop_event = threading.Event()
+        sample_thread = (threading.Thread(target=sample_stacks, args=(stop_event,), daemon=True), stop_event)
+        sample_thread[0].start()
+
+# Funzione che conclude la cattura del profilo e ne restituisce il report testuale (stringa vuota se non attiva):
+# per cProfile le funzioni ordinate per tempo cumulato, per il campionamento le funzioni più presenti negli stack
+def stop_profile(limit=profile_top):
+    global profile_mode, sample_thread
+    if sample_thread is not None:
+        thread, stop_event = sample_thread
+        stop_event.set()
+        thread.join()
+        sample_thread = None
+    with profile_lock:
+        mode, profile_mode = profile_mode, None
+        if mode is None:
+            return ''
+        elapsed = time.perf_counter() - profile_started
+        out = io.StringIO()
+        if mode == 'cprofile':
+            if profile_stats is None:
+                return f"Profilo cProfile di {elapsed:.1f} s: nessuna callback eseguita\n"
+            profile_stats.stream = out
+            profile_stats.sort_stats('cumulative').print_stats(limit)
+            return f"Profilo cProfile di {elapsed:.1f} s\n" + out.getvalue()
+        out.write(f"Profilo a campionamento di {elapsed:.1f} s ({sample_count} campioni ogni {sample_interval * 1e3:g} ms)\n")
+        for title, counts in (("Funzioni in esecuzione (self)", sample_self), ("Funzioni negli stack (totale)", sample_total)):
+            out.write(f"\n{title}:\n")
+            for key, count in counts.most_common(limit):
+                out.write(f"{100 * count / max(sample_count, 1):6.1f}%  {count:7d}  {key}\n")
+        return out.getvalue()
+
+# Funzione che restituisce le misure raccolte: durate in millisecondi, dimensioni in byte e modalità del profilo attivo
+def metrics_snapshot():
+    with metrics_lock:
+        return {
+            'enabled': metrics_enabled,
+            'profile': profile_mode,
+            'timings_ms': {name: h.summary(time_buckets_ms, 1000.0) for name, h in sorted(timings.items())},
+            'payloads_bytes': {name: h.summary(size_buckets_bytes) for name, h in sorted(payloads.items())},
+        }
+
+# Funzione che azzera le misure raccolte
+def reset_metrics():
+    with metrics_lock:
+        timings.clear()
+        payloads.clear()
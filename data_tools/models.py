@@ -0,0 +1,217 @@
+# models.py
+
+# Registro dei modelli previsionali (backend) usati per proiettare negli anni futuri le serie storiche ambientali.
+# Ogni backend è una coppia di funzioni fit(years, values) -> stato e predict(stato, future_years) -> previsioni, più
+# la regressione usata per i modelli di produzione (dati ambientali -> produzione). I backend disponibili sono:
+# - linear: retta in funzione dell'anno (il modello originale della dashboard)
+# - ridge: retta con regolarizzazione L2, anche per i modelli di produzione
+# - poly: trend polinomiale (grado poly_degree) in funzione dell'anno
+# - seasonal: retta più una componente ciclica (seno e coseno) di periodo seasonal_period anni
+# - arima: ARIMA di statsmodels (ordine arima_order, con deriva)
+# - ets: livellamento esponenziale con trend additivo (Holt) di statsmodels
+# I backend "vettoriali" (linear, ridge, poly, seasonal) addestrano con un'unica risoluzione ai minimi quadrati tutte
+# le variabili e tutte le aziende impilate; quelli "per serie" (arima, ets) addestrano una serie alla volta, per cui le
+# serie (variabili x aziende) vengono distribuite su un pool di processi che resta attivo per tutta la vita del server.
+# Il numero di processi è indicato dalla variabile d'ambiente SIMULAGRO_MODEL_WORKERS (0: addestramento in sequenza).
+# Per ogni backend vengono pubblicati i tempi di addestramento e di previsione e, se la variabile d'ambiente
+# SIMULAGRO_MODEL_MEMORY vale 1 (tracemalloc rallenta tutte le allocazioni del processo), il picco di memoria.
+# Contiene le funzioni:
+# - register_model: aggiunge (o sostituisce) un backend nel registro
+# - run_backend: addestra un backend e calcola le previsioni, misurandone tempi e memoria. E' eseguita anche nei
+#   processi del pool
+# - start_model_pool: avvia (se non già attivo) il pool di processi dei backend per serie
+# - forecast_series: proietta negli anni futuri un batch di serie storiche con un backend. E' richiamata dalla funzione
+#   fit_future_arrays del modulo data_tools.data
+# - model_regression: restituisce la regressione dei modelli di produzione di un backend
+# - backend_stats: restituisce i tempi e la memoria misurati per ciascun backend
+
+# Importazione delle librerie necessarie
+import os, time, warnings, threading, tracemalloc # per configurazione, misure e accesso concorrente
+from concurrent.futures import ProcessPoolExecutor # per il pool di processi dei backend per serie
+import numpy as np # per le operazioni sugli array
+from data_tools.forecast import fit_linear, fit_ridge, predict_linear # per i backend ai minimi quadrati
+
+# Parametri dei backend
+ridge_alpha = 1.0 # Peso della penalità L2 del backend ridge
+poly_degree = 2 # Grado del trend polinomiale
+seasonal_period = 4 # Periodo (in anni) della componente ciclica del backend seasonal
+arima_order = (1, 1, 0) # Ordine (p, d, q) del backend arima
+# Numero di processi del pool dei backend per serie e misura della memoria
+model_workers = int(os.environ.get('SIMULAGRO_MODEL_WORKERS', min(4, os.cpu_count() or 1)))
+model_track_memory = os.environ.get('SIMULAGRO_MODEL_MEMORY') == '1'
+
+# Registro dei backend (nome -> funzioni) e misure raccolte (nome -> contatori)
+forecast_models = {}
+model_stats = {}
+model_lock = threading.Lock()
+
+# Pool di processi dei backend per serie, processo che lo ha creato e relativo lock
+model_executor = None
+model_owner = None
+model_pool_lock = threading.Lock()
+
+# Funzione che aggiunge un backend al registro
+# fit(years, values) -> stato e predict(stato, future_years) -> previsioni. Per i backend vettoriali years è (..., anni),
+# values (..., anni, variabili) e le previsioni (..., anni futuri, variabili); per quelli per serie (per_series=True)
+# years e values sono una sola serie (anni,) e le previsioni (anni futuri,)
+# regression: funzione (X, Y) -> (coefficienti, intercette) usata per i modelli di produzione
+def register_model(name, fit, predict, per_series=False, regression=fit_linear):
+    forecast_models[name] = {'fit': fit, 'predict': predict, 'per_series': per_series, 'regression': regression}
+
+# Funzione che costruisce le variabili dei trend in funzione dell'anno: anni (rispetto all'origine), loro potenze
+# (trend polinomiale) o componente ciclica (trend stagionale). Restituisce un array (..., anni, variabili)
+def trend_features(years, origin, kind):
+    t = years - origin[..., None]
+    if kind == 'poly':
+        return np.stack([t ** d for d in range(1, poly_degree + 1)], axis=-1)
+    if kind == 'seasonal':
+        angle = 2 * np.pi * years / seasonal_period
+        return np.stack([t, np.sin(angle), np.cos(angle)], axis=-1)
+    return t[..., None]
+
+# Funzioni di addestramento e previsione dei backend vettoriali (minimi quadrati sulle variabili dei trend)
+# L'origine dei tempi è l'anno medio di ciascuna serie, in modo che le potenze degli anni restino ben condizionate
+def fit_trend(years, values, kind='linear'):
+    origin = years.mean(axis=-1)
+    fit = fit_ridge if kind == 'ridge' else fit_linear
+    args = (ridge_alpha,) if kind == 'ridge' else ()
+    coef, intercept = fit(trend_features(years, origin, kind), values, *args)
+    return kind, origin, coef, intercept
+
+def predict_trend(state, future_years):
+    kind, origin, coef, intercept = state
+    return predict_linear(coef, intercept, trend_features(future_years, origin, kind))
+
+# Funzioni di addestramento e previsione dei backend di statsmodels (una serie alla volta, anni consecutivi)
+def fit_arima(years, y):
+    from statsmodels.tsa.arima.model import ARIMA # dipendenza opzionale, importata solo quando serve
+    with warnings.catch_warnings():
+        # Con pochi anni di storico le stime non convergono sempre: le previsioni restano comunque utilizzabili
+        warnings.simplefilter('ignore')
+        return ARIMA(y, order=arima_order, trend='t' if arima_order[1] else 'ct').fit()
+
+def fit_ets(years, y):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing # dipendenza opzionale
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return ExponentialSmoothing(y, trend='add', initialization_method='estimated').fit()
+
+def predict_statsmodels(result, future_years):
+    return np.asarray(result.forecast(len(future_years)))
+
+# Funzione che applica la regressione ridge (con il peso corrente) ai modelli di produzione
+def ridge_regression(X, Y):
+    return fit_ridge(X, Y, ridge_alpha)
+
+register_model('linear', lambda years, values: fit_trend(years, values, 'linear'), predict_trend)
+register_model('ridge', lambda years, values: fit_trend(years, values, 'ridge'), predict_trend, regression=ridge_regression)
+register_model('poly', lambda years, values: fit_trend(years, values, 'poly'), predict_trend)
+register_model('seasonal', lambda years, values: fit_trend(years, values, 'seasonal'), predict_trend)
+register_model('arima', fit_arima, predict_statsmodels, per_series=True)
+register_model('ets', fit_ets, predict_statsmodels, per_series=True)
+
+# Funzione che restituisce il backend registrato con un nome
+def get_backend(name):
+    if name not in forecast_models:
+        raise ValueError(f"Modello previsionale sconosciuto: {name} (disponibili: {', '.join(forecast_models)})")
+    return forecast_models[name]
+
+# Funzione che addestra un backend e calcola le previsioni
+# Restituisce le previsioni, i secondi di addestramento e di previsione e il picco di memoria in byte (None se non misurato)
+def run_backend(name, years, values, future_years):
+    backend = get_backend(name)
+    track_memory = model_track_memory and not tracemalloc.is_tracing()
+    if track_memory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        state = backend['fit'](years, values)
+        fitted = time.perf_counter()
+        predictions = backend['predict'](state, future_years)
+        predicted = time.perf_counter()
+        peak = tracemalloc.get_traced_memory()[1] if track_memory else None
+    finally:
+        if track_memory:
+            tracemalloc.stop()
+    return predictions, fitted - start, predicted - fitted, peak
+
+# Funzione che aggiorna le misure di un backend
+def record_stats(name, n_series, elapsed, results):
+    with model_lock:
+        stats = model_stats.setdefault(name, {'calls': 0, 'series': 0, 'seconds': 0.0, 'fit_seconds': 0.0,
+                                              'predict_seconds': 0.0, 'peak_bytes': None})
+        stats['calls'] += 1
+        stats['series'] += n_series
+        stats['seconds'] += elapsed
+        for _, fit_seconds, predict_seconds, peak in results:
+            stats['fit_seconds'] += fit_seconds
+            stats['predict_seconds'] += predict_seconds
+            if peak is not None:
+                stats['peak_bytes'] = max(stats['peak_bytes'] or 0, peak)
+
+# Funzione eseguita all'avvio di ogni processo del pool: importa statsmodels, in modo che il primo addestramento non
+# paghi il tempo di importazione
+def warm_model_worker():
+    import statsmodels.tsa.api
+
+# Funzione che avvia (se non già attivo) il pool di processi dei backend per serie e lo restituisce (None se disattivato)
+def start_model_pool():
+    global model_executor, model_owner
+    if model_workers <= 0:
+        return None
+    with model_pool_lock:
+        # Un processo figlio creato con fork eredita il riferimento al pool del padre, che non può usare: ne crea uno proprio
+        if model_executor is None or model_owner != os.getpid():
+            model_executor = ProcessPoolExecutor(max_workers=model_workers, initializer=warm_model_worker)
+            model_owner = os.getpid()
+        return model_executor
+
+# Funzione che proietta negli anni futuri un batch di serie storiche con il backend indicato
+# years: (..., anni); values: (..., anni, variabili); future_years: (..., anni futuri)
+# Restituisce le previsioni (..., anni futuri, variabili)
+def forecast_series(name, years, values, future_years):
+    backend = get_backend(name)
+    years = np.asarray(years, dtype=float)
+    values = np.asarray(values, dtype=float)
+    future_years = np.asarray(future_years, dtype=float)
+    batch, (n_years, n_vars) = values.shape[:-2], values.shape[-2:]
+    n_series = int(np.prod(batch, dtype=int)) * n_vars
+    start = time.perf_counter()
+
+    # Backend vettoriale: tutte le variabili e tutte le aziende con un'unica chiamata
+    if not backend['per_series']:
+        results = [run_backend(name, years, values, future_years)]
+        record_stats(name, n_series, time.perf_counter() - start, results)
+        return results[0][0]
+
+    # Backend per serie: una serie per variabile e per azienda (serie i -> azienda i // variabili)
+    series = np.moveaxis(values, -1, -2).reshape(-1, n_years)
+    series_years = np.broadcast_to(years, (*batch, n_years)).reshape(-1, n_years)
+    series_future = np.broadcast_to(future_years, (*batch, future_years.shape[-1])).reshape(-1, future_years.shape[-1])
+    farms = np.arange(len(series)) // n_vars
+    executor = start_model_pool() if len(series) > 1 else None
+    if executor is None:
+        results = [run_backend(name, series_years[f], y, series_future[f]) for f, y in zip(farms, series)]
+    else:
+        chunksize = max(1, len(series) // (4 * model_workers))
+        results = list(executor.map(run_backend, [name] * len(series), series_years[farms], series, series_future[farms],
+                                    chunksize=chunksize))
+    record_stats(name, n_series, time.perf_counter() - start, results)
+
+    predictions = np.array([result[0] for result in results]).reshape(*batch, n_vars, -1)
+    return np.moveaxis(predictions, -1, -2)
+
+# Funzione che restituisce la regressione (X, Y) -> (coefficienti, intercette) dei modelli di produzione di un backend
+def model_regression(name):
+    return get_backend(name)['regression']
+
+# Funzione che restituisce le misure di ciascun backend: chiamate, serie addestrate, tempo complessivo, tempi medi di
+# addestramento e previsione per serie (in millisecondi) e picco di memoria (in byte, se misurato)
+def backend_stats():
+    with model_lock:
+        return {
+            name: {**stats,
+                   'fit_ms_per_series': 1000 * stats['fit_seconds'] / max(stats['series'], 1),
+                   'predict_ms_per_series': 1000 * stats['predict_seconds'] / max(stats['series'], 1)}
+            for name, stats in model_stats.items()
+        }
@@ -0,0 +1,77 @@
+# rasterize.py
+
+# Modulo che converte in immagini PNG i grafici Plotly del report PDF.
+# Invece di chiamare pio.write_image un grafico alla volta (pagando in sequenza l'avvio di Kaleido e il rendering di
+# ciascun grafico) tutti i grafici di un report vengono inviati insieme ad un pool di processi di rendering che resta
+# attivo per tutta la vita del server: ogni processo avvia Kaleido una sola volta (riscaldamento all'avvio) e i grafici
+# vengono convertiti in parallelo, per cui il tempo complessivo è quello del grafico più lento e non la loro somma.
+# Il numero di processi è indicato dalla variabile d'ambiente SIMULAGRO_RENDER_WORKERS (default: uno per grafico del
+# report, al massimo il numero di CPU); con 0 i grafici vengono convertiti in sequenza nel processo corrente.
+# I processi del pool non vengono creati con fork del server (che ha già avviato dei thread, i cui lock potrebbero
+# restare acquisiti nel processo figlio) ma con un contesto forkserver (dove disponibile) o spawn.
+# Contiene le funzioni:
+# - process_context: restituisce il contesto (forkserver o spawn) con cui creare i pool di processi del server
+# - render_figure: converte un grafico in immagine. E' eseguita nei processi del pool
+# - start_renderers: avvia (se non già attivo) il pool di processi di rendering
+# - render_figures: converte in parallelo un elenco di grafici e restituisce le immagini nello stesso ordine.
+#   E' richiamata dalla funzione create_pdf_report del modulo data_export.py e dai lavori del modulo report_jobs.py
+
+# Importazione delle librerie necessarie
+import os, threading, multiprocessing # per leggere la configurazione, proteggere la creazione del pool e il contesto dei processi
+from concurrent.futures import ProcessPoolExecutor # per il pool di processi di rendering
+import plotly.io as pio # per convertire i grafici in immagini
+import plotly.graph_objects as go # per il grafico vuoto usato nel riscaldamento
+
+# Numero di processi di rendering (6 sono i grafici di un report)
+render_workers = int(os.environ.get('SIMULAGRO_RENDER_WORKERS', min(6, os.cpu_count() or 1)))
+
+# Pool di processi di rendering, processo che lo ha creato e relativo lock
+render_executor = None
+render_owner = None
+render_lock = threading.Lock()
+
+# Funzione che restituisce il contesto dei pool di processi del server: forkserver sui sistemi che lo supportano,
+# altrimenti spawn (i processi partono da un interprete nuovo e non ereditano thread e lock del server)
+def process_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+# Funzione che converte un grafico (figura Plotly o dizionario) in un'immagine e ne restituisce i byte
+def render_figure(graph, image_format='png'):
+    return pio.to_image(graph, format=image_format)
+
+# Funzione eseguita all'avvio di ogni processo del pool: avvia Kaleido convertendo un grafico vuoto, in modo che il
+# primo report non paghi il tempo di avvio
+def warm_renderer():
+    render_figure(go.Figure())
+
+# Funzione che avvia (se non già attivo) il pool di processi di rendering e lo restituisce (None se disattivato)
+def start_renderers():
+    global render_executor, render_owner
+    if render_workers <= 0:
+        return None
+    with render_lock:
+        # Un processo figlio creato con fork eredita il riferimento al pool del padre, che non può usare: ne crea uno proprio
+        if render_executor is None or render_owner != os.getpid():
+            render_executor = ProcessPoolExecutor(max_workers=render_workers, mp_context=process_context(),
+                                                  initializer=warm_renderer)
+            render_owner = os.getpid()
+        return render_executor
+
+# Funzione che converte in immagini un elenco di grafici e restituisce i byte delle immagini nello stesso ordine
+# I grafici vuoti (None o dizionari vuoti) restano None, quelli già convertiti (byte) restano invariati: se non ci
+# sono grafici da convertire il pool non viene avviato
+def render_figures(graphs, image_format='png'):
+    images = [graph if isinstance(graph, (bytes, bytearray)) else None for graph in graphs]
+    pending = [i for i, graph in enumerate(graphs) if graph and images[i] is None]
+    if not pending:
+        return images
+    executor = start_renderers()
+    if executor is None:
+        for i in pending:
+            images[i] = render_figure(graphs[i], image_format)
+        return images
+    futures = {i: executor.submit(render_figure, graphs[i], image_format) for i in pending}
+    for i, future in futures.items():
+        images[i] = future.result()
+    return images
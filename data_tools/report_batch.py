@@ -0,0 +1,162 @@
+# report_batch.py
+
+# Generazione dei report PDF in batch, senza dashboard (ad esempio per il report notturno di centinaia di aziende).
+# Le aziende (da una tabella di parametri in CSV o quelle di riferimento, vedi default_farms) vengono simulate con il
+# motore multi-azienda in un'unica elaborazione vettoriale. Per ogni azienda vengono calcolate le previsioni, costruiti
+# i grafici con le funzioni di interface.charts e generato il report con create_pdf_report, come farebbe la dashboard.
+# I report sono distribuiti su più processi: ogni processo converte i grafici in immagini nel proprio Kaleido (avviato
+# una sola volta) e riutilizza logo, stile delle tabelle e copertina. I PDF vengono scritti man mano che sono pronti
+# in una cartella o in un unico file zip; avanzamento e velocità (report al secondo) sono stampati su stderr.
+# Avvio (dalla cartella principale del progetto):
+#   python -m data_tools.report_batch --farms 300 --output reports.zip
+#   python -m data_tools.report_batch --farms-csv aziende.csv --output reports/ --workers 4
+# Contiene le funzioni:
+# - load_farms: legge la tabella dei parametri delle aziende (le colonne mancanti assumono i valori di riferimento)
+# - farm_tasks: simula le aziende e restituisce i dati necessari al report di ciascuna
+# - build_report: genera il report PDF di un'azienda. E' eseguita nei processi del pool
+# - run_batch: genera tutti i report e li scrive nella cartella o nel file zip di destinazione
+# - main: interfaccia a riga di comando
+
+# Importazione delle librerie necessarie
+import os, sys, time, argparse, zipfile # per la riga di comando, i file di output e la misura dei tempi
+from datetime import datetime # per la data di creazione dei report
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait # per distribuire i report sui processi
+import pandas as pd # per la gestione dei DataFrame
+from data_tools import rasterize # per la conversione dei grafici in immagini
+from data_tools.rng import spawn_seeds # per i flussi casuali indipendenti delle aziende
+from data_tools.data_simulator import default_farms, simulate_farms, farm_param_cols, env_cols, prod_cols, perf_cols
+from data_tools.data import calc_future_production, calc_future_ensemble
+from data_tools.data_export import create_pdf_report, format_table_data, cover_assets
+from interface.charts import create_fig_env, create_fig_prod, create_fig_perf, create_fig_future, create_fig_nextyear
+
+# Numero predefinito di processi (uno per CPU)
+batch_workers = os.cpu_count() or 1
+# Numero di realizzazioni dell'ensemble usato per le bande di confidenza dei report
+batch_ensemble_members = 2000
+
+# Funzione che legge la tabella dei parametri delle aziende da un file CSV
+# Le colonne non presenti assumono i valori dell'azienda di riferimento; se manca farm_id si numerano le righe
+def load_farms(path):
+    df_farms = pd.read_csv(path)
+    defaults = default_farms(len(df_farms))
+    for col in ['farm_id'] + farm_param_cols:
+        if col not in df_farms.columns:
+            df_farms[col] = defaults[col].to_numpy()
+    return df_farms[['farm_id'] + farm_param_cols]
+
+# Funzione che simula le aziende e restituisce, per ciascuna, i dati necessari al report:
+# (farm_id, df_env, df_prod, df_perf, seme delle previsioni)
+def farm_tasks(df_farms, seed=None):
+    sim_seed, future_seed = spawn_seeds(seed, 2)
+    df = simulate_farms(df_farms, seed=sim_seed)
+    future_seeds = spawn_seeds(future_seed, len(df_farms))
+    for (farm_id, df_farm), farm_seed in zip(df.groupby('farm_id', sort=False), future_seeds):
+        df_farm = df_farm.reset_index(drop=True)
+        yield (farm_id, df_farm[['Year'] + env_cols], df_farm[['Year'] + prod_cols], df_farm[['Year'] + perf_cols].round(3),
+               farm_seed)
+
+# Funzione eseguita all'avvio di ogni processo del pool: i grafici vengono convertiti nel processo stesso (il
+# parallelismo è tra i report) e Kaleido, logo e copertina vengono preparati prima del primo report
+def init_worker():
+    rasterize.render_workers = 0
+    rasterize.warm_renderer()
+    cover_assets()
+
+# Funzione che genera il report PDF di un'azienda e ne restituisce (farm_id, byte del PDF)
+# Grafici e tabelle sono gli stessi che la dashboard mostra al caricamento della pagina
+def build_report(task, generated_at=None):
+    farm_id, df_env, df_prod, df_perf, seed = task
+    df_env, df_prod = df_env.round(3), df_prod.round(3)
+
+    # Previsioni per il quinquennio successivo, con le bande di confidenza dell'ensemble
+    # Previsione ed ensemble ricevono flussi casuali indipendenti, derivati dal seme dell'azienda
+    future_seed, ensemble_seed = spawn_seeds(seed, 2)
+    df_future = calc_future_production(df_env, df_prod, rng=future_seed)
+    df_bands = calc_future_ensemble(df_env, df_prod, n_members=batch_ensemble_members, seed=ensemble_seed)
+    # Dati del primo anno previsionale (grafico e tabella previsionali singolo anno)
+    df_baseline = df_future[df_future['Year'] == df_future['Year'].min()].round(3)
+    baseline = df_baseline.iloc[0]
+    fig_nextyear, _ = create_fig_nextyear(df_baseline, baseline['Temperature'], baseline['Humidity'], baseline['Precipitation'])
+
+    graphs = [create_fig_env(df_env), create_fig_prod(df_prod), *create_fig_perf(df_perf), create_fig_future(df_future, df_bands),
+              fig_nextyear]
+    tables = [format_table_data(df_env), format_table_data(df_prod), format_table_data(df_perf),
+              format_table_data(df_future.round(3)), format_table_data(df_baseline)]
+    return farm_id, create_pdf_report(graphs, tables, generated_at=generated_at).getvalue()
+
+# Funzione che genera i report di tutte le aziende e li scrive, man mano che sono pronti, nella cartella o nel file zip
+# indicato da output. Con workers <= 1 i report sono generati nel processo corrente (i grafici di ciascun report
+# vengono comunque convertiti in parallelo dal pool di data_tools.rasterize).
+# on_progress (opzionale) viene richiamata dopo ogni report con il numero di report completati e quello totale.
+# Restituisce il numero di report generati e il tempo impiegato (in secondi)
+def run_batch(df_farms, output, seed=None, workers=batch_workers, on_progress=None):
+    generated_at = datetime.now() # Stessa data di creazione per tutti i report del batch
+    total = len(df_farms)
+    tasks = farm_tasks(df_farms, seed)
+    start = time.perf_counter()
+
+    # Destinazione: un file zip (i PDF sono già compressi e vengono solo archiviati) oppure una cartella
+    if output.endswith('.zip'):
+        archive = zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED)
+        write = lambda name, pdf_bytes: archive.writestr(name, pdf_bytes)
+    else:
+        archive = None
+        os.makedirs(output, exist_ok=True)
+        def write(name, pdf_bytes):
+            with open(os.path.join(output, name), 'wb') as f:
+                f.write(pdf_bytes)
+
+    done = 0
+    def collect(farm_id, pdf_bytes):
+        nonlocal done
+        write(f'report_{farm_id}.pdf', pdf_bytes)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, total)
+
+    try:
+        if workers <= 1:
+            for task in tasks:
+                collect(*build_report(task, generated_at))
+        else:
+            # Al più due report in attesa per processo: i dati delle aziende vengono inviati e i PDF scritti
+            # man mano, senza tenere in memoria l'intero batch
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+                pending = set()
+                for task in tasks:
+                    pending.add(executor.submit(build_report, task, generated_at))
+                    if len(pending) >= 2 * workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            collect(*future.result())
+                for future in wait(pending).done:
+                    collect(*future.result())
+    finally:
+        if archive is not None:
+            archive.close()
+    return done, time.perf_counter() - start
+
+# Interfaccia a riga di comando
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera in batch i report PDF di più aziende")
+    farms = parser.add_mutually_exclusive_group()
+    farms.add_argument('--farms', type=int, default=1, help="numero di aziende di riferimento da simulare")
+    farms.add_argument('--farms-csv', help="file CSV con i parametri delle aziende (colonne di default_farms)")
+    parser.add_argument('--output', required=True, help="cartella di destinazione o file .zip")
+    parser.add_argument('--seed', type=int, default=None, help="seme della simulazione (default: casuale)")
+    parser.add_argument('--workers', type=int, default=batch_workers, help="numero di processi")
+    args = parser.parse_args(argv)
+
+    df_farms = load_farms(args.farms_csv) if args.farms_csv else default_farms(args.farms)
+    start = time.perf_counter()
+
+    # Avanzamento e velocità su stderr (sulla stessa riga)
+    def on_progress(done, total):
+        elapsed = time.perf_counter() - start
+        print(f"\r{done}/{total} report - {done / elapsed:.2f} report/s", end='', file=sys.stderr, flush=True)
+
+    done, elapsed = run_batch(df_farms, args.output, seed=args.seed, workers=args.workers, on_progress=on_progress)
+    print(f"\n{done} report generati in {elapsed:.1f} s ({done / elapsed:.2f} report/s) -> {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# report_jobs.py
+
+# Modulo che genera i report PDF in background.
+# La callback del pulsante "Genera Report" non esegue più create_pdf_report (che rasterizza sei grafici e blocca la
+# richiesta per alcuni secondi) ma accoda un lavoro e restituisce subito. Il lavoro vero e proprio avviene fuori dal
+# processo del server, in modo da non sottrarre tempo (e il GIL) alle callback:
+# - i grafici vengono convertiti in immagini dai processi di rendering (data_tools.rasterize)
+# - il PDF (impaginazione con reportlab e formattazione delle tabelle) viene composto in un pool di processi dei
+#   report, creati con un contesto forkserver o spawn (vedi process_context in data_tools.rasterize)
+# Nel server restano solo dei thread di coordinamento, che attendono i processi senza occupare la CPU. I pool vengono
+# avviati all'avvio di ogni worker di gunicorn (vedi gunicorn.conf.py) o, con il server di sviluppo, alla prima richiesta.
+# La dashboard interroga periodicamente lo stato del lavoro (polling) e mostra l'avanzamento; a lavoro concluso
+# il PDF viene scaricato. I PDF completati sono conservati in una cache indicizzata dall'hash del contenuto
+# (grafici e tabelle): una dashboard identica non viene generata di nuovo.
+# La cache è in memoria e, se è impostata la variabile d'ambiente SIMULAGRO_REPORT_DIR, anche su disco (condivisa
+# tra i processi del server). Nella stessa cartella viene salvato lo stato di ogni lavoro (stato, avanzamento ed
+# eventuale errore, in un file JSON aggiornato dal processo che lo esegue): l'interrogazione dello stato può così
+# raggiungere un worker qualsiasi del server, non solo quello che ha accodato il lavoro.
+# Contiene le funzioni:
+# - report_key: calcola l'hash del contenuto di un report
+# - write_job_state, read_job_state: salvano e leggono lo stato condiviso di un lavoro
+# - start_pool: avvia (se non già attivi) i pool dei report e dei processi di rendering
+# - submit_report: accoda la generazione di un report e ne restituisce l'identificativo
+# - report_status: restituisce lo stato e l'avanzamento di un lavoro
+# - report_result: restituisce il PDF di un lavoro completato
+# - run_report_job: coordina la generazione di un report. E' eseguita nei thread di coordinamento
+# - build_report_pdf: compone il PDF a partire dalle immagini dei grafici. E' eseguita nei processi dei report
+
+# Importazione delle librerie necessarie
+import os, json, time, hashlib, threading # per chiavi, file e accesso concorrente
+from collections import OrderedDict # per la cache dei PDF in memoria
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor # per i thread di coordinamento e i processi dei report
+from data_tools.frame import ColumnFrame # tabelle colonnari del report
+from data_tools.data_export import create_pdf_report, cover_assets, report_steps # per la generazione del PDF
+from data_tools.rasterize import start_renderers, render_figures, process_context # per i processi di rendering dei grafici
+
+# Numero di report generati in contemporanea (variabile d'ambiente SIMULAGRO_REPORT_WORKERS, default 2)
+report_workers = int(os.environ.get('SIMULAGRO_REPORT_WORKERS', 2))
+# Numero massimo di PDF conservati in memoria
+report_cache_size = 32
+# Secondi dopo i quali lo stato condiviso di un lavoro in corso che non viene più aggiornato (ad esempio perché il
+# processo che lo eseguiva è terminato) non è più considerato valido
+report_state_timeout = 300
+
+# Stato del modulo: thread di coordinamento e processi dei report (con il processo che li ha creati e il relativo lock),
+# avanzamento e lavori in corso, PDF completati
+report_lock = threading.Lock()
+report_pool_lock = threading.Lock()
+report_executor = None
+report_processes = None
+report_owner = None
+report_progress = {}
+report_futures = {}
+report_cache = OrderedDict()
+
+# Funzione che calcola l'hash del contenuto di un report (grafici e tabelle colonnari)
+def report_key(graphs, tables):
+    digest = hashlib.sha1()
+    digest.update(json.dumps(graphs, sort_keys=True, default=str).encode())
+    for table in tables:
+        digest.update(table.to_bytes())
+    return digest.hexdigest()
+
+# Funzione che restituisce il percorso su disco di un PDF (None se la cache su disco non è attiva)
+def report_path(key, ext='pdf'):
+    folder = os.environ.get('SIMULAGRO_REPORT_DIR')
+    return os.path.join(folder, f'{key}.{ext}') if folder else None
+
+# Funzione che scrive un file in modo atomico (file temporaneo e rinomina: gli altri processi non lo leggono mai incompleto)
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Funzione che salva lo stato condiviso di un lavoro ('queued', 'running', 'done' o 'error'), il suo avanzamento ed
+# eventualmente l'errore. Senza SIMULAGRO_REPORT_DIR lo stato resta solo nel processo che esegue il lavoro
+def write_job_state(key, state, progress=0.0, error=None):
+    path = report_path(key, 'json')
+    if path:
+        write_atomic(path, json.dumps({'state': state, 'progress': progress, 'error': error, 'updated': time.time()}).encode())
+
+# Funzione che legge lo stato condiviso di un lavoro (None se non disponibile)
+# Lo stato di un lavoro in coda o in corso non aggiornato da più di report_state_timeout secondi non è valido
+def read_job_state(key):
+    path = report_path(key, 'json')
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state['state'] in ('queued', 'running') and time.time() - state['updated'] > report_state_timeout:
+        return None
+    return state
+
+# Funzione eseguita all'avvio di ogni processo dei report: carica gli elementi fissi della copertina, in modo che il
+# primo report non ne paghi il caricamento
+def warm_report_process():
+    cover_assets()
+
+# Funzione che avvia (se non già attivi) i processi di rendering dei grafici, i processi dei report e i thread di
+# coordinamento, e restituisce questi ultimi. E' richiamata all'avvio dei worker di gunicorn e alla prima richiesta
+def start_pool():
+    global report_executor, report_processes, report_owner
+    with report_pool_lock:
+        # Un processo figlio creato con fork eredita i riferimenti ai pool del padre, che non può usare: ne crea di propri
+        if report_executor is None or report_owner != os.getpid():
+            start_renderers()
+            report_processes = ProcessPoolExecutor(max_workers=report_workers, mp_context=process_context(),
+                                                   initializer=warm_report_process)
+            report_executor = ThreadPoolExecutor(max_workers=report_workers, thread_name_prefix='report')
+            report_owner = os.getpid()
+        return report_executor
+
+# Funzione che compone il PDF di un lavoro a partire dalle immagini dei grafici già convertite. Viene eseguita in un
+# processo dei report, che aggiorna l'avanzamento nello stato condiviso (se disponibile)
+def build_report_pdf(key, images, tables):
+    def on_progress(done, total):
+        write_job_state(key, 'running', done / total)
+    return create_pdf_report(images, tables, on_progress=on_progress).getvalue()
+
+# Funzione che coordina la generazione del PDF di un lavoro: viene eseguita in un thread di coordinamento, che invia i
+# grafici ai processi di rendering e le immagini ottenute ad un processo dei report, e ne attende i risultati.
+# Aggiorna l'avanzamento (anche nello stato condiviso); un errore viene registrato nello stato condiviso e poi rilanciato
+def run_report_job(key, graphs, tables):
+    try:
+        write_job_state(key, 'running')
+        images = render_figures(graphs)
+        report_progress[key] = 1 / report_steps
+        write_job_state(key, 'running', 1 / report_steps)
+        pdf_bytes = report_processes.submit(build_report_pdf, key, images, tables).result()
+        # Salvataggio su disco (file temporaneo e rinomina, per non esporre mai un PDF incompleto)
+        path = report_path(key)
+        if path:
+            write_atomic(path, pdf_bytes)
+    except Exception as error:
+        write_job_state(key, 'error', error=str(error) or type(error).__name__)
+        raise
+    write_job_state(key, 'done', 1.0)
+    return pdf_bytes
+
+# Funzione che restituisce il PDF di un report dalla cache (in memoria o su disco), None se non disponibile
+def cached_report(key):
+    with report_lock:
+        pdf_bytes = report_cache.get(key)
+        if pdf_bytes is not None:
+            report_cache.move_to_end(key)
+            return pdf_bytes
+    path = report_path(key)
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            pdf_bytes = f.read()
+        store_report(key, pdf_bytes)
+        return pdf_bytes
+    return None
+
+# Funzione che conserva in memoria il PDF di un report, eliminando i meno recenti oltre il limite
+def store_report(key, pdf_bytes):
+    with report_lock:
+        report_cache[key] = pdf_bytes
+        report_cache.move_to_end(key)
+        while len(report_cache) > report_cache_size:
+            report_cache.popitem(last=False)
+
+# Funzione che accoda la generazione di un report e ne restituisce l'identificativo (l'hash del contenuto)
+# Le tabelle sono tabelle colonnari (ColumnFrame), DataFrame o elenchi di record: le tabelle colonnari sono in sola
+# lettura, per cui il lavoro le usa senza copiarle
+# Se il report è già in cache o in corso di generazione (in questo o in un altro processo) non viene accodato un
+# nuovo lavoro
+def submit_report(graphs, tables):
+    tables = [ColumnFrame.coerce(table) for table in tables]
+    key = report_key(graphs, tables)
+    if cached_report(key) is not None:
+        return key
+    with report_lock:
+        future = report_futures.get(key)
+        shared = read_job_state(key) if future is None else None
+        if shared is not None and shared['state'] in ('queued', 'running'):
+            return key
+        if future is None or (future.done() and future.exception() is not None):
+            executor = start_pool()
+            report_progress[key] = 0.0
+            write_job_state(key, 'queued')
+            report_futures[key] = executor.submit(run_report_job, key, graphs, tables)
+    return key
+
+# Funzione che restituisce lo stato di un lavoro: un dizionario con 'state' ('queued', 'running', 'done', 'error'
+# o 'unknown'), 'progress' (tra 0 e 1) ed eventualmente 'error'
+# I lavori accodati da altri processi sono letti dallo stato condiviso; 'unknown' indica un lavoro di cui questo
+# processo non ha (ancora) notizia
+def report_status(key):
+    if cached_report(key) is not None:
+        return {'state': 'done', 'progress': 1.0}
+    with report_lock:
+        future = report_futures.get(key)
+    if future is None:
+        shared = read_job_state(key)
+        if shared is None or shared['state'] == 'done': # PDF non (più) disponibile
+            return {'state': 'unknown', 'progress': 0.0}
+        status = {'state': shared['state'], 'progress': shared['progress']}
+        return dict(status, error=shared['error']) if shared['state'] == 'error' else status
+    if future.done():
+        error = future.exception()
+        if error is not None:
+            return {'state': 'error', 'progress': 0.0, 'error': str(error) or type(error).__name__}
+        # Il PDF completato passa nella cache e il lavoro viene rimosso dall'elenco di quelli in corso
+        store_report(key, future.result())
+        with report_lock:
+            report_futures.pop(key, None)
+            report_progress.pop(key, None)
+        return {'state': 'done', 'progress': 1.0}
+    # L'avanzamento della composizione del PDF è noto solo dallo stato condiviso, aggiornato dal processo dei report
+    progress = report_progress.get(key, 0.0)
+    shared = read_job_state(key)
+    if shared is not None and shared['state'] == 'running':
+        progress = max(progress, shared['progress'])
+    return {'state': 'running' if future.running() or progress > 0 else 'queued', 'progress': progress}
+
+# Funzione che restituisce il PDF (in byte) di un lavoro completato, None se non è disponibile
+def report_result(key):
+    if report_status(key)['state'] != 'done':
+        return None
+    return cached_report(key)
@@ -0,0 +1,219 @@
+# result_store.py
+
+# Modulo che conserva lato server i DataFrame prodotti dalle callback (ad esempio i dati previsionali), in modo che
+# al browser venga inviata solo una piccola chiave invece dell'intero contenuto in formato JSON.
+# I dati sono salvati in forma colonnare (un array NumPy per colonna):
+# - in memoria, in una LRU con un numero massimo di risultati
+# - oppure su file locali (un file .npy per colonna) nella cartella indicata dalla variabile d'ambiente
+#   SIMULAGRO_RESULT_DIR: in questo caso la chiave è valida per tutti i processi del server e la lettura avviene
+#   tramite memory map, senza copiare i dati. La cartella viene ripulita periodicamente: sono eliminati i risultati
+#   non usati da più di SIMULAGRO_RESULT_MAX_AGE secondi (default 1 ora) e, se la cartella supera
+#   SIMULAGRO_RESULT_MAX_MB megabyte (default 1024), i meno recenti fino a rientrare nel limite
+# La chiave è l'hash del contenuto: lo stesso risultato salvato più volte occupa spazio una sola volta.
+# Le colonne di testo (array di oggetti stringa, ad esempio le colonne object dei DataFrame) vengono convertite in
+# array di stringhe a lunghezza fissa, salvabili su file senza pickle; le colonne di altri oggetti non sono supportate
+# (TypeError), in memoria come su file.
+# Contiene le funzioni:
+# - put_frame: salva un DataFrame e ne restituisce la chiave
+# - get_frame: restituisce il DataFrame associato ad una chiave (None se non più disponibile)
+# - put_columns, get_columns: come le precedenti, ma a partire da un dizionario colonna -> array
+# - column_array: converte una colonna in un array salvabile (stringhe a lunghezza fissa per le colonne di testo)
+# - result_key: calcola la chiave (hash del contenuto) di un dizionario colonna -> array
+# - clean_result_dir: elimina dalla cartella dei risultati quelli scaduti o in eccesso
+
+# Importazione delle librerie necessarie
+import os, json, time, shutil, hashlib, threading # per chiavi, file, pulizia e accesso concorrente
+from collections import OrderedDict # per la LRU in memoria
+import numpy as np # per gli array colonnari
+import pandas as pd # per i DataFrame
+from data_tools.metrics import timed # per misurare i tempi delle funzioni richiamate dalle callback
+
+# Numero massimo di risultati conservati in memoria
+result_store_size = 256
+# Limiti della cartella dei risultati su file: età massima (secondi dall'ultimo utilizzo) e dimensione massima (MB)
+result_max_age = float(os.environ.get('SIMULAGRO_RESULT_MAX_AGE', 3600))
+result_max_mb = float(os.environ.get('SIMULAGRO_RESULT_MAX_MB', 1024))
+# Intervallo minimo (in secondi) tra due pulizie della cartella da parte dello stesso processo
+result_clean_interval = 60
+
+# Risultati in memoria (chiave -> dizionario colonna -> array) e relativo lock
+result_entries = OrderedDict()
+result_lock = threading.Lock()
+# Istante dell'ultima pulizia della cartella dei risultati
+result_cleaned = {'time': 0.0}
+
+# Funzione che restituisce la cartella dei risultati su file (None se si usa solo la memoria)
+def result_dir():
+    return os.environ.get('SIMULAGRO_RESULT_DIR') or None
+
+# Funzione che converte una colonna in un array contiguo salvabile su file: le colonne di oggetti stringa diventano
+# array di stringhe a lunghezza fissa, le colonne di altri oggetti sollevano TypeError
+def column_array(col, values):
+    values = np.asarray(values)
+    if values.dtype == object:
+        if not all(isinstance(value, str) for value in values.flat):
+            raise TypeError(f"La colonna {col} contiene oggetti non supportati dall'archivio dei risultati "
+                            "(sono ammessi solo numeri, date e stringhe)")
+        values = values.astype(str)
+    return np.ascontiguousarray(values)
+
+# Funzione che calcola la chiave di un dizionario colonna -> array sul contenuto (nomi, tipi, forme e dati delle colonne)
+def result_key(columns):
+    digest = hashlib.sha1()
+    for col, values in columns.items():
+        values = np.asarray(values)
+        digest.update(f'{col}|{values.dtype.str}|{values.shape}|'.encode())
+        digest.update(values.tobytes())
+    return digest.hexdigest()
+
+# Funzione che salva un dizionario colonna -> array e ne restituisce la chiave
+def put_columns(columns):
+    columns = {str(col): column_array(col, values) for col, values in columns.items()}
+    key = result_key(columns)
+
+    folder = result_dir()
+    if folder:
+        path = os.path.join(folder, key)
+        if os.path.exists(path):
+            touch_result(path) # risultato già salvato: ne viene rinnovata la scadenza
+        else:
+            # Scrittura in una cartella temporanea e rinomina: gli altri processi non vedono mai un risultato incompleto
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            os.makedirs(tmp_path, exist_ok=True)
+            for i, values in enumerate(columns.values()):
+                np.save(os.path.join(tmp_path, f'{i}.npy'), values, allow_pickle=False)
+            with open(os.path.join(tmp_path, 'columns.json'), 'w') as f:
+                json.dump(list(columns), f)
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                shutil.rmtree(tmp_path, ignore_errors=True) # un altro processo ha già salvato lo stesso risultato
+        maybe_clean(folder)
+        return key
+
+    with result_lock:
+        result_entries[key] = columns
+        result_entries.move_to_end(key)
+        while len(result_entries) > result_store_size:
+            result_entries.popitem(last=False)
+    return key
+
+# Funzione che restituisce il dizionario colonna -> array associato ad una chiave (None se non disponibile)
+# Gli array restituiti sono in sola lettura
+def get_columns(key):
+    if not key:
+        return None
+    folder = result_dir()
+    if folder:
+        path = os.path.join(folder, os.path.basename(key))
+        try:
+            with open(os.path.join(path, 'columns.json')) as f:
+                names = json.load(f)
+            columns = {col: np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r', allow_pickle=False)
+                       for i, col in enumerate(names)}
+        except (OSError, ValueError):
+            return None
+        touch_result(path)
+        return columns
+
+    with result_lock:
+        columns = result_entries.get(key)
+        if columns is None:
+            return None
+        result_entries.move_to_end(key)
+    views = {}
+    for col, values in columns.items():
+        view = values.view()
+        view.flags.writeable = False
+        views[col] = view
+    return views
+
+# Funzione che rinnova l'istante di ultimo utilizzo di un risultato su file (data di modifica della cartella)
+def touch_result(path):
+    try:
+        os.utime(path)
+    except OSError:
+        pass # risultato appena eliminato dalla pulizia di un altro processo
+
+# Funzione che elimina dalla cartella dei risultati quelli non usati da più di max_age secondi e, se la cartella supera
+# max_mb megabyte, i meno recenti fino a rientrare nel limite. Vengono eliminate anche le cartelle temporanee rimaste
+# da scritture interrotte. Ogni risultato viene prima rinominato e poi eliminato, per cui un processo che lo sta
+# leggendo non ne vede mai solo una parte (i file già aperti in memory map restano validi fino alla chiusura)
+# I risultati possono essere cartelle (come in questo modulo) o singoli file (come nella cache su disco di
+# data_tools.memo); pattern limita la pulizia agli elementi il cui nome lo contiene.
+# Restituisce il numero di risultati eliminati
+def clean_result_dir(folder, max_age=None, max_mb=None, pattern=None):
+    max_age = result_max_age if max_age is None else max_age
+    max_mb = result_max_mb if max_mb is None else max_mb
+    now = time.time()
+    entries = []
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return 0
+    for name in names:
+        if pattern is not None and pattern not in name:
+            continue
+        path = os.path.join(folder, name)
+        try:
+            stat = os.stat(path)
+            mtime = stat.st_mtime
+            size = (sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                    if os.path.isdir(path) else stat.st_size)
+        except OSError:
+            continue
+        if name.endswith('.tmp') or name.endswith('.del'):
+            if now - mtime > max_age:
+                remove_result(path)
+            continue
+        entries.append((mtime, size, path))
+
+    # Risultati scaduti e, oltre la dimensione massima, i meno recenti
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if now - mtime <= max_age and total <= max_mb * 2 ** 20:
+            break
+        removed_path = f'{path}.{os.getpid()}.{threading.get_ident()}.del'
+        try:
+            os.replace(path, removed_path)
+        except OSError:
+            continue # già eliminato da un altro processo
+        remove_result(removed_path)
+        total -= size
+        removed += 1
+    return removed
+
+# Funzione che elimina un risultato (cartella o file)
+def remove_result(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Funzione che ripulisce la cartella dei risultati se dall'ultima pulizia del processo è trascorso l'intervallo previsto
+def maybe_clean(folder):
+    now = time.monotonic()
+    with result_lock:
+        if now - result_cleaned['time'] < result_clean_interval:
+            return
+        result_cleaned['time'] = now
+    clean_result_dir(folder)
+
+# Funzione che salva un DataFrame e ne restituisce la chiave
+@timed()
+def put_frame(df):
+    return put_columns({col: df[col].to_numpy() for col in df.columns})
+
+# Funzione che restituisce il DataFrame associato ad una chiave (None se non disponibile)
+# Il DataFrame viene costruito sugli array salvati senza copiarli
+@timed()
+def get_frame(key):
+    columns = get_columns(key)
+    if columns is None:
+        return None
+    return pd.DataFrame(columns, copy=False)
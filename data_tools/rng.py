@@ -0,0 +1,61 @@
+# rng.py
+
+# Modulo che gestisce i generatori di numeri casuali del simulatore e delle previsioni.
+# Invece dello stato globale di np.random (condiviso tra thread e, dopo un fork, tra processi) ogni funzione riceve un
+# numpy.random.Generator esplicito: a parità di seme i risultati sono identici, per cui possono essere memorizzati in
+# cache e calcolati in parallelo in modo corretto. Aziende, scenari e realizzazioni ricevono flussi indipendenti
+# derivati (spawn) da un unico SeedSequence.
+# Contiene:
+# - make_rng: restituisce un Generator a partire da un seme (intero, SeedSequence, Generator o None)
+# - spawn_rngs: deriva n flussi indipendenti da un seme
+# - spawn_seeds: deriva n SeedSequence indipendenti (utili da passare ai processi di un pool)
+# - StackedStreams: raccoglie più flussi indipendenti (ad esempio uno per azienda) e li espone come un unico
+#   generatore, in cui ogni flusso produce il proprio blocco consecutivo di valori
+
+# Importazione delle librerie necessarie
+import numpy as np # per i generatori di numeri casuali
+
+# Funzione che restituisce un Generator a partire da un seme
+# Se il seme è già un Generator (o uno StackedStreams) viene restituito così com'è, per cui le funzioni possono
+# accettare indifferentemente un seme o un generatore già creato; con None si usa l'entropia del sistema
+def make_rng(seed=None):
+    if isinstance(seed, (np.random.Generator, StackedStreams)):
+        return seed
+    return np.random.default_rng(seed)
+
+# Funzione che deriva n SeedSequence indipendenti da un seme
+def spawn_seeds(seed, n):
+    if isinstance(seed, np.random.Generator):
+        return seed.bit_generator.seed_seq.spawn(n)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n)
+
+# Funzione che deriva n generatori indipendenti da un seme
+def spawn_rngs(seed, n):
+    return [np.random.default_rng(child) for child in spawn_seeds(seed, n)]
+
+# Classe che raccoglie più flussi indipendenti e li espone come un unico generatore
+# Ogni estrazione di dimensione len(rngs) * block_size è composta da un blocco di block_size valori per ciascun flusso
+# (nell'ordine dei flussi). In questo modo i valori di un'azienda dipendono solo dal suo flusso e non da quante altre
+# aziende vengono simulate insieme, mentre i calcoli successivi restano vettoriali sull'intero array
+class StackedStreams:
+    def __init__(self, rngs, block_size):
+        self.rngs = rngs
+        self.block_size = block_size
+
+    def _check_size(self, size):
+        if size != len(self.rngs) * self.block_size:
+            raise ValueError(f"size deve essere {len(self.rngs) * self.block_size} (flussi x blocco), ricevuto {size}")
+
+    # Estrazione uniforme in [low, high) (stessa formula di Generator.uniform)
+    def uniform(self, low=0.0, high=1.0, size=None):
+        self._check_size(size)
+        u = np.concatenate([rng.random(self.block_size) for rng in self.rngs])
+        return low + (np.asarray(high) - low) * u
+
+    # Estrazione normale (stessa formula di Generator.normal)
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        self._check_size(size)
+        z = np.concatenate([rng.standard_normal(self.block_size) for rng in self.rngs])
+        return loc + np.asarray(scale) * z
@@ -0,0 +1,143 @@
+# snapshot.py
+
+# Istantanea (snapshot) in sola lettura dei dati iniziali della dashboard: dati casuali ambientali, di produzione e di
+# performance, previsioni e relative bande di confidenza. L'istantanea viene calcolata una sola volta e pubblicata su
+# file (un file .npy per colonna); ogni processo del server vi si collega tramite memory map, senza ricalcolarla né
+# copiarne i dati. In questo modo tutti i worker (ad esempio quelli di gunicorn) mostrano gli stessi dati iniziali e
+# le pagine di memoria dei dati sono condivise tra i processi.
+# La cartella dell'istantanea è indicata dalla variabile d'ambiente SIMULAGRO_SNAPSHOT_DIR: in questo caso l'istantanea
+# resta valida anche dopo il riavvio del server (per rigenerarla basta eliminare la cartella) e, se più processi la
+# richiedono insieme, la calcola solo il primo (lock sul file). Senza la variabile l'istantanea viene creata in una
+# cartella temporanea dal primo processo che la richiede, che ne indica il percorso ai processi figli (variabile
+# d'ambiente, ereditata con la fork dei worker) e la elimina alla chiusura.
+# Il seme dei dati casuali è indicato dalla variabile d'ambiente SIMULAGRO_SNAPSHOT_SEED (default: seme casuale,
+# scelto una volta per istantanea e salvato con i dati).
+# Contiene le funzioni:
+# - build_snapshot: calcola i DataFrame dell'istantanea
+# - publish_snapshot: salva i DataFrame dell'istantanea in una cartella
+# - attach_snapshot: si collega ad un'istantanea salvata (None se non disponibile)
+# - initial_snapshot: restituisce l'istantanea del server, calcolandola e pubblicandola se non ancora disponibile.
+#   E' richiamata dalle callback del modulo interface.callbacks
+
+# Importazione delle librerie necessarie
+import os, json, shutil, atexit, tempfile, threading # per file, variabili d'ambiente e accesso concorrente
+import numpy as np # per gli array colonnari
+import pandas as pd # per i DataFrame
+from data_tools.data import calc_future_production, calc_future_ensemble, default_seed
+from data_tools.data_simulator import generate_random_data
+from data_tools.metrics import timed # per misurare i tempi di calcolo e di collegamento
+
+try:
+    import fcntl # lock tra processi (solo sistemi Unix)
+except ImportError:
+    fcntl = None
+
+# Versione del formato dell'istantanea (un'istantanea salvata con un formato diverso viene ricalcolata)
+snapshot_version = 1
+# Variabile d'ambiente con cui il processo che crea l'istantanea temporanea ne indica il percorso ai processi figli
+snapshot_env = 'SIMULAGRO_SNAPSHOT_PATH'
+
+# Istantanea a cui il processo è collegato e relativo lock
+snapshot_state = {}
+snapshot_lock = threading.Lock()
+
+# Funzione che calcola i DataFrame dell'istantanea a partire dal seme dei dati casuali
+# Le previsioni e le bande di confidenza sono calcolate sui dati iniziali arrotondati a 3 decimali, come nelle callback
+@timed()
+def build_snapshot(seed):
+    df_env, df_prod, df_perf = generate_random_data(seed=seed)
+    df_env_round, df_prod_round = df_env.round(3), df_prod.round(3)
+    return {'env': df_env, 'prod': df_prod, 'perf': df_perf,
+            'future': calc_future_production(df_env_round, df_prod_round, rng=default_seed),
+            'bands': calc_future_ensemble(df_env_round, df_prod_round, seed=default_seed)}
+
+# Funzione che salva i DataFrame dell'istantanea (e il seme) nella cartella indicata
+# Scrittura in una cartella temporanea e rinomina: gli altri processi non vedono mai un'istantanea incompleta
+def publish_snapshot(frames, path, seed=None):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    os.makedirs(tmp_path, exist_ok=True)
+    meta = {'version': snapshot_version, 'seed': seed, 'frames': {}}
+    for name, df in frames.items():
+        meta['frames'][name] = [str(col) for col in df.columns]
+        for i, col in enumerate(df.columns):
+            np.save(os.path.join(tmp_path, f'{name}.{i}.npy'), np.ascontiguousarray(df[col].to_numpy()), allow_pickle=False)
+    with open(os.path.join(tmp_path, 'snapshot.json'), 'w') as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True) # un altro processo ha già pubblicato l'istantanea
+
+# Funzione che si collega all'istantanea salvata nella cartella indicata
+# Restituisce il dizionario nome -> DataFrame (costruiti sulle memory map dei file, in sola lettura) e il seme,
+# None se l'istantanea non è disponibile o è stata salvata con un formato diverso
+@timed()
+def attach_snapshot(path):
+    try:
+        with open(os.path.join(path, 'snapshot.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != snapshot_version:
+            return None
+        frames = {name: pd.DataFrame({col: np.load(os.path.join(path, f'{name}.{i}.npy'), mmap_mode='r', allow_pickle=False)
+                                      for i, col in enumerate(columns)}, copy=False)
+                  for name, columns in meta['frames'].items()}
+    except (OSError, ValueError, KeyError):
+        return None
+    return frames, meta['seed']
+
+# Funzione che restituisce il seme dei dati casuali di una nuova istantanea
+def snapshot_seed():
+    seed = os.environ.get('SIMULAGRO_SNAPSHOT_SEED')
+    return int(seed) if seed else int(np.random.SeedSequence().entropy % 2 ** 63)
+
+# Funzione che elimina l'istantanea temporanea alla chiusura del processo che l'ha creata (i processi figli ereditano
+# la funzione registrata con atexit, ma non la eseguono)
+def remove_snapshot(path, owner):
+    if os.getpid() == owner:
+        shutil.rmtree(path, ignore_errors=True)
+
+# Funzione che calcola e pubblica l'istantanea nella cartella indicata, se non già disponibile, e vi si collega
+# Il lock sul file garantisce che, tra più processi che la richiedono insieme, la calcoli solo il primo
+def load_or_publish(path):
+    attached = attach_snapshot(path)
+    if attached is not None:
+        return attached
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Un altro processo potrebbe aver pubblicato l'istantanea mentre si attendeva il lock
+        attached = attach_snapshot(path)
+        if attached is None:
+            shutil.rmtree(path, ignore_errors=True) # istantanea di un formato precedente
+            seed = snapshot_seed()
+            publish_snapshot(build_snapshot(seed), path, seed)
+            attached = attach_snapshot(path)
+    if attached is None:
+        raise OSError(f"Impossibile pubblicare l'istantanea dei dati iniziali in {path}")
+    return attached
+
+# Funzione che restituisce l'istantanea dei dati iniziali del server: dizionario con i DataFrame 'env', 'prod',
+# 'perf', 'future' (previsioni) e 'bands' (bande di confidenza) e il seme dei dati casuali ('seed')
+# I DataFrame sono in sola lettura: chi li modifica deve prima farne una copia
+def initial_snapshot():
+    with snapshot_lock:
+        if not snapshot_state:
+            folder = os.environ.get('SIMULAGRO_SNAPSHOT_DIR')
+            if folder:
+                frames, seed = load_or_publish(os.path.join(folder, 'initial'))
+            else:
+                # Istantanea creata da un processo padre (se presente) o da questo processo, in una cartella temporanea
+                path = os.environ.get(snapshot_env)
+                attached = attach_snapshot(path) if path else None
+                if attached is None:
+                    path = tempfile.mkdtemp(prefix='simulagro-snapshot-')
+                    os.rmdir(path)
+                    seed = snapshot_seed()
+                    publish_snapshot(build_snapshot(seed), path, seed)
+                    atexit.register(remove_snapshot, path, os.getpid())
+                    os.environ[snapshot_env] = path
+                    attached = attach_snapshot(path)
+                frames, seed = attached
+            snapshot_state.update(frames, seed=seed)
+        return snapshot_state
@@ -0,0 +1,132 @@
+# storage.py
+
+# Modulo che gestisce l'archivio colonnare dei dati storici (ambientali e di produzione) della dashboard.
+# I dati sono conservati in un dataset Parquet (uno per tabella) con colonne tipizzate e partizionato per azienda e anno
+# (cartelle farm_id=<id>/Year=<anno>, formato hive): la lettura carica, tramite memory map, solo le colonne richieste e
+# solo le partizioni delle aziende e degli anni richiesti, senza analizzare l'intero storico.
+# Il dataset viene creato una volta sola a partire dai file CSV di data_src con il convertitore:
+#   python -m data_tools.storage
+# Se pyarrow non è installato o il dataset non è ancora stato creato, la lettura avviene dai file CSV (con lo stesso
+# risultato, ma leggendo e filtrando l'intero file).
+# Contiene le funzioni:
+# - dataset_path, csv_path: restituiscono il percorso del dataset e del file CSV di una tabella
+# - convert_csv: converte il file CSV di una tabella (schema attuale: una riga per anno) nel dataset Parquet
+# - use_dataset: indica se una tabella viene letta dal dataset Parquet o dal file CSV
+# - source_signature: restituisce la firma (data di modifica e dimensione) dei dati di origine, usata per invalidare la
+#   cache dei dati iniziali
+# - read_table: legge una tabella selezionando colonne, aziende e intervallo di anni. E' richiamata dalla funzione
+#   load_initial_data del modulo data_tools.data
+# - main: convertitore a riga di comando
+
+# Importazione delle librerie necessarie
+import os, shutil # per la gestione di file e cartelle
+import numpy as np # per i tipi delle colonne
+import pandas as pd # per la gestione dei DataFrame
+
+# Cartella dei dati di backend (relativa alla cartella di lavoro dell'app)
+data_folder = "data_src"
+
+# Tabelle dell'archivio: file CSV di origine e tipo di ciascuna colonna (farm_id e Year sono le colonne di partizione)
+storage_tables = {
+    'env': {
+        'csv': 'data_env.csv',
+        'schema': {'farm_id': np.int32, 'Year': np.int16, 'Temperature': np.float64, 'Humidity': np.float64,
+                   'Precipitation': np.float64},
+    },
+    'prod': {
+        'csv': 'data_prod.csv',
+        'schema': {'farm_id': np.int32, 'Year': np.int16, 'Growth_Days': np.float64, 'Yield': np.float64,
+                   'Water_Consumption': np.float64, 'Fertilizer_Consumption': np.float64},
+    },
+}
+partition_cols = ['farm_id', 'Year']
+
+# Funzione che restituisce il percorso del dataset Parquet di una tabella
+def dataset_path(table):
+    return os.path.join(os.getcwd(), data_folder, f'{table}.parquet')
+
+# Funzione che restituisce il percorso del file CSV di origine di una tabella
+def csv_path(table):
+    return os.path.join(os.getcwd(), data_folder, storage_tables[table]['csv'])
+
+# Funzione che applica ad un DataFrame i tipi dello schema di una tabella (solo per le colonne presenti)
+def apply_schema(df, table):
+    schema = storage_tables[table]['schema']
+    return df.astype({col: dtype for col, dtype in schema.items() if col in df.columns})
+
+# Funzione che converte il file CSV di una tabella nel dataset Parquet partizionato per azienda e anno
+# I file CSV attuali sono di una sola azienda (farm_id, se assente, vale farm_id). Il dataset esistente viene sostituito
+def convert_csv(table, farm_id=0, source=None):
+    import pyarrow as pa, pyarrow.parquet as pq # dipendenza opzionale, importata solo quando serve
+    df = pd.read_csv(source or csv_path(table))
+    if 'farm_id' not in df.columns:
+        df.insert(0, 'farm_id', farm_id)
+    df = apply_schema(df[list(storage_tables[table]['schema'])], table)
+
+    # Scrittura in una cartella temporanea e sostituzione del dataset precedente
+    path = dataset_path(table)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    pq.write_to_dataset(pa.Table.from_pandas(df, preserve_index=False), tmp_path, partition_cols=partition_cols)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+# Funzione che indica se una tabella viene letta dal dataset Parquet (pyarrow installato e dataset creato) o dal CSV
+def use_dataset(table):
+    try:
+        import pyarrow # dipendenza opzionale
+    except ImportError:
+        return False
+    return os.path.isdir(dataset_path(table))
+
+# Funzione che restituisce la firma dei dati di origine di alcune tabelle: per ciascuna il percorso letto, la data di
+# ultima modifica (in nanosecondi) e la dimensione (per il CSV) o l'inode (per il dataset, che il convertitore
+# sostituisce sempre per intero). Cambia se i dati vengono modificati o convertiti, per cui può invalidare una cache
+def source_signature(tables):
+    signature = []
+    for table in tables:
+        path = dataset_path(table) if use_dataset(table) else csv_path(table)
+        stat = os.stat(path)
+        signature.append((path, stat.st_mtime_ns, stat.st_ino if os.path.isdir(path) else stat.st_size))
+    return tuple(signature)
+
+# Funzione che legge una tabella dell'archivio
+# - columns: colonne da leggere (oltre a farm_id e Year), di default tutte
+# - farms: elenco delle aziende da leggere, di default tutte
+# - years: intervallo di anni (primo, ultimo) da leggere, estremi inclusi; di default tutti
+# Restituisce un DataFrame con le colonne farm_id, Year e quelle richieste, ordinato per azienda e anno
+def read_table(table, columns=None, farms=None, years=None):
+    schema = storage_tables[table]['schema']
+    columns = partition_cols + [col for col in (columns or schema) if col not in partition_cols]
+    if use_dataset(table):
+        import pyarrow.dataset as ds, pyarrow.fs as fs
+        dataset = ds.dataset(dataset_path(table), format='parquet', partitioning='hive',
+                             filesystem=fs.LocalFileSystem(use_mmap=True))
+        # Filtri sulle colonne di partizione: le cartelle delle aziende e degli anni esclusi non vengono lette
+        condition = None
+        if farms is not None:
+            condition = ds.field('farm_id').isin(list(farms))
+        if years is not None:
+            year_condition = (ds.field('Year') >= years[0]) & (ds.field('Year') <= years[1])
+            condition = year_condition if condition is None else condition & year_condition
+        df = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    else:
+        # Lettura dal file CSV (una sola azienda, farm_id 0): si leggono solo le colonne richieste e si filtrano le righe
+        df = pd.read_csv(csv_path(table), usecols=[col for col in columns if col != 'farm_id'])
+        df.insert(0, 'farm_id', 0)
+        if farms is not None:
+            df = df[df['farm_id'].isin(list(farms))]
+        if years is not None:
+            df = df[(df['Year'] >= years[0]) & (df['Year'] <= years[1])]
+
+    df = apply_schema(df[columns], table)
+    return df.sort_values(partition_cols, kind='stable').reset_index(drop=True)
+
+# Convertitore a riga di comando: crea i dataset Parquet di tutte le tabelle a partire dai file CSV
+def main():
+    for table in storage_tables:
+        print(f"{csv_path(table)} -> {convert_csv(table)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# surface.py
+
+# Modulo che precalcola la superficie di risposta del modello di produzione sull'intero intervallo degli slider
+# ambientali (temperatura, umidità, precipitazioni) in modo che lo spostamento di uno slider si traduca in una
+# ricerca su array con interpolazione trilineare, invece di un ricalcolo completo con generate_custom_data.
+# Ogni punto della superficie è la media di surface_seeds estrazioni del simulatore: gli slider mostrano quindi il valore
+# atteso della produzione nelle condizioni scelte (e non una singola estrazione casuale come generate_custom_data), per
+# cui lo stesso valore dello slider restituisce sempre gli stessi dati.
+# La resa media cambia a salti ai confini dei regimi di temperatura (freddo, ottimale, caldo): la temperatura viene
+# interpolata solo tra nodi dello stesso regime, con i confini presenti come nodi in entrambi i regimi adiacenti.
+# I valori della superficie dipendono solo dagli assi e dal seme, non dal dato di riferimento (baseline) a cui vengono
+# applicati: la superficie viene quindi costruita una sola volta per processo (alla prima richiesta o nel warm_up del
+# server, prima della creazione dei worker) e condivisa da tutti gli utenti.
+# Contiene le funzioni:
+# - temperature_regime: restituisce il regime di temperatura (0 freddo, 1 ottimale, 2 caldo) di una temperatura
+# - regime_nodes: restituisce i nodi di temperatura di un regime e le temperature a cui vengono valutati
+# - build_surface: calcola la superficie di risposta
+# - get_surface: restituisce la superficie del processo, costruendola se necessario
+# - lookup_surface: interpola i valori di produzione in un punto (temperatura, umidità, precipitazioni)
+# - surface_future_data: restituisce il DataFrame previsionale del riferimento con i valori ambientali modificati.
+#   E' richiamata dalla callback che gestisce gli slider ambientali
+
+# Importazione delle librerie necessarie
+import threading # per proteggere la superficie dagli accessi concorrenti
+import numpy as np # per le operazioni sugli array
+from data_tools.rng import make_rng # per il generatore di numeri casuali della superficie
+from data_tools.metrics import timed # per misurare i tempi delle funzioni richiamate dalle callback
+from data_tools.data_simulator import calc_production_arrays, prod_cols, area_hectares, growth_average, waste_average
+
+# Assi della superficie: coprono l'intero intervallo degli slider (precipitazioni in mm, gli slider sono in cm)
+surface_axes = (
+    np.arange(0, 51, 1.0),       # Temperatura (°C)
+    np.arange(0, 101, 5.0),      # Umidità (%)
+    np.arange(200, 801, 50.0),   # Precipitazioni (mm)
+)
+surface_seeds = 32 # Numero di estrazioni su cui mediare ogni punto della superficie (circa 450 kB in tutto)
+# Confini dei regimi di temperatura del modello di resa (vedi yield_simulate_batch): freddo sotto i 10 °C, ottimale tra
+# 10 e 30 °C (estremi inclusi), caldo sopra i 30 °C
+surface_thresholds = (10.0, 30.0)
+
+# Superficie del processo e relativo lock
+surface_state = {}
+surface_lock = threading.Lock()
+
+# Funzione che restituisce il regime di temperatura (0 freddo, 1 ottimale, 2 caldo) di una temperatura
+def temperature_regime(temperature):
+    low, high = surface_thresholds
+    return 0 if temperature < low else (1 if temperature <= high else 2)
+
+# Funzione che restituisce i nodi dell'asse della temperatura che delimitano un regime (confini compresi) e le
+# temperature a cui vengono valutati: un confine che appartiene al regime adiacente (ad esempio 10 °C per il regime
+# freddo) viene valutato appena all'interno del regime, in modo da ottenere il limite della resa da quel lato
+def regime_nodes(regime):
+    axis = surface_axes[0]
+    edges = (axis[0], *surface_thresholds, axis[-1])
+    low, high = edges[regime], edges[regime + 1]
+    nodes = np.unique(np.concatenate([axis[(axis > low) & (axis < high)], [low, high]]))
+    points = nodes.copy()
+    if temperature_regime(low) != regime:
+        points[0] = np.nextafter(low, high)
+    if temperature_regime(high) != regime:
+        points[-1] = np.nextafter(high, low)
+    return nodes, points
+
+# Funzione che calcola la superficie di risposta
+# I valori di produzione vengono calcolati su tutti i punti della griglia (per i tre regimi e per tutte le estrazioni)
+# con un'unica chiamata vettoriale al simulatore e poi mediati sulle estrazioni. Il seme fisso rende la superficie
+# riproducibile. La superficie contiene, per ogni regime, i nodi di temperatura e i valori sulla griglia
+def build_surface(seed=0):
+    regimes = [regime_nodes(regime) for regime in range(len(surface_thresholds) + 1)]
+    temperatures = np.concatenate([points for _, points in regimes])
+    grid = np.meshgrid(temperatures, *surface_axes[1:], indexing='ij')
+    points = np.column_stack([g.ravel() for g in grid])
+    rows = np.repeat(points, surface_seeds, axis=0)
+    values = np.column_stack(calc_production_arrays(rows[:, 0], rows[:, 1], rows[:, 2], area_hectares, growth_average,
+                                                    waste_average, make_rng(seed)))
+
+    values = values.reshape(len(temperatures), *(len(axis) for axis in surface_axes[1:]), surface_seeds,
+                            len(prod_cols)).mean(axis=3)
+    splits = np.cumsum([len(nodes) for nodes, _ in regimes])[:-1]
+    return {'temperature': [nodes for nodes, _ in regimes], 'values': np.split(values, splits)}
+
+# Funzione che restituisce la superficie del processo (costruendola alla prima richiesta)
+# Gli utenti che la richiedono durante la costruzione attendono quella in corso invece di avviarne un'altra
+@timed()
+def get_surface():
+    surface = surface_state.get('surface')
+    if surface is None:
+        with surface_lock:
+            surface = surface_state.get('surface')
+            if surface is None:
+                surface = surface_state['surface'] = build_surface()
+    return surface
+
+# Funzione che interpola (trilinearmente) i valori di produzione della superficie in un punto
+# I valori fuori dalla griglia vengono riportati al bordo. La temperatura viene interpolata tra i nodi del suo regime.
+# Restituisce un array con un valore per colonna di prod_cols
+def lookup_surface(surface, temperature, humidity, precipitation):
+    temperature = min(max(float(temperature), surface_axes[0][0]), surface_axes[0][-1])
+    regime = temperature_regime(temperature)
+    axes = (surface['temperature'][regime], *surface_axes[1:])
+    idx, weights = [], []
+    for axis, value in zip(axes, (temperature, humidity, precipitation)):
+        value = min(max(float(value), axis[0]), axis[-1])
+        i = min(int(np.searchsorted(axis, value, side='right')) - 1, len(axis) - 2)
+        idx.append(i)
+        weights.append((value - axis[i]) / (axis[i + 1] - axis[i]))
+    (i, j, k), (wt, wh, wp) = idx, weights
+    # Cubo 2x2x2 che circonda il punto e riduzione lungo i tre assi
+    cell = surface['values'][regime][i:i + 2, j:j + 2, k:k + 2]
+    cell = cell[0] * (1 - wt) + cell[1] * wt
+    cell = cell[0] * (1 - wh) + cell[1] * wh
+    return cell[0] * (1 - wp) + cell[1] * wp
+
+# Funzione che restituisce il DataFrame previsionale in cui i valori ambientali indicati (precipitazioni in cm, come
+# negli slider) sostituiscono quelli del DataFrame df_future (il dato di riferimento) e i dati di produzione sono letti
+# dalla superficie. Il risultato ha le stesse colonne di generate_custom_data
+@timed()
+def surface_future_data(surface, df_future, temperature=None, humidity=None, precipitation=None):
+    df_future = df_future[['Year', 'Temperature', 'Humidity', 'Precipitation']].copy()
+    if temperature is not None:
+        df_future['Temperature'] = temperature
+    if humidity is not None:
+        df_future['Humidity'] = humidity
+    if precipitation is not None:
+        df_future['Precipitation'] = precipitation
+
+    values = np.array([lookup_surface(surface, t, h, p * 10) for t, h, p in
+                       zip(df_future['Temperature'], df_future['Humidity'], df_future['Precipitation'])])
+    for col, column_values in zip(prod_cols, values.T):
+        df_future[col] = column_values
+    return df_future.round(3)
@@ -0,0 +1,109 @@
+# sweep.py
+
+# Modulo che calcola le superfici di risposta del modello di produzione.
+# Per ogni punto di una griglia temperatura x umidità x precipitazioni vengono calcolati resa, consumo d'acqua e
+# profitto, mediati su più estrazioni casuali (seed). La griglia viene suddivisa in blocchi che sono distribuiti su un
+# ProcessPoolExecutor; i risultati tornano indietro blocco per blocco e vengono raccolti in un "cubo"
+# (temperatura, umidità, precipitazioni, metrica) che la dashboard può sezionare senza ricalcolare nulla.
+# Contiene le funzioni:
+# - sweep_points: costruisce l'elenco dei punti della griglia
+# - run_sweep_chunk: calcola le metriche medie per un blocco di punti. E' eseguita nei processi del pool
+# - iter_sweep: distribuisce i blocchi sul pool e restituisce i risultati man mano che sono pronti
+# - run_sweep: esegue l'intera griglia e restituisce il cubo dei risultati. E' richiamata dalle callback
+# - slice_sweep: estrae dal cubo la sezione temperatura x umidità per una metrica e un valore di precipitazioni
+# - store_sweep, get_sweep: conservano lato server i cubi calcolati (in data_tools.result_store), identificati
+#   dall'hash del contenuto
+
+# Importazione delle librerie necessarie
+from concurrent.futures import ProcessPoolExecutor, as_completed # per distribuire il calcolo su più processi
+import numpy as np # per le operazioni sugli array
+from data_tools.rng import make_rng, spawn_seeds # per i flussi casuali indipendenti dei blocchi
+from data_tools.data_simulator import calc_production_arrays, calc_performance_arrays, area_hectares, growth_average, waste_average
+from data_tools.result_store import put_columns, get_columns # per conservare i cubi lato server
+
+# Metriche calcolate per ogni punto della griglia
+sweep_metrics = ['Yield', 'Water_Consumption', 'Gain']
+# Assi predefiniti della griglia (temperatura in °C, umidità in %, precipitazioni in mm), coerenti con gli slider
+sweep_axes = {
+    'Temperature': np.arange(0, 50.1, 2.5),
+    'Humidity': np.arange(0, 100.1, 5),
+    'Precipitation': np.arange(200, 800.1, 50),
+}
+sweep_seeds = 32 # Numero di estrazioni casuali su cui mediare ogni punto
+sweep_chunk_size = 1024 # Numero di punti per blocco inviato ad un processo
+
+# Funzione che costruisce l'elenco dei punti (temperatura, umidità, precipitazioni) della griglia
+# L'ordine dei punti è quello di np.meshgrid con indicizzazione 'ij', per cui il risultato può essere
+# rimodellato direttamente nel cubo (temperatura, umidità, precipitazioni)
+def sweep_points(temps, humids, precips):
+    grid = np.meshgrid(temps, humids, precips, indexing='ij')
+    return np.column_stack([g.ravel() for g in grid])
+
+# Funzione che calcola le metriche medie per un blocco di punti
+# Tutti i punti e tutte le estrazioni del blocco vengono elaborati con un'unica chiamata vettoriale ai nuclei del simulatore
+# seed è il SeedSequence (o seme) del blocco: il risultato non dipende da quale processo lo esegue
+def run_sweep_chunk(points, n_seeds, seed):
+    rng = make_rng(seed)
+    rows = np.repeat(points, n_seeds, axis=0)
+    growth_days, total_yield, water, fertilizer = calc_production_arrays(rows[:, 0], rows[:, 1], rows[:, 2], area_hectares,
+                                                                         growth_average, waste_average, rng)
+    # Ai bordi della griglia la resa può annullarsi: il margine di profitto (non usato qui) diventerebbe una divisione per zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _, _, profit, _, _, _ = calc_performance_arrays(total_yield, water, fertilizer, area_hectares, rng)
+    values = np.column_stack([total_yield, water, profit])
+    # Media sulle estrazioni di ciascun punto
+    return values.reshape(len(points), n_seeds, len(sweep_metrics)).mean(axis=1)
+
+# Funzione che distribuisce la griglia sul pool di processi e restituisce, man mano che sono pronti,
+# l'indice del primo punto del blocco e le relative metriche
+# Ogni blocco riceve un flusso casuale indipendente derivato da seed
+def iter_sweep(points, n_seeds=sweep_seeds, chunk_size=sweep_chunk_size, seed=0, max_workers=None):
+    starts = range(0, len(points), chunk_size)
+    chunk_seeds = spawn_seeds(seed, len(starts))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_sweep_chunk, points[start:start + chunk_size], n_seeds, chunk_seed): start
+                   for start, chunk_seed in zip(starts, chunk_seeds)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+# Funzione che calcola l'intera griglia e restituisce il cubo dei risultati
+# on_chunk (opzionale) viene richiamata ad ogni blocco completato con il numero di punti elaborati e quello totale
+def run_sweep(temps=sweep_axes['Temperature'], humids=sweep_axes['Humidity'], precips=sweep_axes['Precipitation'],
+              n_seeds=sweep_seeds, chunk_size=sweep_chunk_size, seed=0, max_workers=None, on_chunk=None):
+    points = sweep_points(temps, humids, precips)
+    values = np.empty((len(points), len(sweep_metrics)))
+    done = 0
+    for start, chunk in iter_sweep(points, n_seeds, chunk_size, seed, max_workers):
+        values[start:start + len(chunk)] = chunk
+        done += len(chunk)
+        if on_chunk is not None:
+            on_chunk(done, len(points))
+    return {
+        'axes': {'Temperature': np.asarray(temps), 'Humidity': np.asarray(humids), 'Precipitation': np.asarray(precips)},
+        'metrics': list(sweep_metrics),
+        'cube': values.reshape(len(temps), len(humids), len(precips), len(sweep_metrics)),
+    }
+
+# Funzione che estrae dal cubo la sezione temperatura x umidità di una metrica, al valore di precipitazioni
+# più vicino a quello richiesto (in mm). Restituisce la matrice (umidità x temperatura) e il valore effettivo usato
+def slice_sweep(result, metric, precipitation):
+    precips = result['axes']['Precipitation']
+    k = int(np.abs(precips - precipitation).argmin())
+    return result['cube'][:, :, k, result['metrics'].index(metric)].T, precips[k]
+
+# Funzione che conserva un cubo lato server e ne restituisce la chiave
+# Il cubo e gli assi sono salvati in data_tools.result_store: la chiave è l'hash del contenuto (lo stesso calcolo
+# ripetuto non occupa altro spazio) e, con SIMULAGRO_RESULT_DIR, è valida per tutti i processi del server
+def store_sweep(result):
+    return put_columns({**result['axes'], 'cube': result['cube']})
+
+# Funzione che recupera un cubo a partire dalla sua chiave (None se non è più disponibile)
+def get_sweep(key):
+    columns = get_columns(key)
+    if columns is None or 'cube' not in columns:
+        return None
+    return {
+        'axes': {axis: columns[axis] for axis in sweep_axes},
+        'metrics': list(sweep_metrics),
+        'cube': columns['cube'],
+    }
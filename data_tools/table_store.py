@@ -0,0 +1,221 @@
+# table_store.py
+
+# Archivio indicizzato delle tabelle della dashboard visualizzate con paginazione, ordinamento e filtri lato server
+# (DataTable con page_action, sort_action e filter_action 'custom'). Le tabelle (data_tools.frame.ColumnFrame) restano
+# sul server: al browser viene inviata solo la chiave e, ad ogni interazione, la sola pagina visibile.
+# Le tabelle sono conservate in memoria in un archivio dedicato, separato dalla LRU dei risultati delle callback
+# (data_tools.result_store) che si riempie ad ogni spostamento degli slider: ogni tabella della dashboard ha una propria
+# LRU, per cui le nuove versioni di una tabella non eliminano le altre. Con la variabile d'ambiente SIMULAGRO_RESULT_DIR
+# le tabelle sono salvate su file nella cartella dei risultati, condivisa tra i processi del server.
+# Per ogni tabella vengono costruiti al primo utilizzo e conservati:
+# - gli indici delle colonne (ordinamento crescente delle righe per colonna), usati sia per ordinare sia per i filtri
+#   di confronto, risolti con una ricerca binaria sui valori ordinati invece che con una scansione della colonna
+# - le righe selezionate da ciascuna combinazione di filtro e ordinamento, in modo che lo spostamento tra le pagine
+#   costi solo l'estrazione delle righe della pagina, qualunque sia la dimensione della tabella
+# I filtri seguono la sintassi della proprietà filter_query delle DataTable: condizioni "{colonna} operatore valore"
+# unite da "&&", con gli operatori =, !=, <, <=, >, >= (anche nella forma eq, ne, lt, le, gt, ge), contains e
+# datestartswith (sul testo visualizzato) e gli operatori senza valore "is blank"/"is nil" (valori mancanti) e "is num".
+# I valori possono essere racchiusi tra virgolette. I filtri con operatori non supportati (ad esempio "||" o
+# "is prime") o con valori non numerici nei confronti sollevano ValueError con il messaggio da mostrare all'utente.
+# I confronti sui valori decimali avvengono sui valori così come sono visualizzati (arrotondati a frame_decimals).
+# Contiene le funzioni:
+# - put_table, get_table: salvano una tabella e la restituiscono a partire dalla chiave
+# - parse_filter: scompone una filter_query nelle sue condizioni
+# - column_index: restituisce (calcolandolo al primo utilizzo) l'indice di una colonna
+# - query_rows: restituisce le righe di una tabella selezionate dal filtro, nell'ordine richiesto
+# - table_page: restituisce i record di una pagina e il numero di pagine. E' richiamata dalle callback delle tabelle
+#   (interface.callbacks) e dal layout per la prima pagina
+
+# Importazione delle librerie necessarie
+import re, threading # per l'analisi dei filtri e l'accesso concorrente
+from collections import OrderedDict # per le LRU degli indici e delle selezioni
+import numpy as np # per indici e selezioni
+from data_tools.frame import ColumnFrame, frame_decimals # tabelle colonnari
+from data_tools.result_store import put_columns, get_columns, result_dir, result_key # per le tabelle su file
+from data_tools.metrics import timed # per misurare i tempi delle funzioni richiamate dalle callback
+
+# Numero di righe per pagina delle tabelle, numero massimo di versioni conservate in memoria per ciascuna tabella e
+# numero massimo di indici e selezioni conservati in memoria
+table_page_size = 10
+table_store_size = 16
+table_index_size = 256
+table_query_size = 256
+
+# Operatori dei filtri (anche nella forma testuale delle DataTable), operatori senza valore e espressione regolare di
+# una condizione (valore tra virgolette, con caratteri preceduti da \, o senza spazi)
+filter_operators = {'=': '=', 'eq': '=', '!=': '!=', 'ne': '!=', '<': '<', 'lt': '<', '<=': '<=', 'le': '<=',
+                    '>': '>', 'gt': '>', '>=': '>=', 'ge': '>=', 'contains': 'contains', 'datestartswith': 'startswith'}
+filter_unary = {'is blank': 'blank', 'is nil': 'blank', 'is num': 'num'}
+filter_pattern = re.compile(r'''\s*\{(?P<col>[^}]+)\}\s*(?:(?P<unary>is\s+[a-z]+)|[si]?(?P<op>>=|<=|!=|=|<|>|eq|ne|lt|le|gt|ge|contains|datestartswith)\s*(?P<value>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`|[^\s&|()"'`]+))\s*''')
+
+# Tabelle in memoria (nome della tabella -> LRU chiave -> colonne), indici delle colonne ((chiave, colonna) -> righe in
+# ordine crescente e valori ordinati), selezioni ((chiave, ordinamento, filtro) -> righe) e relativo lock
+table_entries = {}
+table_indexes = OrderedDict()
+table_queries = OrderedDict()
+table_lock = threading.Lock()
+
+# Funzione che salva una tabella e ne restituisce la chiave (l'hash del contenuto, vedi data_tools.result_store)
+# name: nome della tabella della dashboard (ad esempio l'id della DataTable), che ne individua la LRU in memoria
+def put_table(frame, name=None):
+    if result_dir():
+        return put_columns(frame.data)
+    key = result_key(frame.data)
+    with table_lock:
+        entries = table_entries.setdefault(name, OrderedDict())
+    lru_put(entries, key, frame.data, table_store_size)
+    return key
+
+# Funzione che restituisce la tabella associata ad una chiave (None se non più disponibile)
+def get_table(key):
+    if not key:
+        return None
+    if result_dir():
+        columns = get_columns(key)
+        return None if columns is None else ColumnFrame(columns)
+    with table_lock:
+        for entries in table_entries.values():
+            columns = entries.get(key)
+            if columns is not None:
+                entries.move_to_end(key)
+                return ColumnFrame(columns)
+    return None
+
+# Funzione che inserisce un elemento in una LRU, eliminando i meno recenti oltre il limite
+def lru_put(cache, key, value, maxsize):
+    with table_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > maxsize:
+            cache.popitem(last=False)
+
+# Funzione che restituisce un elemento di una LRU (None se assente)
+def lru_get(cache, key):
+    with table_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+# Funzione che scompone una filter_query nelle sue condizioni: elenco di (colonna, operatore, valore)
+# Le condizioni non riconosciute e gli operatori non supportati sollevano ValueError
+def parse_filter(filter_query):
+    terms = []
+    query = (filter_query or '').strip()
+    position = 0
+    while position < len(query):
+        match = filter_pattern.match(query, position)
+        if match is None:
+            raise ValueError(f"Condizione del filtro non valida: {query[position:]}")
+        if match['unary']:
+            unary = ' '.join(match['unary'].split())
+            if unary not in filter_unary:
+                raise ValueError(f"Operatore del filtro non supportato: {unary}")
+            terms.append((match['col'], filter_unary[unary], None))
+        else:
+            value = match['value']
+            if value[0] in '"\'`':
+                value = re.sub(r'\\(.)', r'\1', value[1:-1])
+            terms.append((match['col'], filter_operators[match['op']], value))
+        position = match.end()
+        if position < len(query):
+            if not query.startswith('&&', position):
+                raise ValueError(f"Le condizioni del filtro possono essere unite solo con &&: {query[position:]}")
+            position += 2
+    return terms
+
+# Funzione che restituisce l'indice di una colonna: righe in ordine crescente di valore (ordinamento stabile, NaN in
+# fondo) e valori corrispondenti. L'indice viene calcolato al primo utilizzo e conservato
+def column_index(key, frame, col):
+    index = lru_get(table_indexes, (key, col))
+    if index is None:
+        values = frame[col]
+        order = np.argsort(values, kind='stable')
+        index = (order, values[order])
+        lru_put(table_indexes, (key, col), index, table_index_size)
+    return index
+
+# Funzione che restituisce la maschera delle righe che soddisfano una condizione del filtro
+# I confronti vengono risolti con una ricerca binaria sui valori ordinati dell'indice della colonna
+def filter_mask(key, frame, col, op, value):
+    values = frame[col]
+    if op in ('blank', 'num'):
+        missing = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+        return missing if op == 'blank' else ~missing
+    if op in ('contains', 'startswith'):
+        # Confronto sul testo dei valori così come sono visualizzati (arrotondati)
+        text = np.char.mod(f'%.{frame_decimals}f' if values.dtype.kind == 'f' else '%d', values)
+        return np.char.find(text, value) >= 0 if op == 'contains' else np.char.startswith(text, value)
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"Il filtro della colonna {col} richiede un valore numerico: {value}") from None
+    order, sorted_values = column_index(key, frame, col)
+    if values.dtype.kind == 'f':
+        # I valori float vengono confrontati così come sono visualizzati: il numero indicato corrisponde ai valori
+        # nell'intervallo [numero - mezzo millesimo, numero + mezzo millesimo), che vengono arrotondati ad esso
+        half = 0.5 * 10 ** -frame_decimals
+        low = np.searchsorted(sorted_values, values.dtype.type(number - half), side='left')
+        high = np.searchsorted(sorted_values, values.dtype.type(number + half), side='left')
+        count = np.count_nonzero(~np.isnan(sorted_values))
+    else:
+        low = np.searchsorted(sorted_values, number, side='left')
+        high = np.searchsorted(sorted_values, number, side='right')
+        count = len(values)
+    start, stop = {'=': (low, high), '!=': (low, high), '<': (0, low), '<=': (0, high), '>': (high, count),
+                   '>=': (low, count)}[op]
+    mask = np.zeros(len(values), dtype=bool)
+    mask[order[start:stop]] = True
+    return ~mask if op == '!=' else mask
+
+# Funzione che restituisce le righe di una tabella selezionate dal filtro, nell'ordine richiesto (sort_by delle
+# DataTable: elenco di {'column_id', 'direction'}). Le selezioni vengono conservate, per cui lo spostamento tra le
+# pagine della stessa selezione non le ricalcola
+def query_rows(key, frame, sort_by=None, filter_query=None):
+    sort_key = tuple((item['column_id'], item['direction']) for item in sort_by or [])
+    query_key = (key, sort_key, (filter_query or '').strip())
+    rows = lru_get(table_queries, query_key)
+    if rows is not None:
+        return rows
+
+    # Ordinamento: con una sola colonna si usa l'indice della colonna, con più colonne un ordinamento lessicografico.
+    # In entrambi i casi i valori mancanti (NaN) restano in fondo, anche con l'ordinamento discendente
+    sort_key = tuple((col, direction) for col, direction in sort_key if col in frame.data)
+    if not sort_key:
+        rows = np.arange(len(frame))
+    elif len(sort_key) == 1:
+        rows, sorted_values = column_index(key, frame, sort_key[0][0])
+        if sort_key[0][1] == 'desc':
+            count = np.count_nonzero(~np.isnan(sorted_values)) if sorted_values.dtype.kind == 'f' else len(rows)
+            rows = np.concatenate([rows[:count][::-1], rows[count:]])
+    else:
+        rows = np.lexsort([frame[col] if direction == 'asc' else -frame[col].astype(np.float64)
+                           for col, direction in reversed(sort_key)])
+
+    # Filtro: righe che soddisfano tutte le condizioni (le condizioni su colonne inesistenti non selezionano righe)
+    terms = parse_filter(filter_query)
+    if terms:
+        mask = np.ones(len(frame), dtype=bool)
+        for col, op, value in terms:
+            if col not in frame.data:
+                mask[:] = False
+                break
+            mask &= filter_mask(key, frame, col, op, value)
+        rows = rows[mask[rows]]
+
+    lru_put(table_queries, query_key, rows, table_query_size)
+    return rows
+
+# Funzione che restituisce i record della pagina page_current (a partire da 0) e il numero di pagine della tabella
+# associata a key, ordinata e filtrata come indicato. Restituisce None se la tabella non è più disponibile;
+# i filtri non validi sollevano ValueError (vedi parse_filter)
+@timed()
+def table_page(key, page_current=0, page_size=table_page_size, sort_by=None, filter_query=None):
+    frame = get_table(key)
+    if frame is None:
+        return None
+    rows = query_rows(key, frame, sort_by, filter_query)
+    page_size = max(1, page_size or table_page_size)
+    page_count = max(1, -(-len(rows) // page_size))
+    page_current = min(max(0, page_current or 0), page_count - 1)
+    return frame.take(rows[page_current * page_size:(page_current + 1) * page_size]).to_records(), page_count
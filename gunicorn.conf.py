@@ -0,0 +1,42 @@
+# gunicorn.conf.py
+
+# Configurazione di gunicorn per servire la dashboard in produzione (dalla cartella principale del progetto):
+#   gunicorn app:server
+# L'app viene importata e preparata (warm_up) una sola volta nel processo principale, prima della creazione dei worker:
+# i worker la ereditano con la fork già pronta, condividendo le pagine di memoria finché non vengono modificate.
+# Ogni worker, subito dopo la fork e prima di avviare i propri thread, avvia i processi di rendering dei grafici e di
+# generazione dei report PDF (post_fork).
+# Il numero di worker è indicato dalla variabile d'ambiente WEB_CONCURRENCY, l'indirizzo da SIMULAGRO_BIND.
+# Con più worker i risultati delle callback (tabelle, superfici) e i report devono essere visibili a tutti i processi:
+# se SIMULAGRO_RESULT_DIR e SIMULAGRO_REPORT_DIR non sono impostate, vengono usate due cartelle nella directory
+# temporanea del sistema
+
+# Importazione delle librerie necessarie
+import os, gc, tempfile # per la configurazione, il congelamento degli oggetti prima della fork e le cartelle condivise
+
+# Parametri del server
+bind = os.environ.get('SIMULAGRO_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('SIMULAGRO_THREADS', 4))
+preload_app = True
+timeout = 120
+
+# Cartelle condivise tra i worker (impostate prima del caricamento dell'app, che le legge dalle variabili d'ambiente)
+if workers > 1:
+    shared_dir = os.path.join(tempfile.gettempdir(), f'simulagro-{os.getuid()}')
+    os.environ.setdefault('SIMULAGRO_RESULT_DIR', os.path.join(shared_dir, 'results'))
+    os.environ.setdefault('SIMULAGRO_REPORT_DIR', os.path.join(shared_dir, 'reports'))
+
+# Funzione richiamata da gunicorn nel processo principale, dopo il caricamento dell'app e prima della creazione dei worker
+# Gli oggetti creati fin qui vengono "congelati" (gc.freeze), in modo che il garbage collector dei worker non li
+# modifichi e le relative pagine di memoria restino condivise
+def when_ready(server):
+    from app import warm_up
+    warm_up()
+    gc.freeze()
+
+# Funzione richiamata da gunicorn in ogni worker subito dopo la fork, prima che il worker avvii i propri thread:
+# avvia i processi di rendering dei grafici e quelli di generazione dei report (data_tools.report_jobs)
+def post_fork(server, worker):
+    from data_tools.report_jobs import start_pool
+    start_pool()
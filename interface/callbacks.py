@@ -4,70 +4,90 @@
 # (clic sui pulsanti, modifica dei valori tramite slider, etc.)
 
 # Importazione delle librerie necessarie
-import pandas as pd # per la manipolazione e all'analisi dei dati
-from dash import Input, Output, State, callback_context, dcc # per la gestione delle callback
-from data_tools.data import generate_custom_data, load_initial_data, calc_future_production # per la gestione dei dati (iniziali, custom e futuri)
+from dash import Input, Output, State, callback_context, dcc, no_update # per la gestione delle callback
+import numpy as np # per il seme delle nuove previsioni
+from data_tools.data import load_initial_data, calc_future_production # per la gestione dei dati iniziali e delle previsioni
 from data_tools.data_simulator import  generate_random_data # per la generazione di dati casuali
-from data_tools.data_export import save_to_excel, create_pdf_report, format_table_data # per l'esportazione dei dati
-from interface.charts import create_fig_env, create_fig_prod, create_fig_perf, create_fig_future, create_fig_nextyear # per la creazione dei grafici
+from data_tools.snapshot import initial_snapshot # istantanea dei dati iniziali e delle previsioni, condivisa tra i processi
+# Le esportazioni (data_tools.data_export, con openpyxl e reportlab) e la generazione dei report in background
+# (data_tools.report_jobs) vengono importate dalle callback che le usano, al primo utilizzo e non all'avvio dell'app
+from data_tools.sweep import run_sweep, store_sweep, get_sweep # per il calcolo delle superfici di risposta
+from data_tools.surface import get_surface, surface_future_data # per la risposta immediata agli slider ambientali
+from data_tools.result_store import put_frame, get_frame # per conservare i dati previsionali lato server
+from data_tools.frame import ColumnFrame # tabelle colonnari compatte dei dati visualizzati
+from data_tools.table_store import put_table, table_page # per le tabelle paginate lato server
+from data_tools.metrics import timed, timer, debug_panel, metrics_snapshot, start_profile, stop_profile # per la strumentazione delle callback
+from interface.charts import create_fig_env, create_fig_prod, create_fig_perf, create_fig_future, create_fig_nextyear, create_fig_sweep, create_fig_message # per la creazione dei grafici
+
+# Numero di interrogazioni consecutive (circa 30 secondi) per cui si attendono notizie di un report di cui il server non
+# ha (ancora) lo stato, prima di considerarlo perso
+report_unknown_polls = 60
 
 # Funzione che registra tutte le callback necessarie
 # Ogni callback è associata a specifici componenti della dashboard e risponde agli input utente
-def register_callbacks(app):
-    # Dati iniziali generati al caricamento dell'app
-    initial_env, initial_prod, initial_perf = generate_random_data()
+# I dati iniziali (dati casuali, previsioni e bande di confidenza) sono quelli dell'istantanea condivisa tra i processi
+# del server (data_tools.snapshot), in modo che tutti i worker mostrino gli stessi dati
+# fast_start: avvio rapido, ci si collega all'istantanea alla prima callback che la usa invece che alla registrazione
+def register_callbacks(app, fast_start=False):
+    if not fast_start:
+        initial_snapshot()
 
     # Quando il pulsante btn-random viene cliccato, si avvia la funzione che genera nuovi dati casuali
     @app.callback(
-        [Output('env-table', 'data'),
-         Output('production-table', 'data'),
-         Output('performance-table', 'data'),
+        [Output('env-table-key', 'data'),          # Chiavi delle tabelle conservate lato server
+         Output('production-table-key', 'data'),
+         Output('performance-table-key', 'data'),
          Output('fig_env', 'figure'),
          Output('fig_prod', 'figure'),
          Output('fig_perf1', 'figure'),
-         Output('fig_perf2', 'figure')],
+         Output('fig_perf2', 'figure'),
+         Output('store-tables', 'data')], # Tabelle colonnari dei dati visualizzati (per esportazioni e report)
         [Input('btn-random', 'n_clicks'), # Trigger per la generazione di dati casuali
          Input('url', 'pathname')]  # Trigger per il caricamento della pagina
     )
+    # Le fasi della callback (caricamento dei dati, creazione dei grafici e conversione delle tabelle) vengono misurate
+    # separatamente (data_tools.metrics)
+    @timed('callback.update_dashboard', profile=True)
     def update_dashboard(n_clicks, pathname): 
         ctx = callback_context
-        if ctx.triggered_id == 'url':
-            # Usa i dati iniziali da load_initial_data
-            df_env, df_prod, df_perf, df_future, col_mapping = load_initial_data()        
-        # Se il pulsante è stato cliccato almeno una volta
-        elif n_clicks and n_clicks > 0:
-            df_env, df_prod, df_perf = generate_random_data()
-            return (
-                df_env.round(3).to_dict('records'),
-                df_prod.round(3).to_dict('records'),
-                df_perf.round(3).to_dict('records'),
-                create_fig_env(df_env),
-                create_fig_prod(df_prod),
-                *create_fig_perf(df_perf)
-            )
-        # Se il pulsante non è stato ancora cliccato, usa i dati iniziali (l'arrotondamento a 3 decimali serve ad una migliore leggibilità)
-        else:
-            df_env, df_prod, df_perf = initial_env.round(3), initial_prod.round(3), initial_perf.round(3)
-
-        # Restituisce i dati iniziali se non si opera nessun clic sul pulsante
-        return (df_env.round(3).to_dict('records'),
-                df_prod.round(3).to_dict('records'),
-                df_perf.round(3).to_dict('records'),
-                create_fig_env(df_env),
-                create_fig_prod(df_prod),
-                *create_fig_perf(df_perf))
+        with timer('update_dashboard.load'):
+            if ctx.triggered_id == 'url':
+                # Usa i dati iniziali da load_initial_data
+                df_env, df_prod, df_perf, df_future, col_mapping = load_initial_data()        
+            # Se il pulsante è stato cliccato almeno una volta
+            elif n_clicks and n_clicks > 0:
+                df_env, df_prod, df_perf = generate_random_data()
+            # Se il pulsante non è stato ancora cliccato, usa i dati iniziali (l'arrotondamento a 3 decimali serve ad una migliore leggibilità)
+            else:
+                initial = initial_snapshot()
+                df_env, df_prod, df_perf = initial['env'].round(3), initial['prod'].round(3), initial['perf'].round(3)
+
+        # Restituisce le tabelle e i grafici dei dati (iniziali o casuali)
+        # I dati passano in forma colonnare (ColumnFrame): le DataTable ricevono la chiave della tabella conservata lato
+        # server (e poi la sola pagina visibile), esportazioni e report le tabelle serializzate nello Store
+        with timer('update_dashboard.tables'):
+            frames = {'env': ColumnFrame.from_frame(df_env), 'prod': ColumnFrame.from_frame(df_prod),
+                      'perf': ColumnFrame.from_frame(df_perf)}
+            tables = tuple(put_table(frames[name], table_id) for table_id, (store_id, name) in server_tables.items()
+                           if store_id == 'store-tables')
+            stored_tables = {name: frame.encode() for name, frame in frames.items()}
+        with timer('update_dashboard.figures'):
+            figures = (create_fig_env(frames['env']),
+                       create_fig_prod(frames['prod']),
+                       *create_fig_perf(frames['perf']))
+        return (*tables, *figures, stored_tables)
 
     # Quando il pulsante btn-download viene cliccato, si avvia la funzione che genera un file Excel e lo invia all'utente
     @app.callback(
         Output("download-data", "data"),
         [Input("btn-download", "n_clicks")],
-        [State('env-table', 'data'),
-         State('production-table', 'data'),
-         State('performance-table', 'data')]
+        [State('store-tables', 'data')] # Tabelle colonnari dei dati visualizzati
     )
-    def download_data(n_clicks, env_data, prod_data, perf_data):
-        if n_clicks > 0:
-            return save_to_excel(env_data, prod_data, perf_data)
+    @timed('callback.download_data', profile=True)
+    def download_data(n_clicks, stored_tables):
+        if n_clicks > 0 and stored_tables:
+            from data_tools.data_export import save_to_excel
+            return save_to_excel(*(ColumnFrame.decode(stored_tables[name]) for name in ('env', 'prod', 'perf')))
         #return dash.no_update
 
     # Callback che aggiorna grafico e tabella previsionale (richiamato dalla pressione del pulsante, dall'agire sulla slider
@@ -76,62 +96,69 @@ def register_callbacks(app):
         [Output('store-future-data', 'data'),      # Memorizza i dati futuri
         Output('store-global-df-future', 'data'),
         Output('fig_future', 'figure'),            # Grafico con i dati futuri
-        Output('future-table', 'data')],           # Tabella con i dati futuri
+        Output('future-table-key', 'data'),        # Chiave della tabella con i dati futuri (conservata lato server)
+        Output('store-future-table', 'data')],     # Tabella colonnare dei dati futuri visualizzati (per il report)
         [Input('btn-random', 'n_clicks'),          # Clic del pulsante "Genera dati casuali"
         Input('url', 'pathname'),                  # Trigger per il caricamento della pagina
         Input('year-range-slider', 'value')],      # Trigger per il RangeSlider (anno selezionato)
         [State('store-future-data', 'data')]       # Stato dei dati futuri memorizzati
     )
     # Funzione richiamata dagli eventi previsti nella callback
+    # I dati previsionali restano sul server (data_tools.result_store): negli Store del browser viene salvata solo la chiave
+    @timed('callback.update_future_data', profile=True)
     def update_future_data(n_clicks, pathname, year_range, stored_data):
         ctx = callback_context
-        global global_df_future
-        # Se la pagina è stata caricata (trigger al caricamento della pagina)
-        if ctx.triggered_id == 'url' or (n_clicks is None and stored_data is None):
-            # Se non ci sono dati memorizzati, li calcoliamo al caricamento
-            df_env, df_prod = initial_env.round(3), initial_prod.round(3)
-            new_df_env = df_env  # Ottieni i nuovi dati ambientali
-            new_df_prod = df_prod  # Ottieni i nuovi dati di produzione
-
-            # Calcoliamo i nuovi dati futuri
-            df_future = calc_future_production(new_df_env, new_df_prod)
-
-            # Memorizziamo i nuovi dati futuri nel componente `dcc.Store`
-            stored_data = df_future.to_dict('records')
-        # Se viene premuto il pulsante btn-random
-        elif ctx.triggered_id == 'btn-random' and n_clicks > 0:
-            # Se il pulsante è stato cliccato, rigenera i nuovi dati casuali
-            df_env, df_prod = initial_env.round(3), initial_prod.round(3)
-            new_df_env = df_env  # Ottieni i nuovi dati ambientali
-            new_df_prod = df_prod  # Ottieni i nuovi dati di produzione
-
-            # Calcoliamo i nuovi dati futuri
-            df_future = calc_future_production(new_df_env, new_df_prod)
-
-            # Memorizziamo i nuovi dati futuri nel componente `dcc.Store`
-            stored_data = df_future.to_dict('records')
-        else:
-            # Se non ci sono trigger, usiamo i dati già memorizzati
-            df_future = pd.DataFrame(stored_data)
-            stored_data = df_future.to_dict('records')
+        # Dati previsionali già calcolati (None se non ci sono o se non sono più disponibili sul server)
+        with timer('update_future_data.load'):
+            df_future = get_frame(stored_data)
+        # Se viene premuto il pulsante btn-random, i dati futuri vengono ricalcolati sui dati iniziali con un nuovo
+        # rumore casuale: il seme è derivato dal seme dell'istantanea e dal numero di clic, per cui lo stesso clic dà
+        # lo stesso risultato su tutti i worker (e viene memorizzato in cache)
+        if ctx.triggered_id == 'btn-random' and n_clicks > 0:
+            initial = initial_snapshot()
+            with timer('update_future_data.forecast'):
+                df_future = calc_future_production(initial['env'].round(3), initial['prod'].round(3),
+                                                   rng=np.random.SeedSequence([initial['seed'], n_clicks]))
+            stored_data = put_frame(df_future)
+        # Se la pagina è stata caricata o se i dati memorizzati non sono più disponibili, si usano le previsioni dei dati
+        # iniziali, calcolate una sola volta nell'istantanea condivisa
+        elif ctx.triggered_id == 'url' or df_future is None:
+            with timer('update_future_data.forecast'):
+                df_future = initial_snapshot()['future']
+
+            # Memorizziamo i nuovi dati futuri sul server e la relativa chiave nel componente `dcc.Store`
+            stored_data = put_frame(df_future)
         
         # Filtriamo i dati in base all'intervallo di anni selezionato nel RangeSlider
         filtered_df_future = df_future[(df_future['Year'] >= year_range[0]) & (df_future['Year'] <= year_range[1])]
         
-        # Conserva df_future in una variabile globale che serve per alimentare correttamente grafico e tabella previsionali singolo anno
-        global_df_future_data = df_future[(df_future['Year'] == df_future['Year'].min())].round(3).to_dict('records')
+        # Conserva i dati del primo anno previsionale, che servono per alimentare correttamente grafico e tabella previsionali singolo anno
+        df_baseline = df_future[(df_future['Year'] == df_future['Year'].min())].round(3)
+        global_df_future_data = put_frame(df_baseline)
         
-        # Creiamo il grafico con i dati filtrati
-        fig_future = create_fig_future(filtered_df_future)
+        # Precalcoliamo (se non già disponibile) la superficie di risposta, in modo che lo spostamento degli slider
+        # ambientali si riduca ad una interpolazione
+        with timer('update_future_data.surface'):
+            get_surface()
+
+        # Creiamo il grafico con i dati filtrati e le relative bande di confidenza
+        initial_bands = initial_snapshot()['bands']
+        filtered_bands = initial_bands[(initial_bands['Year'] >= year_range[0]) & (initial_bands['Year'] <= year_range[1])]
+        with timer('update_future_data.figures'):
+            fig_future = create_fig_future(filtered_df_future, filtered_bands)
+        with timer('update_future_data.tables'):
+            future_frame = ColumnFrame.from_frame(filtered_df_future)
+            table_key = put_table(future_frame, 'future-table')
 
-        # Restituiamo i dati futuri, il grafico e la tabella
-        return stored_data, global_df_future_data, fig_future, filtered_df_future.round(3).to_dict('records')
+        # Restituiamo le chiavi dei dati futuri, il grafico e la tabella
+        return stored_data, global_df_future_data, fig_future, table_key, future_frame.encode()
     
     # Callback che aggiorna grafico e tabella delle previsioni (richiamato dalla pressione del pulsante, dall'agire sulle slider
     # o al caricamento della pagina)    
     @app.callback(
     [Output('fig_nextyear', 'figure'),
-     Output('grouped-bar-table', 'data'),
+     Output('grouped-bar-table-key', 'data'),
+     Output('store-nextyear-table', 'data'), # Tabella colonnare delle previsioni del prossimo anno (per il report)
      Output('store-global-df-future', 'data', allow_duplicate=True)],  # Aggiungi Output per memorizzare i dati futuri],
     [Input('btn-random', 'n_clicks'), # Trigger al clic del pulsante "Genera dati casuali"
      #Input('url', 'pathname'), # Trigger per il caricamento della pagina
@@ -142,83 +169,232 @@ def register_callbacks(app):
     [State('store-global-df-future', 'data')], prevent_initial_call=True
     )
     # Funzione richiamata dagli eventi previsti nella callback
+    # I nuovi dati previsionali non vengono ricalcolati ma letti (con interpolazione) dalla superficie di risposta
+    # precalcolata e applicati al dato di riferimento: i dati di produzione sono quindi il valore atteso nelle condizioni
+    # scelte con gli slider, non una singola estrazione casuale
+    @timed('callback.update_nextyear_data', profile=True)
     def update_nextyear_data(n_clicks, pathname, temp, humid, precip, global_df_future_data):
         ctx = callback_context  
-        df_future = pd.DataFrame(global_df_future_data)
+        # Dato di riferimento conservato sul server (lo Store contiene solo la chiave)
+        df_future = get_frame(global_df_future_data)
+        if df_future is None:
+            return no_update, no_update, no_update, no_update
 
         # Se viene modificato il valore della temperatura
         if ctx.triggered_id in ['temperature-slider']:
-            # Estrai i dati che servono e imposta un nuovo DataFrame dati ambientali
-            mynew_env = df_future.iloc[:, [0, 1, 2, 3]].copy()
-            # In questo nuovo DataFrame, sostituisci il valore della temperatura con quello della slider
-            mynew_env['Temperature'] = temp
-            # Ricalcola i dati futuri
-            df_future = generate_custom_data(mynew_env).round(3)
+            # Sostituisci il valore della temperatura con quello della slider e leggi i dati futuri dalla superficie
+            df_future = surface_future_data(get_surface(), df_future, temperature=temp)
         # Se viene modificato il valore dell'umidità'
         elif ctx.triggered_id in ['humidity-slider']:
-            # Estrai i dati che servono e imposta un nuovo DataFrame dati ambientali
-            mynew_env = df_future.iloc[:, [0, 1, 2, 3]].copy()
-            # In questo nuovo DataFrame, sostituisci il valore dell'umidità' con quello della slider
-            mynew_env['Humidity'] = humid
-            # Ricalcola i dati futuri
-            df_future = generate_custom_data(mynew_env).round(3)
+            # Sostituisci il valore dell'umidità con quello della slider e leggi i dati futuri dalla superficie
+            df_future = surface_future_data(get_surface(), df_future, humidity=humid)
         # Se viene modificato il valore delle precipitazioni
         elif ctx.triggered_id in ['precipitation-slider']:
-            # Estrai i dati che servono e imposta un nuovo DataFrame dati ambientali
-            mynew_env = df_future.iloc[:, [0, 1, 2, 3]].copy()
-            # In questo nuovo DataFrame, sostituisci il valore delle precipitazioni con quello della slider
-            mynew_env['Precipitation'] = precip            
-            # Ricalcola i dati futuri
-            df_future = generate_custom_data(mynew_env).round(3)
-        # Se viene cliccato il pulsante di generazione dati casuali            
-        elif ctx.triggered_id == 'btn-random' and n_clicks > 0:
-            df_future = pd.DataFrame(global_df_future_data)
-        else:
-            df_future = pd.DataFrame(global_df_future_data)
+            # Sostituisci il valore delle precipitazioni con quello della slider e leggi i dati futuri dalla superficie
+            df_future = surface_future_data(get_surface(), df_future, precipitation=precip)
         
-        # Salva i nuovi dati futuri nel dcc.Store
-        stored_data = df_future.to_dict('records')
+        # Salva i nuovi dati futuri sul server e la relativa chiave nel dcc.Store
+        stored_data = put_frame(df_future)
         # Modifica grafico e tabella coi dati aggiornati
-        fig, table_data = create_fig_nextyear(df_future, temp, humid, precip)
+        with timer('update_nextyear_data.figures'):
+            fig, table_frame = create_fig_nextyear(df_future, temp, humid, precip)
 
-        return fig, table_data, stored_data
+        return fig, put_table(table_frame, 'grouped-bar-table'), table_frame.encode(), stored_data
 
     # Callback che, alla pressione sul pulsante di generazione report, recupera i dati relativi
-    # ai grafici e alle tabelle visualizzate in quel momento sulla dashboard e li passa alla
-    # funzione create_pdf_report del modulo data_export.py del package data_tools per la generazione del PDF
+    # ai grafici e alle tabelle visualizzate in quel momento sulla dashboard e accoda la generazione del PDF
+    # (modulo report_jobs.py del package data_tools), che avviene in un processo separato senza bloccare il server.
+    # Restituisce il lavoro (identificativo e ultima interrogazione che ne ha ricevuto lo stato), attiva il timer di
+    # avanzamento, disabilita il pulsante e nasconde l'eventuale messaggio di errore precedente. Se i dati della
+    # dashboard non sono ancora disponibili non viene accodato nulla e viene mostrato un messaggio
     @app.callback(
-        [Output('download-report', 'data'),
-        Output('btn-generate-report', 'disabled')], # Per disabilitare il pulsante durante la generazione del PDF
+        [Output('store-report-job', 'data'),
+        Output('report-poll', 'disabled'),
+        Output('report-poll', 'n_intervals'),
+        Output('btn-generate-report', 'disabled'), # Per disabilitare il pulsante durante la generazione del PDF
+        Output('report-message', 'children', allow_duplicate=True),
+        Output('report-message', 'is_open')],
         Input('btn-generate-report', 'n_clicks'),
-        State('env-table', 'data'),
-        State('production-table', 'data'),
-        State('performance-table', 'data'),
-        State('future-table', 'data'),
-        State('grouped-bar-table', 'data'),
+        State('store-tables', 'data'),
+        State('store-future-table', 'data'),
+        State('store-nextyear-table', 'data'),
         State('fig_env', 'figure'),
         State('fig_prod', 'figure'),
         State('fig_perf1', 'figure'),
         State('fig_perf2', 'figure'),
         State('fig_future', 'figure'),
-        State('fig_nextyear', 'figure')
+        State('fig_nextyear', 'figure'),
+        prevent_initial_call=True
     )
-    def generate_report(n_clicks, env_table_data, prod_table_data, perf_table_data, future_table_data,
-                        global_df_future_data, fig_env, fig_prod, fig_perf1, fig_perf2, fig_future, fig_nextyear):
+    @timed('callback.generate_report', profile=True)
+    def generate_report(n_clicks, stored_tables, future_table, nextyear_table, fig_env, fig_prod, fig_perf1,
+                        fig_perf2, fig_future, fig_nextyear):
         if not n_clicks:
-            return None, False # Nessun file, pulsante abilitato
+            return None, True, 0, False, no_update, False # Nessun lavoro, timer fermo, pulsante abilitato
+        if not stored_tables or not future_table or not nextyear_table:
+            return (None, True, 0, False,
+                    "I dati della dashboard non sono ancora disponibili: attendere il caricamento e premere di nuovo \"Genera Report\"", True)
+        from data_tools.report_jobs import submit_report
         
-        # Converti i dati delle tabelle in DataFrame
-        df_env = pd.DataFrame(env_table_data)
-        df_prod = pd.DataFrame(prod_table_data)
-        df_perf = pd.DataFrame(perf_table_data)
-        df_future = pd.DataFrame(future_table_data)
-        df_filtered = pd.DataFrame(global_df_future_data)
-
-        # Genera il PDF dinamicamente
-        # I dati nelle tabelle vengono passate ad una funzione che li restituisce formattati correttamente per la visualizzazione nel PDF
-        pdf_buffer = create_pdf_report(
-            [fig_env, fig_prod, fig_perf1, fig_perf2, fig_future, fig_nextyear],
-            [format_table_data(df_env), format_table_data(df_prod), format_table_data(df_perf), format_table_data(df_future), format_table_data(df_filtered)]
-        )
-
-        return dcc.send_bytes(pdf_buffer.getvalue(), "report_dashboard.pdf"), False
\ No newline at end of file
+        # Tabelle colonnari dei dati visualizzati. La formattazione per il PDF avviene nella generazione del report
+        with timer('generate_report.tables'):
+            tables = [*(ColumnFrame.decode(stored_tables[name]) for name in ('env', 'prod', 'perf')),
+                      ColumnFrame.decode(future_table), ColumnFrame.decode(nextyear_table)]
+
+        # Accoda la generazione del PDF
+        with timer('generate_report.submit'):
+            job_id = submit_report([fig_env, fig_prod, fig_perf1, fig_perf2, fig_future, fig_nextyear], tables)
+
+        return {'id': job_id, 'seen': 0}, False, 0, True, no_update, False
+
+    # Callback che, ad ogni scatto del timer, aggiorna la barra di avanzamento del report in generazione e, a lavoro
+    # concluso, invia il PDF all'utente, ferma il timer e riabilita il pulsante. Se la generazione fallisce, o se per
+    # report_unknown_polls interrogazioni consecutive il server non ha notizie del lavoro (ad esempio perché
+    # l'interrogazione raggiunge un worker che non ne condivide lo stato), viene mostrato un messaggio di errore
+    @app.callback(
+        [Output('download-report', 'data'),
+        Output('report-progress', 'value'),
+        Output('report-progress', 'style'),
+        Output('report-poll', 'disabled', allow_duplicate=True),
+        Output('btn-generate-report', 'disabled', allow_duplicate=True),
+        Output('store-report-job', 'data', allow_duplicate=True),
+        Output('report-message', 'children'),
+        Output('report-message', 'is_open', allow_duplicate=True)],
+        Input('report-poll', 'n_intervals'),
+        State('store-report-job', 'data'),
+        State('report-progress', 'style'),
+        prevent_initial_call=True
+    )
+    def poll_report(n_intervals, job, progress_style):
+        from data_tools.report_jobs import report_status, report_result
+        hidden_style = dict(progress_style or {}, display='none')
+        if not job:
+            return no_update, 0, hidden_style, True, False, no_update, no_update, no_update
+
+        status = report_status(job['id'])
+        if status['state'] == 'done':
+            pdf_bytes = report_result(job['id'])
+            if pdf_bytes is not None:
+                return dcc.send_bytes(pdf_bytes, "report_dashboard.pdf"), 100, hidden_style, True, False, None, no_update, False
+        if status['state'] == 'error':
+            # Generazione fallita: si ferma il timer, si riabilita il pulsante e si mostra l'errore
+            return (no_update, 0, hidden_style, True, False, None,
+                    f"Errore nella generazione del report: {status.get('error')}", True)
+        if status['state'] in ('queued', 'running'):
+            return (no_update, round(status['progress'] * 100), dict(progress_style or {}, display='flex'), False, True,
+                    dict(job, seen=n_intervals or 0), no_update, no_update)
+        # Stato non disponibile: si continua ad interrogare il server per un tempo limitato
+        if (n_intervals or 0) - job.get('seen', 0) <= report_unknown_polls:
+            return no_update, no_update, no_update, False, True, no_update, no_update, no_update
+        return (no_update, 0, hidden_style, True, False, None,
+                "Il report non è più disponibile sul server: premere di nuovo \"Genera Report\"", True)
+
+    # Callback che, alla pressione del pulsante btn-sweep, calcola le superfici di risposta sull'intera griglia
+    # (distribuendo il calcolo su più processi) e memorizza lato client solo la chiave del cubo dei risultati
+    @app.callback(
+        Output('store-sweep-key', 'data'),
+        Input('btn-sweep', 'n_clicks'),
+        prevent_initial_call=True
+    )
+    def update_sweep(n_clicks):
+        return store_sweep(run_sweep())
+
+    # Callback che aggiorna il grafico delle superfici di risposta sezionando il cubo già calcolato
+    # (richiamata al termine del calcolo, al cambio di metrica o allo spostamento della slider delle precipitazioni)
+    @app.callback(
+        Output('fig_sweep', 'figure'),
+        [Input('store-sweep-key', 'data'),
+         Input('sweep-metric', 'value'),
+         Input('sweep-precipitation-slider', 'value')]
+    )
+    def update_sweep_fig(sweep_key, metric, precip):
+        if not sweep_key:
+            return {}
+        result = get_sweep(sweep_key)
+        if result is None:
+            # Cubo non più disponibile sul server (eliminato dall'archivio dei risultati o calcolato da un altro processo)
+            return create_fig_message("Le superfici di risposta non sono più disponibili: premere \"Calcola superfici\" per ricalcolarle")
+        # La slider è in cm, il cubo in mm
+        return create_fig_sweep(result, metric, precip * 10)
+
+    # Tabelle paginate, ordinate e filtrate lato server
+    for table_id, source in server_tables.items():
+        register_table_callback(app, table_id, *source)
+
+    # Pannello di diagnostica (solo con SIMULAGRO_DEBUG_PANEL=1, vedi data_tools.metrics)
+    if debug_panel:
+        register_debug_callbacks(app)
+
+# Tabelle della dashboard con paginazione, ordinamento e filtri lato server (vedi server_table in interface.layout) e
+# relativa tabella colonnare serializzata nel browser: Store e, per store-tables, nome della tabella nello Store
+server_tables = {'env-table': ('store-tables', 'env'), 'production-table': ('store-tables', 'prod'),
+                 'performance-table': ('store-tables', 'perf'), 'future-table': ('store-future-table', None),
+                 'grouped-bar-table': ('store-nextyear-table', None)}
+
+# Funzione che registra la callback di una tabella paginata lato server: al cambio dei dati (chiave nello Store
+# '<tabella>-key'), della pagina, dell'ordinamento o del filtro restituisce la sola pagina visibile e il numero di pagine.
+# Un filtro non valido svuota la tabella e il motivo viene mostrato sotto di essa ('<tabella>-filter-message').
+# Se la tabella non è più disponibile sul server (eliminata dall'archivio o salvata da un altro processo) viene
+# ripubblicata a partire dalla tabella serializzata nello Store store_id (source_name: nome della tabella nello Store)
+def register_table_callback(app, table_id, store_id, source_name=None):
+    @app.callback(
+        [Output(table_id, 'data'),
+         Output(table_id, 'page_count'),
+         Output(f'{table_id}-filter-message', 'children')],
+        [Input(f'{table_id}-key', 'data'),
+         Input(table_id, 'page_current'),
+         Input(table_id, 'page_size'),
+         Input(table_id, 'sort_by'),
+         Input(table_id, 'filter_query')],
+        State(store_id, 'data')
+    )
+    @timed(f'callback.table_page.{table_id}', profile=True)
+    def update_table_page(key, page_current, page_size, sort_by, filter_query, source):
+        # Nessuna tabella (ad esempio prima del primo calcolo)
+        if not key:
+            return [], 1, None
+        try:
+            page = table_page(key, page_current, page_size, sort_by, filter_query)
+            if page is None:
+                source = source.get(source_name) if source and source_name else source
+                if not source:
+                    # Tabella non disponibile né sul server né nel browser: resta visualizzata la pagina corrente
+                    return no_update, no_update, no_update
+                key = put_table(ColumnFrame.decode(source), table_id)
+                page = table_page(key, page_current, page_size, sort_by, filter_query)
+        except ValueError as error:
+            # Filtro non valido (vedi parse_filter in data_tools.table_store)
+            return [], 1, str(error)
+        return *page, None
+
+# Funzione che registra le callback del pannello di diagnostica: aggiornamento periodico delle tabelle dei tempi e delle
+# dimensioni dei dati e avvio/arresto della cattura del profilo
+def register_debug_callbacks(app):
+    # Ad ogni scatto del timer le tabelle vengono popolate con le misure correnti (durate in ms, dimensioni in KB)
+    @app.callback(
+        [Output('metrics-timings-table', 'data'),
+         Output('metrics-payloads-table', 'data')],
+        Input('metrics-poll', 'n_intervals')
+    )
+    def update_metrics(n_intervals):
+        snapshot = metrics_snapshot()
+        timing_rows = [{'name': name, **{k: round(v, 3) for k, v in stats.items() if k in ('count', 'mean', 'p50', 'p90', 'p99', 'max')}}
+                       for name, stats in snapshot['timings_ms'].items()]
+        payload_rows = [{'name': name, **{k: round(v / 1024, 1) if k != 'count' else v for k, v in stats.items()
+                                          if k in ('count', 'mean', 'p50', 'p99', 'max')}}
+                        for name, stats in snapshot['payloads_bytes'].items()]
+        return timing_rows, payload_rows
+
+    # Avvio e arresto della cattura del profilo: all'arresto viene mostrato il report
+    @app.callback(
+        Output('profile-output', 'children'),
+        [Input('btn-profile-start', 'n_clicks'),
+         Input('btn-profile-stop', 'n_clicks')],
+        State('profile-mode', 'value'),
+        prevent_initial_call=True
+    )
+    def toggle_profile(start_clicks, stop_clicks, mode):
+        if callback_context.triggered_id == 'btn-profile-start':
+            start_profile(mode)
+            return f"Cattura del profilo ({mode}) in corso..."
+        return stop_profile() or "Nessuna cattura in corso"
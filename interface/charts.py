@@ -1,13 +1,17 @@
 # charts.py
 
 # Modulo che definisce le funzioni di creazione dei grafici
-# Ogni funzione accetta come input un DataFrame e restituisce uno o più grafici (e relative tabelle) basandosi su di esso
+# Ogni funzione accetta come input un DataFrame o una tabella colonnare (data_tools.frame.ColumnFrame) e restituisce uno
+# o più grafici (e relative tabelle) basandosi su di esso
 # Le funzioni vengono richiamate dal modulo layout.py per "disegnare" i grafici all'interno della dashboard
 
 # Importazione delle librerie necessarie
-import plotly.express as px # modulo per creare grafici interattivi
+# plotly.express (lento da importare) viene importato nelle funzioni che lo usano, al primo grafico e non all'avvio dell'app
 import plotly.graph_objects as go # modulo per creare grafici interattivi
+from plotly.colors import qualitative # palette di colori dei grafici
 from interface import labels # modulo che fornisce un dizionario per tradurre le etichette di colonna in grafici e tabelle
+from data_tools.sweep import slice_sweep # per sezionare il cubo delle superfici di risposta
+from data_tools.frame import ColumnFrame, as_frame # per le tabelle colonnari (plotly.express richiede un DataFrame)
 
 # Dizionario per la traduzione delle etichette di colonna di grafici e tabelle
 col_mapping = labels.col_mapping
@@ -45,6 +49,8 @@ def create_fig_env(df_env):
 
 # Funzione che crea un grafico a barre raggruppate per rappresentare i dati di produzione per anno
 def create_fig_prod(df_prod):
+    import plotly.express as px
+    df_prod = as_frame(df_prod)
     fig = px.bar(df_prod, x='Year', y=df_prod.columns[1:], barmode='group',
                  labels={'Year': 'Anno', 'value': 'Valore', 'variable': ''},
                  # Impostazione titolo e scelta del tema grafico
@@ -75,6 +81,8 @@ def create_fig_prod(df_prod):
 # tra efficienza e sostenibilità ambientale e la relazione tra costi, ricavi e profitti.
 # In entrambi i grafici i punti sono colorati per anno
 def create_fig_perf(df_perf):
+    import plotly.express as px
+    df_perf = as_frame(df_perf)
     fig_3d = px.scatter_3d(df_perf, x='Total_Cost', y='Total_Price', z='Gain', color='Year',
                            title="Relazione tra Costi, Ricavi e Profitti", labels=col_mapping, template="plotly_dark")
     fig_2d = px.scatter(df_perf, x='Efficiency', y='Env_Sustain', color='Year',
@@ -82,20 +90,33 @@ def create_fig_perf(df_perf):
     # Restituzione dei grafici creati
     return fig_3d, fig_2d
 
+# Colori delle curve previsionali (palette predefinita di Plotly, usata anche per le relative bande di confidenza)
+future_colors = qualitative.Plotly
+
 # Funzione che crea un grafico a linee per rappresentare previsioni relative al quinquennio successivo 
 # su raccolto, consumi e giorni di crescita
-def create_fig_future(df_future):
+# Se viene passato anche il DataFrame delle bande prodotto da calc_future_ensemble (df_bands), per ogni curva viene 
+# disegnata un'area ombreggiata compresa tra il percentile più basso e quello più alto
+def create_fig_future(df_future, df_bands=None):
     fig = go.Figure()
 
-    # Aggiunta delle curve per i vari parametri
-    fig.add_trace(go.Scatter(x=df_future['Year'], y=df_future['Growth_Days'], \
-                             mode='lines', name='Giorni di Crescita'))
-    fig.add_trace(go.Scatter(x=df_future['Year'], y=df_future['Yield'], \
-                             mode='lines', name='Raccolto (q)'))
-    fig.add_trace(go.Scatter(x=df_future['Year'], y=df_future['Water_Consumption'], \
-                             mode='lines', name='Consumo Acqua (dm3)'))
-    fig.add_trace(go.Scatter(x=df_future['Year'], y=df_future['Fertilizer_Consumption'], \
-                             mode='lines', name='Consumo Fertilizz. (q)'))
+    # Parametri rappresentati nel grafico e relative etichette
+    future_traces = [('Growth_Days', 'Giorni di Crescita'), ('Yield', 'Raccolto (q)'),
+                     ('Water_Consumption', 'Consumo Acqua (dm3)'), ('Fertilizer_Consumption', 'Consumo Fertilizz. (q)')]
+
+    for i, (col, name) in enumerate(future_traces):
+        color = future_colors[i % len(future_colors)]
+        # Banda di confidenza: traccia superiore invisibile e traccia inferiore con riempimento fino alla precedente
+        if df_bands is not None:
+            band_cols = sorted([c for c in df_bands.columns if c.startswith(f'{col}_P')], key=lambda c: float(c.rsplit('_P', 1)[1]))
+            fig.add_trace(go.Scatter(x=df_bands['Year'], y=df_bands[band_cols[-1]], mode='lines', line=dict(width=0, color=color),
+                                     legendgroup=col, showlegend=False, hoverinfo='skip'))
+            fig.add_trace(go.Scatter(x=df_bands['Year'], y=df_bands[band_cols[0]], mode='lines', line=dict(width=0, color=color),
+                                     fill='tonexty', fillcolor=color, opacity=0.25, legendgroup=col, showlegend=False,
+                                     name=f"{name} ({band_cols[0].rsplit('_', 1)[1]}-{band_cols[-1].rsplit('_', 1)[1]})"))
+        # Aggiunta della curva del parametro
+        fig.add_trace(go.Scatter(x=df_future['Year'], y=df_future[col], \
+                                 mode='lines', name=name, line=dict(color=color), legendgroup=col))
     
     # Configurazione del layout
     fig.update_layout(
@@ -115,6 +136,8 @@ def create_fig_future(df_future):
     return fig
 
 def create_fig_nextyear(df_future, temperature, humidity, precipitation):
+    import plotly.express as px
+    df_future = as_frame(df_future)
     # Filtra i dati per l'anno minore
     min_year = df_future['Year'].min()
     # Filtra il DataFrame selezionando l'anno più piccolo (il prossimo)
@@ -132,5 +155,36 @@ def create_fig_nextyear(df_future, temperature, humidity, precipitation):
     # Aggiorna i nomi delle tracce in base al mapping predefinito nel dizionario col_mapping importato dal modulo labels.py
     fig.for_each_trace(lambda trace: trace.update(name=col_mapping.get(trace.name, trace.name)))
     
-    # Restituisce il grafico e i dati per la tabella
-    return fig, filtered_data.to_dict('records')
\ No newline at end of file
+    # Restituisce il grafico e la tabella colonnare dei dati (per la tabella della dashboard)
+    return fig, ColumnFrame.from_frame(filtered_data)
+
+# Funzione che crea un grafico a curve di livello (superficie di risposta) per una metrica del cubo calcolato da
+# data_tools.sweep, sezionato al valore di precipitazioni indicato (in mm)
+def create_fig_sweep(result, metric, precipitation):
+    z, precip_used = slice_sweep(result, metric, precipitation)
+    fig = go.Figure(go.Contour(
+        x=result['axes']['Temperature'],
+        y=result['axes']['Humidity'],
+        z=z,
+        colorscale='Viridis',
+        colorbar=dict(title=col_mapping.get(metric, metric)),
+        contours=dict(showlabels=True)
+    ))
+    fig.update_layout(
+        title=f"{col_mapping.get(metric, metric)} con precipitazioni di {precip_used / 10:.0f} cm",
+        xaxis=dict(title=col_mapping['Temperature']),
+        yaxis=dict(title=col_mapping['Humidity']),
+        template="plotly_dark"
+    )
+    return fig
+
+# Funzione che crea un grafico vuoto con un messaggio per l'utente (ad esempio quando i dati non sono più disponibili)
+def create_fig_message(message):
+    fig = go.Figure()
+    fig.update_layout(
+        xaxis=dict(visible=False),
+        yaxis=dict(visible=False),
+        annotations=[dict(text=message, showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5, font=dict(size=16))],
+        template="plotly_dark"
+    )
+    return fig
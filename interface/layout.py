@@ -15,24 +15,74 @@ from dash import dcc, html, dash_table
 # pre-stilizzati quali pulsanti, card, etc.
 import dash_bootstrap_components as dbc
 # Funzioni personalizzate dal package "data_tools":
+import numpy as np # per gli anni delle previsioni
+import pandas as pd # per i DataFrame vuoti dell'avvio rapido
 from data_tools.data import load_initial_data # per caricare e pre-elaborare i dati iniziali richiesti dall'app
+from data_tools.storage import read_table # per leggere i soli anni dello storico nell'avvio rapido
+from data_tools.data_simulator import env_cols, prod_cols, perf_cols # colonne delle tabelle
 from interface.charts import create_fig_env, create_fig_prod # per creare i grafici relativi ai dati ambientali e di produzione
+from interface.labels import col_mapping # per tradurre le intestazioni delle tabelle
+from data_tools.sweep import sweep_metrics # metriche disponibili nelle superfici di risposta
+from data_tools.frame import ColumnFrame # per i dati iniziali delle tabelle
+from data_tools.table_store import put_table, table_page, table_page_size # per le tabelle paginate lato server
+from data_tools.metrics import debug_panel # per mostrare il pannello di diagnostica (SIMULAGRO_DEBUG_PANEL=1)
 
-# Caricamento dati iniziali
-# Unpacking della funzione load_initial_data del modulo data.py del package data_tools:
-# gli elementi restituiti vengono assegnati a delle variabili che popoleranno i grafici creati in seguito
-df_env, df_prod, df_perf, df_future, col_mapping = load_initial_data()
+# Funzione che prepara i dati con cui il layout viene popolato: DataFrame ambientale (con le precipitazioni in mm per il
+# grafico e una copia in cm per la tabella), di produzione, di performance e previsionale, anni delle previsioni
+# (per lo slider del periodo) e grafici ambientale e di produzione
+# In modalità di avvio rapido (fast_start) tabelle e grafici restano vuoti e vengono popolati dalle callback al primo
+# caricamento della pagina: all'avvio vengono letti solo gli anni dello storico, senza calcolare i dati iniziali
+def layout_data(fast_start=False):
+    if fast_start:
+        years = read_table('env', columns=['Year'], farms=[0])['Year']
+        df_env = pd.DataFrame(columns=['Year'] + env_cols)
+        df_prod = pd.DataFrame(columns=['Year'] + prod_cols)
+        df_perf = pd.DataFrame(columns=['Year'] + perf_cols)
+        df_future = pd.DataFrame(columns=['Year'] + env_cols + prod_cols)
+        future_years = int(years.max()) + np.arange(1, 6)
+        fig_env, fig_prod = {}, {}
+    else:
+        # Unpacking della funzione load_initial_data del modulo data.py del package data_tools:
+        # gli elementi restituiti popoleranno i grafici e le tabelle
+        df_env, df_prod, df_perf, df_future, _ = load_initial_data()
+        future_years = df_future['Year'].to_numpy()
+        fig_env, fig_prod = create_fig_env(df_env), create_fig_prod(df_prod)
 
-# Si crea una copia di df_env con le precipitazioni riportate in cm invece che in mm
-# Copia df_env per evitare modifiche indesiderate all'originale
-df_env_table = df_env.copy()
-# Converti la colonna 'Precipitation' in centimetri
-# Il DataFrame sarà quello visualizzato sotto al grafico dei dati ambientali
-df_env_table['Precipitation'] = df_env_table['Precipitation'] / 10
+    # Si crea una copia di df_env con le precipitazioni riportate in cm invece che in mm
+    # Il DataFrame sarà quello visualizzato sotto al grafico dei dati ambientali
+    df_env_table = df_env.copy()
+    df_env_table['Precipitation'] = df_env_table['Precipitation'] / 10
+    return df_env, df_env_table, df_prod, df_perf, df_future, future_years, fig_env, fig_prod
+
+# Funzione che restituisce le proprietà di una DataTable con paginazione, ordinamento e filtri lato server e i
+# componenti da inserire sotto la tabella: il dcc.Store con la chiave della tabella (id della tabella + '-key'), da cui
+# la callback della tabella (interface.callbacks) legge la pagina visibile, e il messaggio degli errori del filtro
+# (id della tabella + '-filter-message'). Se viene passato un DataFrame, la tabella viene salvata sul server e la prima
+# pagina inserita direttamente nel layout
+def server_table(table_id, df=None, sort_by=None):
+    key, data, page_count = None, [], 1
+    if df is not None:
+        key = put_table(ColumnFrame.from_frame(df), table_id)
+        data, page_count = table_page(key, 0, table_page_size, sort_by)
+    props = dict(id=table_id, data=data, page_action='custom', page_current=0, page_size=table_page_size,
+                 page_count=page_count, sort_action='custom', sort_mode='multi', sort_by=sort_by or [],
+                 filter_action='custom', filter_query='')
+    return props, html.Div([dcc.Store(id=f'{table_id}-key', data=key),
+                            html.Div(id=f'{table_id}-filter-message', className="text-danger small")])
 
 # Layout della dashboard
 # Viene creato un Div principale e al suo interno vengono inseriti in puro stile html gli elementi costituenti la pagina
-def create_layout(app):
+# fast_start: avvio rapido, con tabelle e grafici popolati dalle callback al primo caricamento della pagina (vedi layout_data)
+def create_layout(app, fast_start=False):
+    df_env, df_env_table, df_prod, df_perf, df_future, future_years, fig_env, fig_prod = layout_data(fast_start)
+    first_year, last_year = int(future_years.min()), int(future_years.max())
+    # Tabelle paginate lato server (viene scelto un ordinamento discendente per anno) e Store delle relative chiavi
+    year_desc = [{'column_id': 'Year', 'direction': 'desc'}]
+    env_table, env_key = server_table('env-table', df_env_table, year_desc)
+    prod_table, prod_key = server_table('production-table', df_prod, year_desc)
+    perf_table, perf_key = server_table('performance-table', df_perf, year_desc)
+    future_table, future_key = server_table('future-table', sort_by=year_desc)
+    nextyear_table, nextyear_key = server_table('grouped-bar-table', df_future, year_desc)
     return html.Div(children=[
         dcc.Location(id='url', refresh=False),
         dbc.Container([
@@ -51,6 +101,12 @@ def create_layout(app):
 			# desiderato e ogni volta che si aggiorna la pagina
             dcc.Store(id='store-future-data', data=None),
             dcc.Store(id='store-global-df-future', data=None),  # Store per df_future
+            dcc.Store(id='store-tables', data=None),  # Tabelle colonnari (serializzate) dei dati ambientali, di produzione e di performance
+            dcc.Store(id='store-future-table', data=None),  # Tabella colonnare (serializzata) dei dati futuri visualizzati
+            dcc.Store(id='store-nextyear-table', data=None),  # Tabella colonnare (serializzata) delle previsioni del prossimo anno
+            # Identificativo del report PDF in generazione e timer che ne interroga l'avanzamento (attivo solo durante la generazione)
+            dcc.Store(id='store-report-job', data=None),
+            dcc.Interval(id='report-poll', interval=500, disabled=True),
 
             # Barra di navigazione (Menubar)
             dbc.Navbar(
@@ -66,13 +122,16 @@ def create_layout(app):
                         dbc.NavItem(dbc.Button('Download Dati', id='btn-download', n_clicks=0, color="primary", size="sm", \
                                                className="me-2", style={'width': '180px'})),
                         dbc.Tooltip("Scarica i dati generati in formato Excel", target="btn-download", placement="bottom"),
-						# Incapsula il pulsante "Genera Report" in dcc.Loading per visualizzare uno spinner durante la generazione del PDF                    
+						# Incapsula il pulsante "Genera Report" in dcc.Loading per visualizzare uno spinner durante l'accodamento del PDF
 						dbc.NavItem(dcc.Loading(id="spinner-container",	type="circle", color="#0d6efd",  # Tipo e colore dello spinner
 								children=dbc.Button('Genera Report', id='btn-generate-report', n_clicks=0, color="primary", size="sm",
 													className="me-2", style={'width': '180px'}))),
                         dbc.Tooltip("Crea un report in PDF basato sui dati visualizzati", target="btn-generate-report", placement="bottom"),
                         dcc.Download(id="download-data"),
                         dcc.Download(id="download-report"),
+                        # Barra di avanzamento della generazione del report (visibile solo durante la generazione)
+                        dbc.Progress(id='report-progress', value=0, striped=True, animated=True,
+                                     style={'width': '180px', 'display': 'none'}),
                     ], className="d-flex justify-content-center"),
 
                     # Spaziatura destra
@@ -82,25 +141,26 @@ def create_layout(app):
                 dark=False,
                 className="shadow-sm my-2"  # Leggera ombra e margine verticale
             ),
+            # Messaggio di errore della generazione del report (visibile solo in caso di errore)
+            dbc.Alert(id='report-message', color="danger", is_open=False, dismissable=True, className="my-2"),
 			dbc.CardGroup([
 				# Grafico e tabella relativi ai dati ambientali
 				dbc.Card([
 					dbc.CardBody([
 						html.H4("Dati Ambientali", className="my-4"),
-						dcc.Graph(id='fig_env', figure=create_fig_env(df_env), config={'locale': 'it'}),
+						dcc.Graph(id='fig_env', figure=fig_env, config={'locale': 'it'}),
 						html.Div(
 							className="custom-table-container",  # Classe CSS specifica per il contenitore delle tabelle
 							children=[
 								dash_table.DataTable(
-									id='env-table',
 									# le intestazioni di colonna vengono "tradotte" utilizzando il dizionario importato 
 									columns=[{"name": col_mapping[col], "id": col} for col in df_env.columns],
-									data=df_env_table.to_dict('records'),
-									# viene scelto un ordinamento discendente per anno
-									sort_action='native', sort_by=[{'column_id': 'Year', 'direction': 'desc'}],
+									# dati, paginazione, ordinamento e filtri gestiti lato server
+									**env_table,
 									# la tabella si ridimensiona in base alla dimensione della pagina
 									style_table={'overflowX': 'auto'}
-								)
+								),
+								env_key
 							])
 					]),
 				]),
@@ -111,16 +171,16 @@ def create_layout(app):
 						# Titolo della sezione
 						html.H4("Dati di Produzione", className="my-4"),
 						# Grafico
-						dcc.Graph(id='fig_prod', figure=create_fig_prod(df_prod), config={'locale': 'it'}),
+						dcc.Graph(id='fig_prod', figure=fig_prod, config={'locale': 'it'}),
 						# Tabella dati
 						html.Div(
 							className="custom-table-container",  # Classe CSS specifica per il contenitore delle tabelle
 							children=[                
 								# Così come per la tabella dei dati ambientali, si traducono le intestazioni di colonna e si ordinano 
 								# i dati per anno (discendente)
-								dash_table.DataTable(id='production-table', columns=[{"name": col_mapping[col], "id": col} for col in df_prod.columns], \
-                             			data=df_prod.to_dict('records'), sort_action='native', sort_by=[{'column_id': 'Year', 'direction': 'desc'}], \
-                                            style_table={'overflowX': 'auto'})
+								dash_table.DataTable(columns=[{"name": col_mapping[col], "id": col} for col in df_prod.columns], \
+                             			**prod_table, style_table={'overflowX': 'auto'}),
+								prod_key
 							]
 						)
 					])
@@ -144,9 +204,9 @@ def create_layout(app):
 							className="custom-table-container",  # Classe CSS specifica per il contenitore delle tabelle
 							children=[                
 								# si traducono le intestazioni di colonna e si ordinano i dati per anno (discendente)
-								dash_table.DataTable(id='performance-table', columns=[{"name": col_mapping[col], "id": col} for col in df_perf.columns], \
-										data=df_perf.to_dict('records'), sort_action='native', sort_by=[{'column_id': 'Year', 'direction': 'desc'}], \
-                                            style_table={'overflowX': 'auto'})
+								dash_table.DataTable(columns=[{"name": col_mapping[col], "id": col} for col in df_perf.columns], \
+										**perf_table, style_table={'overflowX': 'auto'}),
+								perf_key
 							]
 						)
 					], className="my-4"),
@@ -165,11 +225,11 @@ def create_layout(app):
 						html.Label("Seleziona periodo:"),
 						dcc.RangeSlider(
 							id='year-range-slider',
-							min=df_future['Year'].min(),  # Anno minimo
-							max=df_future['Year'].max(),  # Anno massimo
+							min=first_year,  # Anno minimo
+							max=last_year,  # Anno massimo
 							step=1,
-							marks={year: str(year) for year in range(df_future['Year'].min(), df_future['Year'].max() + 1)}, # Marks sulla linea dello slider
-							value=[df_future['Year'].min(), df_future['Year'].max()]  # Impostazione predefinita dell'intervallo
+							marks={year: str(year) for year in range(first_year, last_year + 1)}, # Marks sulla linea dello slider
+							value=[first_year, last_year]  # Impostazione predefinita dell'intervallo
 						),
 						dbc.Tooltip(
 							"Usa le maniglie dello slider per impostare un range temporale e filtrare i dati",  # Testo del tooltip
@@ -186,7 +246,6 @@ def create_layout(app):
 						className="custom-table-container",  # Classe CSS specifica per il contenitore delle tabelle
 						children=[                
 							dash_table.DataTable(
-								id='future-table',
 								columns=[
 									{"name": "Anno", "id": "Year"},
 									{"name": "Temperatura (°C)", "id": "Temperature"},
@@ -200,11 +259,10 @@ def create_layout(app):
 								# Si inizializza la tabella vuota
 								# I dati saranno aggiunti tramite callback azionata dal caricamento della pagina, dal clic 
 								# sul pulsante btn-random o dalla slider
-								data=[],
-								sort_action='native',
-								sort_by=[{'column_id': 'Year', 'direction': 'desc'}],
+								**future_table,
 								style_table={'overflowX': 'auto'}
-							)
+							),
+							future_key
 						]
 					)
 				])
@@ -287,7 +345,6 @@ def create_layout(app):
 								className="custom-table-container",  # Classe CSS specifica per il contenitore delle tabelle
 								children=[
 									dash_table.DataTable(
-										id='grouped-bar-table',
 										columns=[
 											{"name": "Anno", "id": "Year"},
 											{"name": "Temperatura (°C)", "id": "Temperature"},
@@ -298,11 +355,10 @@ def create_layout(app):
 											{"name": "Consumo Fertilizzanti (q)", "id": "Fertilizer_Consumption"},
 											{"name": "Raccolto (q)", "id": "Yield"}
 										],
-										data=df_future.to_dict('records'),
-										style_table={'overflowX': 'auto'},
-										sort_action='native',
-										sort_by=[{'column_id': 'Year', 'direction': 'desc'}]
-									)
+										**nextyear_table,
+										style_table={'overflowX': 'auto'}
+									),
+									nextyear_key
 								]
 							), width=10,
 						),
@@ -316,6 +372,36 @@ def create_layout(app):
 				])
 			]),
 
+			dbc.Card([
+				dbc.CardBody([
+					# Sezione delle superfici di risposta (resa, acqua e profitto su una griglia temperatura x umidità x precipitazioni)
+					html.H4("Superfici di risposta", className="my-4"),
+					# Chiave del cubo dei risultati conservato lato server (il cubo non viene inviato al browser)
+					dcc.Store(id='store-sweep-key', data=None),
+					dbc.Row([
+						dbc.Col(dbc.Button('Calcola superfici', id='btn-sweep', n_clicks=0, color="primary", size="sm",
+										   style={'width': '180px'}), width=3),
+						# Metrica da rappresentare
+						dbc.Col(dcc.Dropdown(
+							id='sweep-metric',
+							options=[{'label': col_mapping[m], 'value': m} for m in sweep_metrics],
+							value='Yield', clearable=False
+						), width=3),
+						# Valore di precipitazioni (in cm) al quale sezionare il cubo
+						dbc.Col(dcc.Slider(
+							id='sweep-precipitation-slider',
+							min=20, max=80, step=5, value=35,
+							marks={i: str(i) for i in range(20, 81, 10)}
+						), width=6),
+					], className="my-2"),
+					# Il calcolo della griglia può richiedere alcuni secondi: viene mostrato uno spinner
+					dcc.Loading(type="circle", color="#0d6efd",
+						children=dcc.Graph(id='fig_sweep', figure={}, config={'locale': 'it'})),
+				])
+			]),
+
+			# Pannello di diagnostica (tempi delle callback, dimensioni dei dati e profilo), solo se abilitato
+			*([create_debug_panel()] if debug_panel else []),
 
 		# Footer della pagina
 		html.Footer([
@@ -327,4 +413,31 @@ def create_layout(app):
 		], className="bg-light mt-5")
 	
         ])
-    ])
\ No newline at end of file
+    ])
+
+# Pannello di diagnostica: tabelle dei tempi per fase e delle dimensioni dei dati scambiati (aggiornate ogni 2 secondi
+# dalle misure di data_tools.metrics) e pulsanti di avvio e arresto della cattura del profilo
+def create_debug_panel():
+    timing_cols = [('name', 'Misura'), ('count', 'Chiamate'), ('mean', 'Media (ms)'), ('p50', 'P50 (ms)'),
+                   ('p90', 'P90 (ms)'), ('p99', 'P99 (ms)'), ('max', 'Max (ms)')]
+    payload_cols = [('name', 'Dato'), ('count', 'Chiamate'), ('mean', 'Media (KB)'), ('p50', 'P50 (KB)'),
+                    ('p99', 'P99 (KB)'), ('max', 'Max (KB)')]
+    return dbc.Card([
+        dbc.CardBody([
+            html.H4("Diagnostica", className="my-4"),
+            dcc.Interval(id='metrics-poll', interval=2000),
+            dash_table.DataTable(id='metrics-timings-table', columns=[{"name": label, "id": col} for col, label in timing_cols],
+                                 data=[], sort_action='native', page_size=20, style_table={'overflowX': 'auto'}),
+            html.Br(),
+            dash_table.DataTable(id='metrics-payloads-table', columns=[{"name": label, "id": col} for col, label in payload_cols],
+                                 data=[], sort_action='native', page_size=10, style_table={'overflowX': 'auto'}),
+            dbc.Row([
+                dbc.Col(dcc.RadioItems(id='profile-mode', value='cprofile', inline=True,
+                                       options=[{'label': ' cProfile ', 'value': 'cprofile'},
+                                                {'label': ' Campionamento ', 'value': 'sampling'}]), width=4),
+                dbc.Col(dbc.Button('Avvia profilo', id='btn-profile-start', n_clicks=0, color="primary", size="sm"), width=2),
+                dbc.Col(dbc.Button('Ferma profilo', id='btn-profile-stop', n_clicks=0, color="secondary", size="sm"), width=2),
+            ], className="my-3"),
+            html.Pre(id='profile-output', style={'maxHeight': '400px', 'overflowY': 'auto', 'fontSize': '12px'}),
+        ])
+    ])
@@ -0,0 +1,135 @@
+# routes.py
+
+# Modulo che definisce gli endpoint HTTP del server Flask sottostante all'app Dash, per le operazioni che non passano
+# dalle callback (le cui risposte vengono serializzate in JSON e inviate per intero al browser).
+# Contiene le funzioni:
+# - register_routes: registra gli endpoint sul server dell'app. E' richiamata da app.py
+# - register_metrics: registra la misura delle richieste delle callback e gli endpoint delle metriche
+# Endpoint:
+# - /export/farms.<formato> (csv, xlsx, parquet): esportazione in streaming dei dati simulati di più aziende.
+#   Parametri: farms (numero di aziende di riferimento, default 1) e seed (seme della simulazione, opzionale).
+#   CSV e Parquet vengono prodotti ed inviati a blocchi (in memoria resta solo il blocco corrente). La cartella Excel
+#   (un archivio zip) può essere composta solo al termine: viene scritta a blocchi in un file temporaneo su disco, che
+#   viene inviato solo quando è completo
+# - /metrics: misure della strumentazione (data_tools.metrics) in JSON. Richiede il token indicato dalla variabile
+#   d'ambiente SIMULAGRO_METRICS_TOKEN (intestazione "Authorization: Bearer <token>"), salvo SIMULAGRO_METRICS_PUBLIC=1
+# - POST /metrics/profile/start?mode=cprofile|sampling, POST /metrics/profile/stop: avvio e arresto della cattura del
+#   profilo (l'arresto restituisce il report testuale); POST /metrics/reset: azzera le misure. Richiedono sempre il
+#   token (senza SIMULAGRO_METRICS_TOKEN sono disattivati)
+# L'accesso non dipende dall'indirizzo del client, che dietro un proxy inverso (ad esempio davanti a gunicorn) è
+# quello del proxy per tutte le richieste
+
+# Importazione delle librerie necessarie
+import os, hmac, time, tempfile # per la configurazione, il token delle metriche, la misura delle richieste e i file temporanei
+from flask import Response, request, send_file, stream_with_context, abort, jsonify, g # per gli endpoint del server
+from data_tools import metrics # per la strumentazione delle callback
+from data_tools.data_simulator import default_farms # per la tabella delle aziende da esportare
+# Le funzioni di esportazione (data_tools.data_export, con openpyxl e reportlab) vengono importate al primo utilizzo
+
+# Numero massimo di aziende esportabili con una richiesta
+export_max_farms = 100000
+# Token degli endpoint delle metriche (None: endpoint disattivati) e lettura delle misure senza token
+metrics_token = os.environ.get('SIMULAGRO_METRICS_TOKEN') or None
+metrics_public = os.environ.get('SIMULAGRO_METRICS_PUBLIC') == '1'
+
+# Formati di esportazione: tipo MIME di ciascun formato
+export_mimetypes = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Funzione che registra gli endpoint sul server Flask dell'app Dash
+def register_routes(app):
+    server = app.server
+    register_metrics(app)
+
+    # Esportazione dei dati simulati di più aziende
+    @server.route('/export/farms.<fmt>')
+    def export_farms(fmt):
+        if fmt not in export_mimetypes:
+            abort(404)
+        from data_tools.data_export import iter_farm_chunks, split_farm_sheets, iter_csv, iter_parquet, write_excel
+        n_farms = request.args.get('farms', 1, type=int)
+        seed = request.args.get('seed', None, type=int)
+        if not 1 <= n_farms <= export_max_farms:
+            abort(400, f"farms deve essere compreso tra 1 e {export_max_farms}")
+        chunks = iter_farm_chunks(default_farms(n_farms), seed=seed)
+        filename = f'aziende.{fmt}'
+
+        # CSV e Parquet: i blocchi vengono generati ed inviati man mano
+        if fmt in ('csv', 'parquet'):
+            if fmt == 'parquet':
+                try:
+                    import pyarrow.parquet # dipendenza opzionale
+                except ImportError:
+                    abort(501, "L'esportazione in Parquet richiede pyarrow")
+            stream = iter_csv(chunks) if fmt == 'csv' else iter_parquet(chunks)
+            return Response(stream_with_context(stream), mimetype=export_mimetypes[fmt],
+                            headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+        # Excel: la cartella viene scritta a blocchi su disco ed inviata quando è completa (il file temporaneo viene
+        # eliminato alla chiusura della risposta)
+        output = tempfile.TemporaryFile()
+        write_excel(split_farm_sheets(chunks), output)
+        output.seek(0)
+        return send_file(output, mimetype=export_mimetypes[fmt], as_attachment=True, download_name=filename)
+
+# Funzione che registra la misura delle richieste delle callback e gli endpoint delle metriche
+# Per ogni richiesta di aggiornamento di Dash vengono registrati il tempo complessivo (callback più serializzazione
+# JSON della risposta) e le dimensioni della richiesta e della risposta, con il nome della funzione della callback
+def register_metrics(app):
+    server = app.server
+
+    # Nome della callback a cui è destinata una richiesta di aggiornamento (dall'elenco degli output richiesti)
+    def callback_name():
+        payload = request.get_json(silent=True) or {}
+        callback = app.callback_map.get(payload.get('output'), {}).get('callback')
+        return getattr(callback, '__name__', payload.get('output', 'sconosciuta'))
+
+    @server.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record_request(response):
+        if request.path.endswith('_dash-update-component') and 'metrics_start' in g:
+            name = callback_name()
+            metrics.record_time(f'http.{name}', time.perf_counter() - g.metrics_start)
+            metrics.record_payload(f'{name}.request', request.content_length)
+            metrics.record_payload(f'{name}.response', response.calculate_content_length())
+        return response
+
+    # Gli endpoint delle metriche richiedono il token; la sola lettura delle misure può essere resa pubblica
+    # (SIMULAGRO_METRICS_PUBLIC=1). Il confronto del token avviene in tempo costante
+    def check_access(write=False):
+        if metrics_public and not write:
+            return
+        auth = request.headers.get('Authorization', '')
+        supplied = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+        if metrics_token is None or not hmac.compare_digest(supplied.encode(), metrics_token.encode()):
+            abort(403)
+
+    @server.route('/metrics')
+    def metrics_endpoint():
+        check_access()
+        return jsonify(metrics.metrics_snapshot())
+
+    @server.route('/metrics/profile/<action>', methods=['POST'])
+    def metrics_profile(action):
+        check_access(write=True)
+        if action == 'start':
+            try:
+                metrics.start_profile(request.values.get('mode', 'cprofile'))
+            except ValueError as error:
+                abort(400, str(error))
+            return Response("Cattura del profilo avviata\n", mimetype='text/plain')
+        if action == 'stop':
+            return Response(metrics.stop_profile() or "Nessuna cattura in corso\n", mimetype='text/plain')
+        abort(404)
+
+    @server.route('/metrics/reset', methods=['POST'])
+    def metrics_reset():
+        check_access(write=True)
+        metrics.reset_metrics()
+        return Response("Misure azzerate\n", mimetype='text/plain')
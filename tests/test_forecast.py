@@ -0,0 +1,45 @@
+# test_forecast.py
+
+# Test del motore dei modelli lineari (data_tools.forecast): coefficienti e intercette di fit_linear devono coincidere
+# con quelli di LinearRegression di scikit-learn, anche per più obiettivi, per batch di problemi e con matrici non a
+# rango pieno
+
+# Importazione delle librerie necessarie
+import numpy as np
+import pytest
+from data_tools.forecast import fit_linear, predict_linear
+
+LinearRegression = pytest.importorskip('sklearn.linear_model').LinearRegression
+
+# Anni come unica variabile (come nelle previsioni della dashboard) e quattro obiettivi
+def test_fit_linear_matches_sklearn():
+    rng = np.random.default_rng(0)
+    X = np.arange(2015, 2025, dtype=float)[:, None]
+    Y = rng.normal(size=(10, 4)) + 0.5 * X
+    coef, intercept = fit_linear(X, Y)
+    model = LinearRegression().fit(X, Y)
+    np.testing.assert_allclose(coef, model.coef_.T, rtol=1e-8)
+    np.testing.assert_allclose(intercept, model.intercept_, rtol=1e-8)
+    np.testing.assert_allclose(predict_linear(coef, intercept, X), model.predict(X), rtol=1e-8)
+
+# Un solo obiettivo e una variabile duplicata (matrice non a rango pieno): soluzione di norma minima
+def test_fit_linear_rank_deficient_matches_sklearn():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(20, 2))
+    X = np.column_stack([x, x[:, 0]])
+    y = x @ [1.5, -2.0] + 3.0 + rng.normal(scale=0.1, size=20)
+    coef, intercept = fit_linear(X, y)
+    model = LinearRegression().fit(X, y)
+    np.testing.assert_allclose(coef, model.coef_, rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(intercept, model.intercept_, rtol=1e-8)
+
+# Problemi impilati (ad esempio uno per azienda): ogni problema del batch coincide con il modello stimato da solo
+def test_fit_linear_batch_matches_sklearn():
+    rng = np.random.default_rng(2)
+    X = rng.normal(size=(5, 12, 3))
+    Y = rng.normal(size=(5, 12, 2))
+    coef, intercept = fit_linear(X, Y)
+    for b in range(len(X)):
+        model = LinearRegression().fit(X[b], Y[b])
+        np.testing.assert_allclose(coef[b], model.coef_.T, rtol=1e-8, atol=1e-12)
+        np.testing.assert_allclose(intercept[b], model.intercept_, rtol=1e-8, atol=1e-12)
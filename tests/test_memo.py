@@ -0,0 +1,55 @@
+# test_memo.py
+
+# Test della cache dei risultati (data_tools.memo): un risultato letto dal disco deve essere identico a quello
+# conservato in memoria e la cartella su disco deve restare entro i limiti di età e dimensione
+
+# Importazione delle librerie necessarie
+import os, time
+import numpy as np
+import pandas as pd
+from data_tools import memo
+from data_tools.memo import memoize
+from data_tools.result_store import clean_result_dir
+
+# Un DataFrame con RangeIndex letto dal disco conserva l'indice (anche con inizio e passo diversi da quelli predefiniti)
+def test_disk_hit_keeps_range_index(tmp_path):
+    @memoize(seed_arg='seed', disk_dir=str(tmp_path))
+    def simulate(n, seed=None):
+        rng = np.random.default_rng(seed)
+        return pd.DataFrame({'x': rng.normal(size=n)}, index=pd.RangeIndex(10, 10 + 2 * n, 2, name='riga'))
+
+    computed = simulate(5, seed=1)
+    simulate.cache.clear()
+    from_disk = simulate(5, seed=1)
+    assert simulate.cache.stats['disk_hits'] == 1
+    assert isinstance(from_disk.index, pd.RangeIndex)
+    pd.testing.assert_frame_equal(from_disk, computed)
+
+# La pulizia elimina i file .npz scaduti e, oltre la dimensione massima, i meno recenti; gli altri file restano
+def test_clean_disk_cache(tmp_path):
+    now = time.time()
+    for i, age in enumerate([10, 20, 30, 10_000]):
+        path = tmp_path / f'f-{i}.npz'
+        path.write_bytes(b'x' * 1024)
+        os.utime(path, (now - age, now - age))
+    (tmp_path / 'altro.txt').write_bytes(b'x' * 4096)
+    os.utime(tmp_path / 'altro.txt', (now - 10_000, now - 10_000))
+
+    # Scade il file di 10000 secondi, poi viene eliminato il meno recente per rientrare in 2 KB
+    assert clean_result_dir(str(tmp_path), max_age=1000, max_mb=2048 / 2 ** 20, pattern='.npz') == 2
+    assert sorted(os.listdir(tmp_path)) == ['altro.txt', 'f-0.npz', 'f-1.npz']
+
+# La scrittura su disco avvia la pulizia della cartella secondo i limiti del modulo
+def test_put_cleans_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(memo, 'memo_disk_max_age', 1000)
+    old = tmp_path / 'vecchio.npz'
+    old.write_bytes(b'x')
+    os.utime(old, (time.time() - 10_000, time.time() - 10_000))
+
+    @memoize(seed_arg='seed', disk_dir=str(tmp_path))
+    def value(seed=None):
+        return np.arange(3) + seed
+
+    value(seed=1)
+    assert not old.exists()
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.npz')]) == 1
@@ -0,0 +1,38 @@
+# test_result_store.py
+
+# Test dell'archivio dei risultati (data_tools.result_store): gli stessi DataFrame, anche con colonne di testo, devono
+# essere salvati e restituiti allo stesso modo in memoria e su file (SIMULAGRO_RESULT_DIR)
+
+# Importazione delle librerie necessarie
+import numpy as np
+import pandas as pd
+import pytest
+from data_tools.result_store import put_frame, get_frame
+
+# I test vengono eseguiti con l'archivio in memoria e con l'archivio su file (in una cartella temporanea)
+@pytest.fixture(params=['memory', 'dir'])
+def backend(request, monkeypatch, tmp_path):
+    if request.param == 'dir':
+        monkeypatch.setenv('SIMULAGRO_RESULT_DIR', str(tmp_path))
+    else:
+        monkeypatch.delenv('SIMULAGRO_RESULT_DIR', raising=False)
+    return request.param
+
+# Un DataFrame con colonne di testo, numeriche e di date viene restituito con gli stessi valori
+def test_put_get_text_frame(backend):
+    df = pd.DataFrame({'farm': ['Azienda A', 'Azienda B', ''], 'Year': np.array([2022, 2023, 2024], dtype='int16'),
+                       'Gain': [1.5, -2.25, 3.0], 'date': pd.to_datetime(['2022-01-01', '2023-06-30', '2024-12-31'])})
+    key = put_frame(df)
+    result = get_frame(key)
+    assert list(result.columns) == list(df.columns)
+    assert result['farm'].tolist() == df['farm'].tolist()
+    np.testing.assert_array_equal(result['Year'].to_numpy(), df['Year'].to_numpy())
+    np.testing.assert_array_equal(result['Gain'].to_numpy(), df['Gain'].to_numpy())
+    np.testing.assert_array_equal(result['date'].to_numpy(), df['date'].to_numpy())
+    # La chiave dipende solo dal contenuto
+    assert put_frame(df) == key
+
+# Le colonne di oggetti diversi dalle stringhe vengono rifiutate con lo stesso errore in memoria e su file
+def test_put_object_frame_rejected(backend):
+    with pytest.raises(TypeError, match='oggetti non supportati'):
+        put_frame(pd.DataFrame({'a': ['x', None]}))
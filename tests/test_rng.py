@@ -0,0 +1,43 @@
+# test_rng.py
+
+# Test dei generatori espliciti (data_tools.rng): a parità di seme le simulazioni devono essere identiche, anche quando
+# il risultato viene letto dalla cache su disco, e i valori di un'azienda non devono dipendere da quante altre aziende
+# vengono simulate insieme
+
+# Importazione delle librerie necessarie
+import inspect
+import numpy as np
+import pandas as pd
+from data_tools.rng import spawn_rngs, StackedStreams
+from data_tools.data_simulator import generate_random_data, simulate_farms, default_farms
+
+# Lo stesso seme restituisce gli stessi DataFrame, sia ricalcolati sia letti dalla cache in memoria e su disco
+def test_generate_random_data_reproducible(tmp_path, monkeypatch):
+    monkeypatch.setenv('SIMULAGRO_CACHE_DIR', str(tmp_path))
+    cache = generate_random_data.cache
+    cache.clear()
+    computed = inspect.unwrap(generate_random_data)(seed=7) # senza cache
+    first = generate_random_data(seed=7)
+    assert cache.stats['disk_writes'] >= 1
+    from_memory = generate_random_data(seed=7)
+    cache.clear()
+    disk_hits = cache.stats['disk_hits']
+    from_disk = generate_random_data(seed=7)
+    assert cache.stats['disk_hits'] == disk_hits + 1
+    for frames in (first, from_memory, from_disk):
+        for expected, frame in zip(computed, frames):
+            pd.testing.assert_frame_equal(frame, expected)
+    # Semi diversi danno dati diversi
+    assert not generate_random_data(seed=8)[1].equals(computed[1])
+
+# Ogni flusso produce il proprio blocco di valori, indipendentemente dal numero di flussi
+def test_stacked_streams_blocks_independent():
+    few = StackedStreams(spawn_rngs(3, 2), 5).normal(size=10)
+    many = StackedStreams(spawn_rngs(3, 6), 5).normal(size=30)
+    np.testing.assert_array_equal(few, many[:10])
+
+# I dati delle prime aziende sono gli stessi simulandone 2 o 20
+def test_farm_data_independent_of_farm_count():
+    few = simulate_farms(default_farms(2), seed=11)
+    many = simulate_farms(default_farms(20), seed=11)
+    pd.testing.assert_frame_equal(many[many['farm_id'] < 2].reset_index(drop=True), few.reset_index(drop=True))
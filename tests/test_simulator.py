@@ -0,0 +1,18 @@
+# test_simulator.py
+
+# Test del simulatore di produzione (data_tools.data_simulator): la resa calcolata sugli array deve coincidere con
+# quella calcolata riga per riga, anche ai confini dei regimi di temperatura
+
+# Importazione delle librerie necessarie
+import numpy as np
+from data_tools.data_simulator import yield_simulate, yield_simulate_batch
+
+# Con lo stesso generatore yield_simulate_batch estrae gli stessi valori di yield_simulate chiamata per ogni riga
+def test_yield_batch_matches_scalar():
+    temps = np.array([0, 9.99, 10, 20, 30, 30.01, 45])
+    humidities = np.linspace(30, 90, len(temps))
+    precips = np.linspace(200, 800, len(temps))
+    batch = yield_simulate_batch(temps, humidities, precips, np.random.default_rng(3))
+    rng = np.random.default_rng(3)
+    scalar = [yield_simulate(t, h, p, rng) for t, h, p in zip(temps, humidities, precips)]
+    np.testing.assert_allclose(batch, scalar)
@@ -0,0 +1,47 @@
+# test_surface.py
+
+# Test della superficie di risposta degli slider ambientali (data_tools.surface): i valori letti dalla superficie
+# devono coincidere con il valore atteso della simulazione diretta, sia sui nodi della griglia sia vicino ai confini dei
+# regimi di temperatura, dove la resa media cambia a salti
+
+# Importazione delle librerie necessarie
+import numpy as np
+import pytest
+from data_tools.surface import build_surface, lookup_surface, surface_seeds
+from data_tools.data_simulator import calc_production_arrays, area_hectares, growth_average, waste_average
+
+# Numero di estrazioni della simulazione diretta con cui stimare il valore atteso in un punto
+direct_draws = 20000
+
+@pytest.fixture(scope='module')
+def surface():
+    return build_surface()
+
+# Media e deviazione standard delle colonne di produzione simulate direttamente in un punto
+def simulate_point(temperature, humidity, precipitation, seed=1):
+    n = direct_draws
+    values = np.column_stack(calc_production_arrays(np.full(n, temperature), np.full(n, humidity),
+                                                    np.full(n, precipitation), area_hectares, growth_average,
+                                                    waste_average, np.random.default_rng(seed)))
+    return values.mean(axis=0), values.std(axis=0)
+
+# Nodi della griglia, punti tra due nodi e punti a ridosso dei confini (10 °C e 30 °C) da entrambi i lati.
+# Con 300 mm di precipitazioni il consumo d'acqua resta lineare nella temperatura (nessun taglio ai limiti)
+@pytest.mark.parametrize('temperature, humidity, precipitation', [
+    (0, 60, 500), (20, 40, 300), (45, 80, 700),
+    (17.5, 62.5, 325),
+    (9.5, 60, 300), (9.99, 60, 300), (10, 60, 300), (10.01, 60, 300), (10.5, 60, 300),
+    (29.5, 60, 300), (30, 60, 300), (30.01, 60, 300), (30.5, 60, 300),
+])
+def test_lookup_matches_direct_simulation(surface, temperature, humidity, precipitation):
+    expected, spread = simulate_point(temperature, humidity, precipitation)
+    # La superficie è la media di surface_seeds estrazioni: la tolleranza è di 5 errori standard di quella media
+    tolerance = 5 * spread / np.sqrt(surface_seeds) + 1e-6 * np.abs(expected)
+    np.testing.assert_array_less(np.abs(lookup_surface(surface, temperature, humidity, precipitation) - expected),
+                                 tolerance + 1e-9)
+
+# Ai confini la resa salta al valore dell'altro regime invece di essere interpolata tra i due
+def test_lookup_keeps_regime_jumps(surface):
+    cold, optimal, hot = (lookup_surface(surface, t, 60, 500)[1] for t in (9.999, 10, 30.001))
+    assert cold < 0.5 * optimal and hot < 0.7 * optimal
+    assert lookup_surface(surface, 9.5, 60, 500)[1] < 0.5 * optimal
@@ -0,0 +1,48 @@
+# test_table_store.py
+
+# Test delle tabelle paginate lato server (data_tools.table_store): ordinamento con valori mancanti e filtri con la
+# sintassi filter_query delle DataTable
+
+# Importazione delle librerie necessarie
+import numpy as np
+import pandas as pd
+import pytest
+from data_tools.frame import ColumnFrame
+from data_tools.table_store import put_table, query_rows, parse_filter, table_page
+
+@pytest.fixture
+def table():
+    frame = ColumnFrame.from_frame(pd.DataFrame({'Year': np.arange(2020, 2026),
+                                                 'Yield': [1.5, np.nan, 2.25, 0.5, np.nan, 3.0]}))
+    return put_table(frame, 'test-table'), frame
+
+# I valori mancanti restano in fondo sia con l'ordinamento crescente sia con quello discendente
+def test_sort_keeps_nan_last(table):
+    key, frame = table
+    assert query_rows(key, frame, [{'column_id': 'Yield', 'direction': 'asc'}]).tolist() == [3, 0, 2, 5, 1, 4]
+    assert query_rows(key, frame, [{'column_id': 'Yield', 'direction': 'desc'}]).tolist() == [5, 2, 0, 3, 1, 4]
+    multi = [{'column_id': 'Yield', 'direction': 'desc'}, {'column_id': 'Year', 'direction': 'desc'}]
+    assert query_rows(key, frame, multi).tolist() == [5, 2, 0, 3, 4, 1]
+
+# Operatori nella forma testuale, valori tra virgolette e operatori senza valore
+@pytest.mark.parametrize('filter_query, rows', [
+    ('{Yield} ne 1.5', [1, 2, 3, 4, 5]),
+    ('{Yield} eq "1.5"', [0]),
+    ("{Year} > '2022' && {Yield} s> 1", [5]),
+    ('{Year} datestartswith 2021', [1]),
+    ('{Yield} is nil', [1, 4]),
+    ('{Yield} is num && {Yield} icontains "2.2"', [2]),
+])
+def test_filter_operators(table, filter_query, rows):
+    key, frame = table
+    assert query_rows(key, frame, filter_query=filter_query).tolist() == rows
+
+# I filtri non supportati sollevano ValueError con il messaggio da mostrare, invece di non selezionare righe
+@pytest.mark.parametrize('filter_query', ['{Year} < 2021 || {Year} > 2024', '{Year} is prime', '{Yield} = abc'])
+def test_unsupported_filter_rejected(table, filter_query):
+    key, frame = table
+    with pytest.raises(ValueError):
+        table_page(key, filter_query=filter_query)
+
+def test_parse_filter_unescapes_quotes():
+    assert parse_filter('{Year} = "20\\"21"') == [('Year', '=', '20"21')]